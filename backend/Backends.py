@@ -0,0 +1,237 @@
+import importlib
+import importlib.util
+
+from typing import Dict, Optional, List, Tuple
+from backend.Fingerprint import canonical_form, add_term
+
+gurobi_post_code = """
+
+# Get model status
+status = model.status
+
+obj_val = None
+# check whether the model is infeasible, has infinite solutions, or has an optimal solution
+if status == gp.GRB.INFEASIBLE:
+    obj_val = "infeasible"
+elif status == gp.GRB.INF_OR_UNBD:
+    obj_val = "infeasible or unbounded"
+elif status == gp.GRB.UNBOUNDED:
+    obj_val = "unbounded"
+elif status == gp.GRB.OPTIMAL:
+    obj_val = model.objVal
+"""
+
+pulp_post_code = """
+
+# Get model status
+status = model.status
+
+obj_val = None
+# check whether the model is infeasible, has infinite solutions, or has an optimal solution
+if status == pulp.LpStatusInfeasible:
+    obj_val = "infeasible"
+elif status == pulp.LpStatusUndefined:
+    obj_val = "infeasible or unbounded"
+elif status == pulp.LpStatusUnbounded:
+    obj_val = "unbounded"
+elif status == pulp.LpStatusOptimal:
+    obj_val = pulp.value(model.objective)
+"""
+
+
+class SolverBackend:
+    name = None
+    module = None
+    # key of the Programmer prompt templates written for this modeling API
+    prompts = None
+    prep_code = ""
+    optimize_code = ""
+    post_code = ""
+    # code that changes variables or adds new ones, which removing the
+    # constraints added by an item does not undo
+    mutation_pattern = ""
+    # code writing the built model to "{path}" for the solver portfolio,
+    # empty when the model cannot be exported faithfully
+    export_code = ""
+    # (module, class) of the model object, whose methods generated code may call
+    model_class = None
+    # code setting solve_proven after the solve, when the solver proved the
+    # model optimal, infeasible or unbounded
+    proven_code = "solve_proven = False\n"
+
+    def available(self) -> bool:
+        try:
+            importlib.import_module(self.module)
+            return True
+        except ImportError:
+            return False
+
+    def limited_optimize_code(self, time_limit: Optional[float]) -> str:
+        # optimize_code stopping the solve after time_limit seconds
+        return self.optimize_code
+
+    def mark(self, model) -> Tuple:
+        raise NotImplementedError
+
+    def rollback(self, model, mark: Tuple):
+        raise NotImplementedError
+
+    def canonical_form(self, model) -> Optional[Dict]:
+        # canonical sparse form of the built model (see Fingerprint), or None
+        # when the model uses features it does not cover
+        return None
+
+
+class GurobiBackend(SolverBackend):
+    name = "gurobipy"
+    module = "gurobipy"
+    prompts = "gurobipy"
+    prep_code = "import gurobipy as gp\n\n # Define model\nmodel = gp.Model('model')"
+    optimize_code = f"\n# Optimize model\nmodel.optimize()\n"
+    post_code = gurobi_post_code
+    mutation_pattern = r"addVars?\b|\.(vtype|VType|lb|ub|LB|UB|setAttr|remove)\b"
+    export_code = "\n# Export model\nmodel.update()\nmodel.write({path!r})\n"
+    model_class = ("gurobipy", "Model")
+    proven_code = "solve_proven = status in (gp.GRB.OPTIMAL, gp.GRB.INFEASIBLE, gp.GRB.UNBOUNDED)\n"
+
+    def limited_optimize_code(self, time_limit: Optional[float]) -> str:
+        if time_limit is None:
+            return self.optimize_code
+        return f"\n# Optimize model\nmodel.setParam('TimeLimit', {time_limit:.3f})\nmodel.optimize()\n"
+
+    def mark(self, model) -> Tuple:
+        if model is None:
+            return (0, 0, 0, 0)
+        model.update()
+        return (model.NumConstrs, model.NumQConstrs, model.NumGenConstrs, model.NumSOS)
+
+    def rollback(self, model, mark: Tuple):
+        model.update()
+        for objs, n in zip(
+            [model.getConstrs(), model.getQConstrs(), model.getGenConstrs(), model.getSOSs()],
+            mark
+        ):
+            if len(objs) > n:
+                model.remove(objs[n:])
+        model.update()
+
+    def canonical_form(self, model) -> Optional[Dict]:
+        model.update()
+        if model.NumGenConstrs or model.NumSOS or model.NumObj > 1:
+            return None
+        variables = model.getVars()
+        names = [v.VarName for v in variables]
+        if len(set(names)) < len(names):
+            return None
+
+        def split(expr) -> (float, Dict, Dict):
+            linear, quadratic = {}, {}
+            if hasattr(expr, "getLinExpr"):
+                for i in range(expr.size()):
+                    add_term(quadratic, (expr.getVar1(i).VarName, expr.getVar2(i).VarName), expr.getCoeff(i))
+                expr = expr.getLinExpr()
+            for i in range(expr.size()):
+                add_term(linear, expr.getVar(i).VarName, expr.getCoeff(i))
+            return expr.getConstant(), linear, quadratic
+
+        rows = []
+        for constr in model.getConstrs():
+            _, linear, _ = split(model.getRow(constr))
+            rows.append((linear, {}, constr.Sense, constr.RHS))
+        for constr in model.getQConstrs():
+            _, linear, quadratic = split(model.getQCRow(constr))
+            rows.append((linear, quadratic, constr.QCSense, constr.QCRHS))
+        return canonical_form(
+            sense="max" if model.ModelSense < 0 else "min",
+            objective=split(model.getObjective()),
+            rows=rows,
+            columns={v.VarName: (v.LB, v.UB, v.VType) for v in variables}
+        )
+
+
+class PulpBackend(SolverBackend):
+    module = "pulp"
+    prompts = "pulp"
+    prep_code = "import pulp\n\n# Define model\nmodel = pulp.LpProblem('model', pulp.LpMinimize)"
+    post_code = pulp_post_code
+    mutation_pattern = r"LpVariable|\.(cat|lowBound|upBound|setInitialValue|fixValue)\b"
+    model_class = ("pulp", "LpProblem")
+    # the status of a solve stopped by its time limit may still be optimal,
+    # but not the status of its solution
+    proven_code = (
+        "solve_proven = model.sol_status in "
+        "(pulp.LpSolutionOptimal, pulp.LpSolutionInfeasible, pulp.LpSolutionUnbounded)\n"
+    )
+    # no export_code: PuLP only keeps the objective sense of a maximization
+    # problem as a comment in the MPS file, which the other solvers ignore
+    # solver command of the optimize code
+    command = None
+
+    def limited_optimize_code(self, time_limit: Optional[float]) -> str:
+        if time_limit is None:
+            return self.optimize_code
+        return f"\n# Optimize model\nmodel.solve({self.command}(msg=False, timeLimit={time_limit:.3f}))\n"
+
+    def mark(self, model) -> Tuple:
+        if model is None:
+            return (0,)
+        return (len(model.constraints),)
+
+    def rollback(self, model, mark: Tuple):
+        for name in list(model.constraints)[mark[0]:]:
+            del model.constraints[name]
+
+    def canonical_form(self, model) -> Optional[Dict]:
+        import pulp
+
+        def split(expr) -> (float, Dict):
+            linear = {}
+            for v, coef in (expr.items() if expr is not None else []):
+                add_term(linear, v.name, coef)
+            return (expr.constant if expr is not None else 0.0), linear
+
+        senses = {pulp.LpConstraintLE: "<", pulp.LpConstraintGE: ">", pulp.LpConstraintEQ: "="}
+        rows = []
+        for constr in model.constraints.values():
+            constant, linear = split(constr)
+            rows.append((linear, {}, senses[constr.sense], -constant))
+        constant, linear = split(model.objective)
+        return canonical_form(
+            sense="max" if model.sense == pulp.LpMaximize else "min",
+            objective=(constant, linear, {}),
+            rows=rows,
+            columns={
+                v.name: (
+                    float("-inf") if v.lowBound is None else v.lowBound,
+                    float("inf") if v.upBound is None else v.upBound,
+                    "I" if v.cat == pulp.LpInteger else "C"
+                )
+                for v in model.variables()
+            }
+        )
+
+
+class CbcBackend(PulpBackend):
+    name = "pulp_cbc"
+    command = "pulp.PULP_CBC_CMD"
+    optimize_code = f"\n# Optimize model\nmodel.solve(pulp.PULP_CBC_CMD(msg=False))\n"
+
+
+class HighsBackend(PulpBackend):
+    # HiGHS through PuLP's highspy interface, so it shares the PuLP prompts
+    name = "highs"
+    command = "pulp.HiGHS"
+    optimize_code = f"\n# Optimize model\nmodel.solve(pulp.HiGHS(msg=False))\n"
+
+    def available(self) -> bool:
+        return super().available() and importlib.util.find_spec("highspy") is not None
+
+
+backends = {
+    backend.name: backend for backend in [GurobiBackend, CbcBackend, HighsBackend]
+}
+
+def get_backend(solver: str) -> SolverBackend:
+    if solver not in backends:
+        raise Exception(f"Solver {solver} is not supported yet!")
+    return backends[solver]()
@@ -0,0 +1,205 @@
+import re
+import ast
+import builtins
+import importlib
+
+from typing import Dict, Optional, List, Tuple
+from backend.LatexTranslator import parse_dims
+
+# Static checks of the generated code before it is executed: syntax errors,
+# undefined names, symbols indexed with more (or, for variable dicts, fewer)
+# indices than their dimensions, attributes missing from the modeling API and
+# calls generated code has no business making. Every item is checked, so all
+# of its problems are reported at once instead of one runtime error per run.
+
+# modules generated code may import
+allowed_modules = {"math", "numpy", "gurobipy", "pulp", "itertools", "json"}
+disallowed_calls = {
+    "open", "exec", "eval", "compile", "__import__", "input", "exit", "quit", "globals",
+    "locals", "vars", "setattr", "delattr", "breakpoint", "help"
+}
+builtin_names = set(dir(builtins))
+
+
+def _load(name: str):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def _arity(node) -> int:
+    return len(node.elts) if isinstance(node, ast.Tuple) else 1
+
+
+def _chain(node) -> (Optional[str], List[str]):
+    # root name and attribute path of a.b.c
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    return (node.id if isinstance(node, ast.Name) else None), attrs[::-1]
+
+
+def _bound(tree) -> set:
+    # every name the code binds, anywhere in it
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.alias):
+            names.add(node.asname or node.name.split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    return names
+
+
+def _modules(tree, modules: Dict[str, str]):
+    # aliases of the modules imported by the code
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                modules[alias.asname or alias.name.split(".")[0]] = alias.name if alias.asname else alias.name.split(".")[0]
+
+
+def _variable_shape(variable: Dict, symbols: Dict) -> Optional[Tuple[str, int]]:
+    # ("exact", n) for dicts keyed by n indices, ("max", n) for arrays that
+    # may also be indexed partially; None if the definition is not recognized
+    code = variable.get("code") or ""
+    symbol = re.escape(variable["symbol"])
+    m = re.search(rf"^\s*{symbol}\s*=\s*model\.addVars\(([^()]*(?:\([^()]*\)[^()]*)*)\)", code, re.M)
+    if m is not None:
+        args = [arg.strip() for arg in re.split(r",(?![^()]*\))", m.group(1)) if arg.strip() and "=" not in arg]
+        # only ranges are counted; a list of keys may hold tuples
+        if args and all(
+            arg.isdigit() or re.fullmatch(r"range\(.*\)", arg)
+            or (arg in symbols and symbols[arg]["kind"] == "parameter" and not symbols[arg]["dims"])
+            for arg in args
+        ):
+            return ("exact", len(args))
+        return None
+    if re.search(rf"^\s*{symbol}\s*=\s*(?:model\.addVar|pulp\.LpVariable)\(", code, re.M):
+        return ("exact", 0)
+    if re.search(rf"^\s*{symbol}\s*=\s*model\.addMVar\(", code, re.M):
+        return ("max", len(variable["dims"]))
+    return None
+
+
+def check_code(code: str, known: set, symbols: Dict, modules: Dict[str, str], model_class) -> List[str]:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [f"SyntaxError: {e.msg} (line {e.lineno}): {(e.text or '').strip()}"]
+
+    errors = []
+    local = _bound(tree)
+    _modules(tree, modules)
+    nested = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Subscript):
+            nested.add(id(node.value))
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id not in known and node.id not in local and node.id not in builtin_names:
+                errors.append(f"NameError: name '{node.id}' is not defined")
+
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+            for name in names:
+                if name.split(".")[0] not in allowed_modules:
+                    errors.append(f"ImportError: module '{name}' is not allowed in the modeling code")
+
+        elif isinstance(node, ast.Call):
+            root, attrs = _chain(node.func)
+            if root in disallowed_calls and not attrs and root not in local:
+                errors.append(f"PermissionError: {root}() is not allowed in the modeling code")
+            elif root == "model" and attrs and "model" not in local and model_class is not None \
+                    and not hasattr(model_class, attrs[0]):
+                errors.append(f"AttributeError: '{model_class.__name__}' object has no attribute '{attrs[0]}'")
+
+        elif isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Load):
+            root, attrs = _chain(node)
+            if root in modules and root not in local:
+                obj = _load(modules[root])
+                for k, attr in enumerate(attrs):
+                    if obj is None:
+                        break
+                    if not hasattr(obj, attr):
+                        errors.append(f"AttributeError: '{'.'.join([modules[root]] + attrs[:k])}' has no attribute '{attr}'")
+                        break
+                    obj = getattr(obj, attr)
+
+        elif isinstance(node, ast.Subscript) and id(node) not in nested:
+            count, value = 0, node
+            while isinstance(value, ast.Subscript):
+                count += _arity(value.slice)
+                value = value.value
+            if not isinstance(value, ast.Name) or value.id not in symbols or value.id in local:
+                continue
+            info = symbols[value.id]
+            if info["kind"] == "parameter":
+                shape = ("max", len(info["dims"])) if info["dims"] else None
+            else:
+                shape = info["shape"]
+            if shape is None:
+                continue
+            mode, n = shape
+            # the keys of a tupledict of several indices are tuples, which a
+            # single index may hold, as in x[k] for k in x.keys()
+            if count == 1 and n > 1:
+                continue
+            if count > n or (mode == "exact" and count != n):
+                errors.append(
+                    f"IndexError: {value.id} has {n} dimension(s) {info['dim']} but is indexed with {count} index(es)"
+                )
+
+    # each problem once, in the order found
+    return list(dict.fromkeys(errors))
+
+
+def check_steps(steps: List[Tuple], state: Dict, backend) -> List[Tuple[Dict, List[str]]]:
+    # steps are the (item, code, text) build steps of the Evaluator; returns
+    # the items whose code has problems, with all of them
+    symbols = {}
+    for parameter in state["parameters"]:
+        symbols[parameter["symbol"]] = dict(kind="parameter", dim=parameter.get("dim"), dims=parse_dims(parameter.get("dim")))
+    for variable in state["variables"]:
+        info = dict(kind="variable", dim=variable.get("dim"), dims=parse_dims(variable.get("dim")))
+        symbols[variable["symbol"]] = info
+        info["shape"] = _variable_shape(dict(variable, dims=info["dims"]), symbols)
+
+    model_class = None
+    if backend.model_class is not None:
+        module = _load(backend.model_class[0])
+        model_class = getattr(module, backend.model_class[1], None) if module is not None else None
+
+    known = set()
+    modules = {}
+    flagged = []
+    for item, code, _ in steps:
+        if not isinstance(item, dict):
+            # the prefix defining the model and the parameters
+            try:
+                tree = ast.parse(code)
+            except SyntaxError:
+                continue
+            known |= _bound(tree)
+            _modules(tree, modules)
+            continue
+        errors = check_code(code or "", known, symbols, modules, model_class)
+        if errors:
+            flagged.append((item, errors))
+        if item.get("symbol") in symbols:
+            # a broken definition is reported once, not at every use
+            known.add(item["symbol"])
+        try:
+            known |= _bound(ast.parse(code or ""))
+        except SyntaxError:
+            pass
+    return flagged
+
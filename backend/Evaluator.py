@@ -1,7 +1,19 @@
+import re
+import os
 import json
+import time
+import tempfile
+import textwrap
 import traceback
 
-from typing import Dict, Optional
+from typing import Dict, Optional, List, Tuple
+from backend.Sandbox import SandboxPool
+from backend.Backends import get_backend
+from backend.Portfolio import race, proven_statuses
+from backend.Fingerprint import SolveCache, get_solve_cache
+from backend.CodeCheck import check_steps
+from utils import Trace
+from utils.Budget import remaining_time
 
 prep_code = """
 import json
@@ -14,34 +26,76 @@ with open("{data_json_path}", "r") as f:
     data = json.load(f)
 """
 
+# prefix of the solve step: skip the solve when a model with the same
+# canonical form was solved before (see backend.Fingerprint)
+fingerprint_code = """
+from backend.Fingerprint import model_fingerprint as _model_fingerprint
+model_fingerprint = _model_fingerprint("{solver}", model)
+cached_solve = cached_solves.get(model_fingerprint)
+"""
 
-post_code = """
-
-# Get model status
-status = model.status
 
-obj_val = None
-# check whether the model is infeasible, has infinite solutions, or has an optimal solution
-if status == gp.GRB.INFEASIBLE:
-    obj_val = "infeasible"
-elif status == gp.GRB.INF_OR_UNBD:
-    obj_val = "infeasible or unbounded"
-elif status == gp.GRB.UNBOUNDED:
-    obj_val = "unbounded"
-elif status == gp.GRB.OPTIMAL:
-    obj_val = model.objVal
-"""
+def guard(code: str) -> str:
+    return "if cached_solve is None:\n" + textwrap.indent(code, "    ") + "\n"
 
 
 class Evaluator:
-    def __init__(self, client, solver="gurobipy", model: Optional[str] = "gpt-3.5-turbo"):
+    def __init__(
+        self,
+        client,
+        solver="gurobipy",
+        model: Optional[str] = "gpt-3.5-turbo",
+        incremental: Optional[bool] = False,
+        pool: Optional[SandboxPool] = None,
+        portfolio: Optional[List[Dict]] = None,
+        portfolio_timeout: Optional[float] = None,
+        reuse_solves: Optional[bool] = True,
+        preflight: Optional[bool] = True,
+        collect_errors: Optional[bool] = True
+    ):
         self.client = client
         self.solver = solver
+        self.backend = get_backend(solver)
         self.model = model
+        # keep the built model between runs and resume from the first
+        # changed item instead of rebuilding it from scratch
+        self.incremental = incremental
+        self.checkpoint = None
+        # run the generated code in a sandboxed worker process instead
+        self.pool = pool
+        # race these solver configurations on the built model instead of
+        # calling the solver of the generated code
+        if portfolio is not None and not self.backend.export_code:
+            raise Exception(f"Solver {solver} does not support portfolio racing!")
+        self.portfolio = portfolio
+        self.portfolio_timeout = portfolio_timeout
+        # reuse the result of an identical model solved before, from the
+        # solve cache set for this process
+        self.reuse_solves = reuse_solves
+        # check the code statically and report every broken item before
+        # running any of it
+        self.preflight = preflight
+        # run every constraint and the objective even after one of them
+        # failed, and report all failures of the run at once
+        self.collect_errors = collect_errors
 
+    @Trace.traced("Evaluator.eval")
     def eval(self, state: Dict) -> (str, Dict):
         print("Evaluator agent is called")
 
+        # problems found by the last evaluation are fixed or found again
+        for target in ["variables", "constraints", "objective"]:
+            for item in state[target]:
+                if item.get("status") == "runtime_error":
+                    item["status"] = "coded"
+                item.pop("error_message", None)
+
+        flagged = self.__preflight(state) if self.preflight else []
+        if flagged:
+            self.__failed(state, [(item, "\n".join(errors)) for item, errors in flagged])
+            print(state["error_message"])
+            return f"The code failed the pre-flight check in {len(flagged)} items!", state
+
         res = self._run(state=state)
 
         if not res["success"]:
@@ -53,9 +107,16 @@ class Evaluator:
                 data_json_path=state["data_json_path"],
             )
 
-            if not res["bogus_context"]:
+            # failures of the solve itself ("OPTIMIZATION CALL": no portfolio
+            # winner, a timeout in the sandbox) are not due to one item
+            if not isinstance(res["bogus_context"], dict):
                 return f"Bad model! Print DONE to finish the execution. Error_msg: {res['error_message']}", state
+            failures = res.get("failures") or [(res["bogus_context"], res["error_message"])]
+            if len(failures) > 1:
+                self.__failed(state, failures)
+                return f"There were errors in running {len(failures)} items of the code!", state
             res["bogus_context"]["status"] = "runtime_error"
+            res["bogus_context"]["error_message"] = res["error_message"]
 
             return (
                 f"There was an error in running the code! {res['error_message']}",
@@ -67,63 +128,154 @@ class Evaluator:
             state["solver_output_status"] = res["status"]
             state["obj_val"] = res["obj_val"]
             state["code"] = res["code"]
+            state["model_fingerprint"] = res["model_fingerprint"]
+            if res.get("portfolio"):
+                state["portfolio"] = res["portfolio"]
             return ("Evaluation Done! The problem is solved.", state)
 
+    def __failed(self, state: Dict, failures: List[Tuple[Dict, str]]):
+        # marks every failed item with its own error, for the Programmer to
+        # repair them in one round
+        state["sol_status"] = "runtime_error"
+        state["solver_output_status"] = "runtime_error"
+        state["error_message"] = "\n\n".join(
+            f"{item.get('symbol') or item.get('description')}:\n{error_message}"
+            for item, error_message in failures
+        )
+        state["prep_code"] = prep_code.format(
+            solver_prep_code=self.get_solver_prep_code(),
+            data_json_path=state["data_json_path"],
+        )
+        for item, error_message in failures:
+            item["status"] = "runtime_error"
+            item["error_message"] = error_message
+
+    def __preflight(self, state: Dict) -> List[Tuple[Dict, List[str]]]:
+        with Trace.span("Evaluator.preflight") as span:
+            try:
+                steps = self._steps(state)
+            except Exception:
+                # left for the run to report
+                return []
+            # the build steps, without the solve and its post-processing
+            flagged = check_steps(steps[:-2], state, self.backend)
+            span.attrs["flagged"] = len(flagged)
+        return flagged
+
+    def _steps(self, state: Dict, export_path: Optional[str] = None) -> List[Tuple]:
+        # (bogus context, executed code, text appended to the full code)
+        prep = prep_code.format(
+            solver_prep_code=self.get_solver_prep_code(),
+            data_json_path=state["data_json_path"],
+        )
+        for parameter in state["parameters"]:
+            prep += parameter["code"] + "\n"
+        steps = [(None, prep, prep)]
+
+        for variable in state["variables"]:
+            steps.append((variable, variable["code"], variable["code"] + "\n"))
+        for constraint in state["constraints"]:
+            steps.append((constraint, constraint["code"], "\n" + constraint["code"] + "\n"))
+        steps.append((state["objective"][0], state["objective"][0]["code"], "\n" + state["objective"][0]["code"] + "\n"))
+
+        optimize_code = self.backend.optimize_code
+        # the solve may not outlast the deadline of the problem's budget
+        solve_code = self.backend.limited_optimize_code(remaining_time())
+        if export_path is not None:
+            # the model is only exported here and raced afterwards
+            solve_code = self.backend.export_code.format(path=export_path)
+        post_code = self.backend.post_code
+        if self.__solve_cache() is not None:
+            solve_code = fingerprint_code.format(solver=self.solver) + guard(solve_code)
+            post_code = (
+                guard(post_code + self.backend.proven_code) +
+                "else:\n    status, obj_val = cached_solve\n"
+            )
+        steps.append(("OPTIMIZATION CALL", solve_code, optimize_code + "\n"))
+        steps.append((None, post_code, self.backend.post_code + "\n"))
+        return steps
+
     def _run(self, state: Dict):
-        local_env = {}
+        if self.pool is not None:
+            return self._run_sandboxed(state)
+
         code = ""
         last_line = ""
         bogus_context = None
 
         try:
-            last_line = prep_code.format(
-                solver_prep_code=self.get_solver_prep_code(),
-                data_json_path=state["data_json_path"],
-            )
-            for parameter in state["parameters"]:
-                last_line += parameter["code"] + "\n"
-            code += last_line
-
-            exec(
-                last_line,
-                local_env,
-                local_env,
-            )
+            with tempfile.TemporaryDirectory() as tmp:
+                export_path = os.path.join(tmp, "model.mps") if self.portfolio is not None else None
+                steps = self._steps(state, export_path)
+                n_build = len(steps) - 2
+                n_fixed = 1 + len(state["variables"])
+                local_env, start = self.__resume(steps, n_build, n_fixed)
+                if start > 0:
+                    print(f"Resuming model building from step {start}/{n_build}")
+                if self.__solve_cache() is not None:
+                    local_env["cached_solves"] = self.__solve_cache().view(self.solver)
+                tolerant = self.__tolerant(n_build, n_fixed)
+                failures = []
+
+                with Trace.span("Evaluator.exec", steps=n_build - start):
+                    for i, (context, line, text) in enumerate(steps[:n_build]):
+                        bogus_context = context
+                        last_line = line
+                        code += text
+                        if i < start:
+                            continue
+
+                        if self.incremental and not failures:
+                            self.checkpoint["marks"].append(self.backend.mark(local_env.get("model")))
+                            self.checkpoint["failed"] = line
+                        elif self.incremental:
+                            # the checkpoint ends at the first failure, so
+                            # what ran after it is undone on resume
+                            self.checkpoint["failed"] += "\n" + line
+                        try:
+                            exec(last_line, local_env, local_env)
+                        except Exception:
+                            if i not in tolerant:
+                                raise
+                            failures.append((context, traceback.format_exc()))
+                            continue
+                        if self.incremental and not failures:
+                            self.checkpoint["codes"].append(line)
+                            self.checkpoint["failed"] = None
+
+                if failures:
+                    print("RUNTIME ERROR")
+                    print(code)
+                    return {
+                        "success": False,
+                        "error_line": failures[0][0]["code"],
+                        "code": code,
+                        "obj_val": None,
+                        "status": None,
+                        "error_message": failures[0][1],
+                        "bogus_context": failures[0][0],
+                        "failures": failures
+                    }
 
-            for variable in state["variables"]:
-                bogus_context = variable
-                last_line = variable["code"]
-                code += last_line + "\n"
-                exec(last_line, local_env, local_env)
-
-            for constraint in state["constraints"]:
-                bogus_context = constraint
-                last_line = constraint["code"]
-                code += "\n" + last_line + "\n"
-                exec(last_line, local_env, local_env)
-
-            bogus_context = state["objective"][0]
-            last_line = state["objective"][0]["code"]
-            code += "\n" + last_line + "\n"
-            exec(last_line, local_env, local_env)
-
-            bogus_context = "OPTIMIZATION CALL"
-            last_line = f"\n# Optimize model\nmodel.optimize()\n"
-            code += last_line + "\n"
-            exec(last_line, local_env, local_env)
-
-            bogus_context = None
-            last_line = post_code
-            code += last_line + "\n"
-            exec(last_line, local_env, local_env)
+                with Trace.span("Evaluator.optimize"):
+                    for context, line, text in steps[n_build:]:
+                        bogus_context = context
+                        last_line = line
+                        code += text
+                        exec(last_line, local_env, local_env)
+
+                    bogus_context = "OPTIMIZATION CALL"
+                    outputs = self.__solved(local_env, export_path)
 
             return {
                 "success": True,
                 "error_line": None,
                 "code": code,
-                "obj_val": local_env["obj_val"],
-                "status": local_env["status"],
-                "error_message": None
+                "obj_val": outputs["obj_val"],
+                "status": outputs["status"],
+                "error_message": None,
+                "portfolio": outputs["portfolio"],
+                "model_fingerprint": outputs["model_fingerprint"]
             }
 
         except Exception as e:
@@ -141,8 +293,157 @@ class Evaluator:
                 "bogus_context": bogus_context
             }
 
-    def get_solver_prep_code(self):
-        if self.solver == "gurobipy":
-            return "import gurobipy as gp\n\n # Define model\nmodel = gp.Model('model')"
+    def _run_sandboxed(self, state: Dict):
+        with tempfile.TemporaryDirectory() as tmp:
+            # with a portfolio the worker only builds and exports the model
+            export_path = os.path.join(tmp, "model.mps") if self.portfolio is not None else None
+            try:
+                steps = self._steps(state, export_path)
+            except Exception:
+                return {
+                    "success": False,
+                    "error_line": "",
+                    "code": "",
+                    "obj_val": None,
+                    "status": None,
+                    "error_message": traceback.format_exc(),
+                    "bogus_context": None
+                }
+
+            cache = self.__solve_cache()
+            # the solve may not outlast the deadline of the problem's budget
+            timeout = remaining_time()
+            if timeout is not None and self.pool.timeout is not None:
+                timeout = min(timeout, self.pool.timeout)
+            res = self.pool.run(
+                [line for _, line, _ in steps],
+                outputs=["obj_val", "status", "model_fingerprint", "cached_solve", "solve_proven"],
+                timeout=timeout,
+                env=dict(cached_solves=cache.view(self.solver)) if cache is not None else None,
+                tolerant=sorted(self.__tolerant(len(steps) - 2, 1 + len(state["variables"])))
+            )
+            print(res["stdout"])
+            # the steps ran in the worker, so their spans are timed there
+            n_build = len(steps) - 2
+            Trace.add_span("Evaluator.exec", sum(res["step_times"][:n_build]), steps=n_build, sandboxed=True)
+            solve_time = sum(res["step_times"][n_build:])
+            if res["success"]:
+                start = time.time()
+                try:
+                    outputs = self.__solved(res["outputs"], export_path)
+                except Exception:
+                    res["success"] = False
+                    res["failed_step"] = n_build
+                    res["error_message"] = traceback.format_exc()
+                solve_time += time.time() - start
+            if len(res["step_times"]) > n_build:
+                Trace.add_span("Evaluator.optimize", solve_time, sandboxed=True)
+
+        if res["success"]:
+            return {
+                "success": True,
+                "error_line": None,
+                "code": "".join(text for _, _, text in steps),
+                "obj_val": outputs["obj_val"],
+                "status": outputs["status"],
+                "error_message": None,
+                "portfolio": outputs["portfolio"],
+                "model_fingerprint": outputs["model_fingerprint"]
+            }
+
+        failed = res["failed_step"]
+        if failed is None:
+            failed = 0
+        errors = res.get("errors") or []
+        last = errors[-1]["step"] if errors else failed
+        code = "".join(text for _, _, text in steps[:last + 1])
+        print("RUNTIME ERROR")
+        print(code)
+        return {
+            "success": False,
+            "error_line": steps[failed][1],
+            "code": code,
+            "obj_val": None,
+            "status": None,
+            "error_message": res["error_message"],
+            "bogus_context": steps[failed][0],
+            "failures": [(steps[error["step"]][0], error["error_message"]) for error in errors]
+        }
+
+    def __tolerant(self, n_build: int, n_fixed: int) -> set:
+        # the constraint and objective steps, which only depend on the
+        # parameters and variables and can fail independently
+        return set(range(n_fixed, n_build)) if self.collect_errors else set()
+
+    def __solve_cache(self) -> Optional[SolveCache]:
+        return get_solve_cache() if self.reuse_solves else None
+
+    def __solved(self, outputs: Dict, export_path: Optional[str]) -> Dict:
+        # Result of the solve step: reused from an identical model solved
+        # before, raced by the portfolio, or computed by the generated code.
+        status, obj_val = outputs.get("status"), outputs.get("obj_val")
+        fingerprint = outputs.get("model_fingerprint")
+        proven = outputs.get("solve_proven")
+        portfolio = None
+        cache = self.__solve_cache()
+        if outputs.get("cached_solve") is not None:
+            cache.hit(self.solver, fingerprint)
+            print(f"Model {fingerprint[:12]} was solved before, reusing its result")
         else:
-            raise Exception(f"Solver {self.solver} is not supported yet!")
+            if export_path is not None:
+                portfolio = self.__race(export_path)
+                status, obj_val = portfolio["status"], portfolio["obj_val"]
+                proven = status in proven_statuses
+            # results of solves stopped early (time limit, deadline) are not
+            # final, so only proven ones are reused
+            if cache is not None and proven:
+                cache.put(self.solver, fingerprint, status, obj_val)
+        return dict(status=status, obj_val=obj_val, portfolio=portfolio, model_fingerprint=fingerprint)
+
+    def __race(self, path: str) -> Dict:
+        timeout = remaining_time()
+        if self.portfolio_timeout is not None:
+            timeout = self.portfolio_timeout if timeout is None else min(timeout, self.portfolio_timeout)
+        res = race(path, self.portfolio, timeout=timeout)
+        winner = res["winner"]
+        if winner is None:
+            errors = [result["error_message"] for result in res["results"] if result["error_message"]]
+            raise RuntimeError("Solver portfolio failed.\n" + "\n".join(errors))
+        print(f"Solver portfolio: {winner['name']} finished first in {res['wall_time']:.2f}s")
+        return dict(
+            winner=winner["name"],
+            status=winner["status"],
+            obj_val=winner["obj_val"],
+            wall_time=res["wall_time"],
+            runtimes={result["name"]: result["runtime"] for result in res["results"]}
+        )
+
+    def __resume(self, steps: List[Tuple], n_build: int, n_fixed: int) -> (Dict, int):
+        # Resume from the first build step whose code differs from the
+        # checkpoint, after removing the model objects added from there on.
+        # Parameter/variable changes and items that touch variables cannot be
+        # rolled back by removing constraints and trigger a full rebuild.
+        checkpoint = self.checkpoint
+        self.checkpoint = dict(env={}, codes=[], marks=[], failed=None)
+        if not self.incremental or checkpoint is None:
+            return self.checkpoint["env"], 0
+
+        k = 0
+        while k < len(checkpoint["codes"]) and k < n_build and checkpoint["codes"][k] == steps[k][1]:
+            k += 1
+        removed = checkpoint["codes"][k:] + [checkpoint["failed"] or ""]
+        if k < n_fixed or any(re.search(self.backend.mutation_pattern, line) for line in removed):
+            return self.checkpoint["env"], 0
+
+        if k < len(checkpoint["marks"]):
+            self.backend.rollback(checkpoint["env"]["model"], checkpoint["marks"][k])
+        self.checkpoint = dict(
+            env=checkpoint["env"],
+            codes=checkpoint["codes"][:k],
+            marks=checkpoint["marks"][:k],
+            failed=None
+        )
+        return self.checkpoint["env"], k
+
+    def get_solver_prep_code(self):
+        return self.backend.prep_code
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from typing import Dict, Optional, List, Tuple
+
+# bounds at or beyond this magnitude are treated as infinite
+infinity = 1e30
+
+
+def _number(value) -> float:
+    value = float(value)
+    if value >= infinity:
+        return float("inf")
+    if value <= -infinity:
+        return float("-inf")
+    # tolerate round-off from computing the same coefficient differently
+    return float("%.12g" % value) + 0.0
+
+
+def _terms(terms: Dict) -> List:
+    return sorted((key, _number(coef)) for key, coef in terms.items() if coef != 0)
+
+
+def _row(linear: Dict, quadratic: Dict, sense: str, rhs: float) -> List:
+    # ">=" rows are negated into "<=" rows, and equality rows are signed so
+    # that their first coefficient is positive
+    linear, quadratic, rhs = _terms(linear), _terms(quadratic), _number(rhs)
+    first = (quadratic or linear or [(None, 1.0)])[0][1]
+    if sense == ">" or (sense == "=" and first < 0):
+        linear = [(key, -coef) for key, coef in linear]
+        quadratic = [(key, -coef) for key, coef in quadratic]
+        rhs = -rhs + 0.0
+        sense = "<" if sense == ">" else sense
+    return [linear, quadratic, sense, rhs]
+
+
+def canonical_form(
+    sense: str,
+    objective: Tuple[float, Dict, Dict],
+    rows: List[Tuple[Dict, Dict, str, float]],
+    columns: Dict[str, Tuple[float, float, str]]
+) -> Dict:
+    # Builds the canonical sparse form of a model from its variables keyed by
+    # name: objective (c0, c, Q), constraint rows (A, Q, sense, b) sorted by
+    # content, and per-column bounds and types sorted by name. Quadratic
+    # terms are keyed by the sorted pair of variable names.
+    constant, linear, quadratic = objective
+    normalized = {}
+    for name, (lb, ub, vtype) in columns.items():
+        if vtype == "B":
+            vtype, lb, ub = "I", max(lb, 0), min(ub, 1)
+        normalized[name] = [_number(lb), _number(ub), vtype]
+    return dict(
+        sense=sense,
+        c0=_number(constant),
+        c=_terms(linear),
+        Q=_terms(quadratic),
+        rows=sorted(
+            (_row(*row) for row in rows),
+            key=lambda row: json.dumps(row)
+        ),
+        columns=sorted([name] + column for name, column in normalized.items())
+    )
+
+
+def add_term(terms: Dict, key, coef: float):
+    if isinstance(key, tuple):
+        key = "*".join(sorted(key))
+    terms[key] = terms.get(key, 0.0) + coef
+
+
+def fingerprint(form: Optional[Dict]) -> Optional[str]:
+    if form is None:
+        return None
+    content = json.dumps(form, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def equivalent(a: Optional[Dict], b: Optional[Dict]) -> bool:
+    # Two models are equivalent (without solving them) when their canonical
+    # forms agree; models without a canonical form are never equivalent.
+    return a is not None and b is not None and fingerprint(a) == fingerprint(b)
+
+
+def model_fingerprint(solver: str, model) -> Optional[str]:
+    from backend.Backends import get_backend
+
+    try:
+        return fingerprint(get_backend(solver).canonical_form(model))
+    except Exception:
+        return None
+
+
+class CachedSolves:
+    # Read-only view of the solves of one solver in a SolveCache, passed to
+    # the generated code (also in a sandbox worker) to look up its model.
+    def __init__(self, path: str, solver: str):
+        self.path = path
+        self.solver = solver
+
+    def get(self, key: Optional[str]) -> Optional[Tuple]:
+        if key is None:
+            return None
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            row = conn.execute(
+                "SELECT status, obj_val FROM solves WHERE solver = ? AND key = ?", (self.solver, key)
+            ).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else (row[0], json.loads(row[1]))
+
+
+class SolveCache:
+    # Proven results (optimal, infeasible or unbounded) of the models solved
+    # so far, keyed by solver and fingerprint, shared by every process
+    # through an SQLite database.
+    def __init__(self, path: str, max_entries: Optional[int] = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.stats = dict(hits=0, misses=0, writes=0)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS solves ("
+                "solver TEXT, key TEXT, status INTEGER, obj_val TEXT, accessed REAL, "
+                "PRIMARY KEY (solver, key))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS solves_accessed ON solves (accessed)")
+            self.conn.commit()
+
+    def view(self, solver: str) -> CachedSolves:
+        return CachedSolves(self.path, solver)
+
+    def hit(self, solver: str, key: str):
+        with self.lock:
+            self.stats["hits"] += 1
+            self.conn.execute(
+                "UPDATE solves SET accessed = ? WHERE solver = ? AND key = ?", (time.time(), solver, key)
+            )
+            self.conn.commit()
+
+    def put(self, solver: str, key: Optional[str], status, obj_val):
+        with self.lock:
+            self.stats["misses"] += 1
+            if key is None:
+                return
+            self.conn.execute(
+                "INSERT INTO solves VALUES (?, ?, ?, ?, ?) ON CONFLICT (solver, key) DO UPDATE SET "
+                "status = excluded.status, obj_val = excluded.obj_val, accessed = excluded.accessed",
+                (solver, key, status, json.dumps(obj_val), time.time())
+            )
+            self.stats["writes"] += 1
+            # the size is checked every 100 writes rather than on each put
+            if self.max_entries is not None and self.stats["writes"] % 100 == 0:
+                # least recently used entries go first
+                self.conn.execute(
+                    "DELETE FROM solves WHERE rowid IN (SELECT rowid FROM solves ORDER BY accessed DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# the solve cache of this process, set by the runners next to the response
+# cache; without one no model is fingerprinted
+solve_cache = None
+
+
+def set_solve_cache(cache: Optional[SolveCache]):
+    global solve_cache
+    solve_cache = cache
+
+
+def get_solve_cache() -> Optional[SolveCache]:
+    return solve_cache
@@ -0,0 +1,500 @@
+import re
+import keyword
+
+from typing import Dict, Optional, List, Tuple
+
+# Translates the LaTeX formulations of constraints and objective into
+# gurobipy code without a model call, for the patterns most formulations
+# follow: linear or quadratic expressions over the known parameters and
+# variables, sums, fractions, a \forall quantifier and integrality. A
+# formulation outside of that subset, or one whose symbols do not match their
+# dimensions, is not translated and goes to the model as before.
+
+relations = {"<=": "<=", ">=": ">=", "=": "==", "==": "=="}
+flipped = {"<=": ">=", ">=": "<=", "==": "=="}
+# commands written without their backslash are recognized as well, as
+# formulations saved before backslashes were preserved have lost them
+commands = {
+    "sum", "frac", "dfrac", "tfrac", "cdot", "times", "leq", "le", "geq", "ge",
+    "forall", "in", "mathbb", "ldots", "cdots", "dots", "max", "min"
+}
+directions = {
+    "max": "gp.GRB.MAXIMIZE", "maximize": "gp.GRB.MAXIMIZE", "maximise": "gp.GRB.MAXIMIZE",
+    "min": "gp.GRB.MINIMIZE", "minimize": "gp.GRB.MINIMIZE", "minimise": "gp.GRB.MINIMIZE"
+}
+vtypes = {"Z": "gp.GRB.INTEGER", "N": "gp.GRB.INTEGER", "R": "gp.GRB.CONTINUOUS"}
+# names the generated code relies on, which loop indices must not shadow
+reserved = {"gp", "np", "math", "json", "data", "model", "range"}
+
+
+class Untranslatable(Exception):
+    pass
+
+
+def _normalize(text: str) -> str:
+    # JSON escapes that swallowed the backslash of a command (\t of \times, ...)
+    for char, letter in [("\t", "t"), ("\x0c", "f"), ("\x08", "b"), ("\r", "r")]:
+        text = re.sub(re.escape(char) + r"(?=[A-Za-z])", "\\\\" + letter, text)
+    text = text.replace("\\_", "_").replace("−", "-").replace("≤", "<=").replace("≥", ">=")
+    text = re.sub(r"\\(?:text|textrm|textbf|mathrm|mathit|operatorname)\s*\{([^{}]*)\}", r" \1 ", text)
+    text = re.sub(r"\\(?:quad|qquad|displaystyle|left|right|limits|nolimits)(?![A-Za-z])|\\[,;:! ]", " ", text)
+    text = re.sub(r"\\[()\[\]]|\$", " ", text)
+    text = re.sub(r"\bfor\s+(?:all|each|every)\b", r" \\forall ", text, flags=re.I)
+    return text.strip().rstrip(".,; ")
+
+
+def parse_dims(dim) -> List[str]:
+    items = dim if isinstance(dim, list) else str(dim or "").strip().strip("[]()").split(",")
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def _shape(symbol: str, code: str) -> Optional[List[str]]:
+    # the index ranges a variable is keyed by, read off its definition code
+    m = re.search(rf"^\s*{re.escape(symbol)}\s*=\s*model\.addVar(s?)\(([^()]*)\)", code or "", re.M)
+    if m is None:
+        return None
+    if not m.group(1):
+        return []
+    shape = [arg.strip() for arg in m.group(2).split(",") if arg.strip() and "=" not in arg]
+    return shape if shape and all(re.fullmatch(r"\w+", arg) for arg in shape) else None
+
+
+def _tokenize(text: str, symbols: Dict) -> List[Tuple[str, str]]:
+    names = sorted(symbols, key=len, reverse=True)
+    tokens = []
+    i = 0
+    while i < len(text):
+        rest = text[i:]
+        if text[i].isspace():
+            i += 1
+            continue
+
+        m = re.match(r"\\([A-Za-z]+|[{}])", rest)
+        if text[i] == "\\" and m is None:
+            raise Untranslatable(rest[:2])
+        if m is not None:
+            name = m.group(1)
+            if name in "{}":
+                tokens.append(("op", "\\" + name))
+            elif name in commands:
+                tokens.append(("cmd", name))
+            else:
+                raise Untranslatable(f"\\{name}")
+            i += len(m.group(0))
+            continue
+
+        symbol = next((
+            name for name in names
+            if rest.startswith(name) and not re.match(r"[A-Za-z0-9]", rest[len(name):len(name) + 1])
+        ), None)
+        if symbol is not None:
+            tokens.append(("sym", symbol))
+            i += len(symbol)
+            continue
+
+        m = re.match(r"[A-Za-z][A-Za-z0-9]*|\d+(?:\.\d+)?|\.\d+|\.\.\.|…|<=|>=|==|[-+*/^_{}()\[\],=<>:]", rest)
+        if m is None:
+            raise Untranslatable(rest[:1])
+        value = m.group(0)
+        if value[0].isalpha():
+            tokens.append(("cmd", value) if value in commands else ("word", value))
+        elif value[0].isdigit() or value[0] == "." and value != "...":
+            tokens.append(("num", value))
+        else:
+            tokens.append(("op", "..." if value == "…" else value))
+        i += len(value)
+
+    # operators spelled as commands
+    aliases = {"cdot": "*", "times": "*", "leq": "<=", "le": "<=", "geq": ">=", "ge": ">=",
+               "ldots": "...", "cdots": "...", "dots": "..."}
+    return [("op", aliases[value]) if kind == "cmd" and value in aliases else (kind, value) for kind, value in tokens]
+
+
+def _split(tokens: List, separator: Tuple[str, str] = ("op", ",")) -> List[List]:
+    # split at the separators outside of brackets
+    parts, depth = [[]], 0
+    for token in tokens:
+        if token[0] == "op" and token[1] in ["(", "[", "{", "\\{"]:
+            depth += 1
+        elif token[0] == "op" and token[1] in [")", "]", "}", "\\}"]:
+            depth -= 1
+        if depth == 0 and token == separator:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return parts
+
+
+def _render(tokens: List) -> str:
+    return "".join(value for kind, value in tokens)
+
+
+def _wrap(code: str, prec: int, need: int) -> str:
+    return f"({code})" if prec < need else code
+
+
+class _Parser:
+    # Recursive descent over the tokens of one clause, building the code of
+    # an expression as (code, degree in the variables, precedence).
+    def __init__(self, translator: "LatexTranslator", tokens: List, bound: Dict):
+        self.translator = translator
+        self.tokens = tokens
+        self.pos = 0
+        # bound index -> dimensions it indexes
+        self.bound = bound
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise Untranslatable("unexpected end")
+        self.pos += 1
+        return token
+
+    def expect(self, token: Tuple[str, str]):
+        if self.next() != token:
+            raise Untranslatable(f"expected {token[1]}")
+
+    def done(self) -> bool:
+        return self.pos == len(self.tokens)
+
+    def group(self) -> List:
+        # the tokens of a {...} group, or a single token
+        if self.peek() != ("op", "{"):
+            return [self.next()]
+        self.next()
+        start, depth = self.pos, 1
+        while depth:
+            kind, value = self.next()
+            if kind == "op" and value == "{":
+                depth += 1
+            elif kind == "op" and value == "}":
+                depth -= 1
+        return self.tokens[start:self.pos - 1]
+
+    def starts_atom(self, token: Optional[Tuple[str, str]]) -> bool:
+        return token is not None and (
+            token[0] in ["num", "sym"]
+            or token in [("op", "("), ("op", "["), ("op", "{"), ("cmd", "sum"), ("cmd", "frac"), ("cmd", "dfrac"), ("cmd", "tfrac")]
+        )
+
+    def expr(self) -> Tuple[str, int, int]:
+        sign = self.next()[1] if self.peek() in [("op", "+"), ("op", "-")] else ""
+        code, degree, prec = self.term()
+        parts = [("-" if sign == "-" else "") + code]
+        while self.peek() in [("op", "+"), ("op", "-")]:
+            op = self.next()[1]
+            term, term_degree, _ = self.term()
+            parts.append(f"{op} {term}")
+            degree = max(degree, term_degree)
+        return " ".join(parts), degree, prec if len(parts) == 1 and not sign else 0
+
+    def term(self) -> Tuple[str, int, int]:
+        code, degree, prec = self.factor()
+        while True:
+            token = self.peek()
+            if token in [("op", "*"), ("op", "/")]:
+                op = self.next()[1]
+            elif self.starts_atom(token):
+                op = "*"
+            else:
+                return code, degree, prec
+            factor, factor_degree, factor_prec = self.factor()
+            if op == "/" and factor_degree:
+                raise Untranslatable("division by a variable")
+            code = f"{_wrap(code, prec, 1)} {op} {_wrap(factor, factor_prec, 2 if op == '/' else 1)}"
+            degree, prec = degree + (factor_degree if op == "*" else 0), 1
+            if degree > 2:
+                raise Untranslatable("not quadratic")
+
+    def factor(self) -> Tuple[str, int, int]:
+        code, degree, prec = self.atom()
+        if self.peek() != ("op", "^"):
+            return code, degree, prec
+        self.next()
+        exponent = self.group()
+        if len(exponent) != 1 or exponent[0][0] != "num":
+            raise Untranslatable("exponent")
+        value = exponent[0][1]
+        if degree and (not value.isdigit() or degree * int(value) > 2):
+            raise Untranslatable("not quadratic")
+        return f"{_wrap(code, prec, 2)} ** {value}", degree * int(value) if degree else 0, 2
+
+    def atom(self) -> Tuple[str, int, int]:
+        kind, value = self.next()
+        if kind == "num":
+            return value, 0, 2
+        if kind == "sym":
+            return self.reference(value)
+        if (kind, value) in [("op", "("), ("op", "["), ("op", "{")]:
+            code, degree, _ = self.expr()
+            self.expect(("op", {"(": ")", "[": "]", "{": "}"}[value]))
+            return f"({code})", degree, 2
+        if kind == "cmd" and value in ["frac", "dfrac", "tfrac"]:
+            self.expect(("op", "{"))
+            numerator, degree, prec = self.expr()
+            self.expect(("op", "}"))
+            self.expect(("op", "{"))
+            denominator, denominator_degree, denominator_prec = self.expr()
+            self.expect(("op", "}"))
+            if denominator_degree:
+                raise Untranslatable("division by a variable")
+            return f"{_wrap(numerator, prec, 1)} / {_wrap(denominator, denominator_prec, 2)}", degree, 1
+        if kind == "cmd" and value == "sum":
+            return self.sum()
+        raise Untranslatable(value)
+
+    def reference(self, symbol: str, whole: bool = False) -> Tuple[str, int, int]:
+        info = self.translator.symbols[symbol]
+        if info["kind"] == "variable" and not info["defined"]:
+            raise Untranslatable(f"definition of {symbol}")
+        dims = info["dims"]
+        indices = []
+        if self.peek() == ("op", "_"):
+            self.next()
+            subscript = self.group()
+            parts = _split(subscript)
+            if len(parts) == 1 and len(parts[0]) == 1 and parts[0][0][0] == "word" \
+                    and len(dims) > 1 and len(parts[0][0][1]) == len(dims):
+                # x_{ij}
+                parts = [[("word", letter)] for letter in parts[0][0][1]]
+            for part in parts:
+                if len(part) != 1 or part[0][0] != "word" or part[0][1] not in self.bound:
+                    raise Untranslatable(f"index {_render(part)} of {symbol}")
+                indices.append(part[0][1])
+        if not indices and dims and whole:
+            return symbol, int(info["kind"] == "variable"), 2
+        if len(indices) != len(dims):
+            raise Untranslatable(f"{symbol} has {len(dims)} dimensions")
+        for index, dim in zip(indices, dims):
+            self.bound[index].append(dim)
+        code = f"{symbol}[{', '.join(indices)}]" if indices else symbol
+        return code, int(info["kind"] == "variable"), 2
+
+    def sum(self) -> Tuple[str, int, int]:
+        lower, upper = None, None
+        for _ in range(2):
+            if self.peek() == ("op", "_") and lower is None:
+                self.next()
+                lower = self.group()
+            elif self.peek() == ("op", "^") and upper is None:
+                self.next()
+                upper = self.group()
+        if lower is None:
+            raise Untranslatable("sum without index")
+
+        indices = []
+        for part in _split(lower):
+            if not part or part[0][0] != "word":
+                raise Untranslatable("sum index")
+            name, rest = part[0][1], part[1:]
+            if rest and rest[0] == ("op", "="):
+                if upper is None or len(_split(lower)) > 1:
+                    raise Untranslatable("sum bounds")
+                indices.append((name, ("bounds", rest[1:], upper)))
+            elif rest and rest[0] == ("cmd", "in"):
+                indices.append((name, ("set", rest[1:])))
+            elif not rest:
+                indices.append((name, None))
+            else:
+                raise Untranslatable("sum index")
+        if upper is not None and not any(spec and spec[0] == "bounds" for _, spec in indices):
+            raise Untranslatable("sum bounds")
+
+        for name, _ in indices:
+            self.translator.bind(self.bound, name)
+        code, degree, _ = self.term()
+        ranges = [self.translator.resolve(self.bound, name, spec) for name, spec in indices]
+        for name, _ in indices:
+            del self.bound[name]
+        loops = " ".join(f"for {name} in range({rng})" for (name, _), rng in zip(indices, ranges))
+        return f"gp.quicksum({code} {loops})", degree, 2
+
+
+class LatexTranslator:
+    def __init__(self, parameters: List[Dict], variables: List[Dict]):
+        self.symbols = {}
+        for parameter in parameters:
+            self.symbols[parameter["symbol"]] = dict(kind="parameter", dims=parse_dims(parameter.get("dim")))
+        for variable in variables:
+            dims = parse_dims(variable.get("dim"))
+            self.symbols[variable["symbol"]] = dict(
+                kind="variable",
+                dims=dims,
+                # the generated code indexes variables by their dimensions,
+                # which only works if they were defined that way
+                defined=_shape(variable["symbol"], variable.get("code")) == dims
+            )
+
+    def translate(self, target: str, item: Dict) -> Optional[str]:
+        # the gurobipy code of a constraint or objective, or None if its
+        # formulation is outside of the supported subset
+        try:
+            tokens = _tokenize(_normalize(item.get("formulation") or ""), self.symbols)
+            if not tokens:
+                return None
+            if target == "objective":
+                lines = [self.__objective(tokens, item.get("description") or "")]
+            else:
+                lines = self.__constraint(tokens)
+        except (Untranslatable, KeyError, ValueError, IndexError):
+            return None
+
+        description = " ".join(str(item.get("description") or "").split())
+        return "\n".join(([f"# {description}"] if description else []) + lines)
+
+    def bind(self, bound: Dict, name: str):
+        if not name.isidentifier() or keyword.iskeyword(name) or name in reserved \
+                or name in self.symbols or name in bound:
+            raise Untranslatable(f"index {name}")
+        bound[name] = []
+
+    def range_bound(self, dim: str) -> str:
+        # loop bounds are integer literals or scalar parameters
+        info = self.symbols.get(dim)
+        if dim.isdigit() or (info is not None and info["kind"] == "parameter" and not info["dims"]):
+            return dim
+        raise Untranslatable(f"range {dim}")
+
+    def resolve(self, bound: Dict, name: str, spec: Optional[Tuple]) -> str:
+        # the range of an index, from explicit bounds or else from the
+        # dimensions it indexes (which have to agree)
+        if spec is not None and spec[0] == "bounds":
+            lower, upper = _render(spec[1]), _render(spec[2])
+            if lower == "1":
+                return self.range_bound(upper)
+            if lower == "0" and upper.endswith("-1"):
+                return self.range_bound(upper[:-2])
+            raise Untranslatable(f"bounds of {name}")
+        dims = set(bound[name])
+        if len(dims) != 1:
+            raise Untranslatable(f"range of {name}")
+        dim = self.range_bound(dims.pop())
+        if spec is not None and _render(spec[1]) not in [
+            dim, f"[{dim}]", f"\\{{1,...,{dim}\\}}", f"\\{{1,2,...,{dim}\\}}", f"\\{{0,...,{dim}-1\\}}",
+            f"{{1,...,{dim}}}", f"{{1,2,...,{dim}}}", f"{{0,...,{dim}-1}}"
+        ]:
+            # a subset of the range
+            raise Untranslatable(f"set of {name}")
+        return dim
+
+    def __objective(self, tokens: List, description: str) -> str:
+        direction = None
+        if tokens[0][0] in ["cmd", "word"] and tokens[0][1].lower() in directions:
+            direction = directions[tokens[0][1].lower()]
+            tokens = tokens[1:]
+            if tokens and tokens[0] == ("op", ":"):
+                tokens = tokens[1:]
+        else:
+            words = set(re.findall(r"maximi[sz]|minimi[sz]", description.lower()))
+            if len(words) != 1:
+                raise Untranslatable("objective direction")
+            direction = directions[words.pop() + "e"]
+
+        parts = _split(tokens, ("op", "="))
+        if len(parts) == 2 and all(kind == "word" or value in ["_", "{", "}"] for kind, value in parts[0]):
+            # Z = ...
+            tokens = parts[1]
+        parser = _Parser(self, tokens, {})
+        code, degree, _ = parser.expr()
+        if not parser.done() or not degree:
+            raise Untranslatable("objective")
+        return f"model.setObjective({code}, {direction})"
+
+    def __constraint(self, tokens: List) -> List[str]:
+        quantifiers = [i for i, token in enumerate(tokens) if token == ("cmd", "forall")]
+        declaration = []
+        if len(quantifiers) > 1:
+            raise Untranslatable("several quantifiers")
+        if quantifiers and quantifiers[0] == 0:
+            # \forall i: ...
+            parts = _split(tokens[1:], ("op", ":"))
+            if len(parts) != 2:
+                raise Untranslatable("quantifier")
+            declaration, tokens = parts
+        elif quantifiers:
+            tokens, declaration = tokens[:quantifiers[0]], tokens[quantifiers[0] + 1:]
+            while tokens and tokens[-1] == ("op", ","):
+                tokens = tokens[:-1]
+
+        bound = {}
+        indices = []
+        for part in _split(declaration) if quantifiers else []:
+            if not part or part[0][0] != "word" or (len(part) > 1 and part[1] != ("cmd", "in")):
+                raise Untranslatable("quantifier")
+            self.bind(bound, part[0][1])
+            indices.append((part[0][1], ("set", part[2:]) if len(part) > 1 else None))
+
+        body = []
+        pending = []
+        for clause in _split(tokens):
+            if ("cmd", "in") in clause:
+                body += self.__integrality(clause, pending, bound)
+                pending = []
+            elif len(clause) and clause[0][0] == "sym" and not any(
+                kind == "op" and value in relations or value in ["<", ">"] for kind, value in clause
+            ):
+                # x, y \in ...
+                pending.append(clause)
+            else:
+                body += self.__relation(clause, bound)
+        if pending or not body:
+            raise Untranslatable("clause")
+
+        ranges = [self.resolve(bound, name, spec) for name, spec in indices]
+        lines = []
+        for depth, ((name, _), rng) in enumerate(zip(indices, ranges)):
+            lines.append("    " * depth + f"for {name} in range({rng}):")
+        return lines + ["    " * len(indices) + line for line in body]
+
+    def __relation(self, clause: List, bound: Dict) -> List[str]:
+        parser = _Parser(self, clause, bound)
+        sides = [parser.expr()]
+        ops = []
+        while not parser.done():
+            kind, value = parser.next()
+            if kind != "op" or value not in relations:
+                raise Untranslatable(value)
+            ops.append(relations[value])
+            sides.append(parser.expr())
+        if not ops:
+            raise Untranslatable("no relation")
+
+        lines = []
+        for (left, left_degree, _), op, (right, right_degree, _) in zip(sides, ops, sides[1:]):
+            if not left_degree and not right_degree:
+                raise Untranslatable("constant constraint")
+            if not left_degree:
+                # variables first, so numpy does not evaluate the comparison
+                left, op, right = right, flipped[op], left
+            lines.append(f"model.addConstr({left} {op} {right})")
+        return lines
+
+    def __integrality(self, clause: List, pending: List, bound: Dict) -> List[str]:
+        at = clause.index(("cmd", "in"))
+        kind = _render(clause[at + 1:])
+        m = re.fullmatch(r"mathbb\{([ZNR])\}(?:\^\{?\+\}?|_\{?(?:\+|>=0|0)\}?|\^\{?>=0\}?)?", kind)
+        if m is not None:
+            vtype = vtypes[m.group(1)]
+        elif kind in ["\\{0,1\\}", "{0,1}"]:
+            vtype = "gp.GRB.BINARY"
+        else:
+            raise Untranslatable(kind)
+
+        lines = []
+        for reference in pending + [clause[:at]]:
+            if not reference or reference[0][0] != "sym" or self.symbols[reference[0][1]]["kind"] != "variable":
+                raise Untranslatable("integrality of a parameter")
+            parser = _Parser(self, reference, bound)
+            code, _, _ = parser.reference(parser.next()[1], whole=True)
+            if not parser.done():
+                raise Untranslatable("integrality")
+            if code == reference[0][1] and self.symbols[code]["dims"]:
+                if "v" in self.symbols or "v" in bound:
+                    raise Untranslatable("loop variable")
+                lines += [f"for v in {code}.values():", f"    v.vtype = {vtype}"]
+            else:
+                lines.append(f"{code}.vtype = {vtype}")
+        return lines
@@ -0,0 +1,153 @@
+import os
+import time
+import queue
+import traceback
+import multiprocessing
+
+from typing import Dict, Optional, List
+
+# Gurobi status codes, used as the common status of every configuration
+OPTIMAL, INFEASIBLE, INF_OR_UNBD, UNBOUNDED = 2, 3, 4, 5
+# statuses that settle the problem, so the race can stop on them
+proven_statuses = [OPTIMAL, INFEASIBLE, UNBOUNDED]
+
+default_portfolio = [
+    dict(name="gurobi_default", solver="gurobipy", params={}),
+    dict(name="gurobi_feasibility", solver="gurobipy", params=dict(MIPFocus=1)),
+    dict(name="gurobi_bound", solver="gurobipy", params=dict(MIPFocus=3)),
+    dict(name="highs", solver="highs", params={}),
+]
+
+
+def obj_val_of(status: int, objective: Optional[float]):
+    if status == INFEASIBLE:
+        return "infeasible"
+    elif status == INF_OR_UNBD:
+        return "infeasible or unbounded"
+    elif status == UNBOUNDED:
+        return "unbounded"
+    elif status == OPTIMAL:
+        return objective
+    return None
+
+
+def _solve_gurobi(path: str, params: Dict) -> (int, Optional[float]):
+    import gurobipy as gp
+
+    env = gp.Env(empty=True)
+    env.setParam("OutputFlag", 0)
+    env.start()
+    model = gp.read(path, env=env)
+    for key, value in params.items():
+        model.setParam(key, value)
+    model.optimize()
+    status = model.status
+    objective = model.objVal if status == gp.GRB.OPTIMAL else None
+    model.dispose()
+    env.dispose()
+    return status, objective
+
+
+def _solve_highs(path: str, params: Dict) -> (int, Optional[float]):
+    import highspy
+
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    for key, value in params.items():
+        h.setOptionValue(key, value)
+    h.readModel(path)
+    h.run()
+    status = {
+        highspy.HighsModelStatus.kOptimal: OPTIMAL,
+        highspy.HighsModelStatus.kInfeasible: INFEASIBLE,
+        highspy.HighsModelStatus.kUnboundedOrInfeasible: INF_OR_UNBD,
+        highspy.HighsModelStatus.kUnbounded: UNBOUNDED,
+    }.get(h.getModelStatus(), None)
+    objective = h.getInfo().objective_function_value if status == OPTIMAL else None
+    return status, objective
+
+
+solvers = {
+    "gurobipy": _solve_gurobi,
+    "highs": _solve_highs,
+}
+
+
+def _run_config(path: str, config: Dict, results):
+    start = time.time()
+    try:
+        status, objective = solvers[config["solver"]](path, config.get("params", {}))
+        results.put(dict(
+            name=config["name"],
+            status=status,
+            obj_val=obj_val_of(status, objective),
+            runtime=time.time() - start,
+            error_message=None
+        ))
+    except Exception:
+        results.put(dict(
+            name=config["name"],
+            status=None,
+            obj_val=None,
+            runtime=time.time() - start,
+            error_message=traceback.format_exc()
+        ))
+
+
+def available(config: Dict) -> bool:
+    try:
+        __import__("gurobipy" if config["solver"] == "gurobipy" else "highspy")
+        return True
+    except ImportError:
+        return False
+
+
+def race(path: str, configs: Optional[List[Dict]] = None, timeout: Optional[float] = None) -> Dict:
+    # Solves the model file with every configuration in its own process and
+    # returns the first proven result, terminating the configurations still
+    # running. Without a proven result the first finished one is returned.
+    configs = [config for config in (configs or default_portfolio) if available(config)]
+    threads = max(1, (os.cpu_count() or 1) // max(1, len(configs)))
+    # forked from a clean fork server (started once, with the solver modules
+    # preloaded) so neither parent threads nor start-up imports are paid per race
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["backend.Portfolio", "gurobipy", "highspy"])
+    results = ctx.Queue()
+    processes = []
+    start = time.time()
+    for config in configs:
+        if config["solver"] == "gurobipy":
+            config = dict(config, params=dict(dict(Threads=threads), **config.get("params", {})))
+        process = ctx.Process(target=_run_config, args=(path, config, results), daemon=True)
+        process.start()
+        processes.append(process)
+
+    finished = []
+    winner = None
+    try:
+        while len(finished) < len(processes):
+            remaining = None if timeout is None else start + timeout - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                result = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            finished.append(result)
+            if result["status"] in proven_statuses:
+                winner = result
+                break
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+    if winner is None:
+        winner = next((result for result in finished if result["status"] is not None), None)
+    return dict(
+        winner=winner,
+        results=finished,
+        wall_time=time.time() - start
+    )
@@ -1,7 +1,12 @@
 import json
 
-from typing import Dict, Optional
-from utils.ModelCall import model_call
+from typing import Dict, Optional, List
+from utils.ModelCall import model_call, parallel_map
+from utils.JsonOutput import json_parser
+from utils import Trace
+from utils.Budget import BudgetExceeded
+from backend.Backends import get_backend
+from backend.LatexTranslator import LatexTranslator
 
 variable_definition_prompt_templates = [
 """
@@ -53,7 +58,7 @@ Here's an example:
 
 {{
     "description": "in month m, it is possible to store up to storageSize_{{m}} tons of each raw oil for use later.",
-    "formulation": "\(storage_{{i,m}} \leq storageSize, \quad \\forall i, m\)"
+    "formulation": "\\(storage_{{i,m}} \\leq storageSize, \\quad \\forall i, m\\)"
 }}
 
 ***output***:
@@ -89,7 +94,7 @@ Here's an example:
 
 {{
     "description": "Maximize the total profit from selling goods",
-    "formulation": "Maximize \(Z = \sum_{{k=1}}^{{K}} \sum_{{i=1}}^{{I}} (profit_k \cdot x_{{k,i}} - storeCost \cdot s_{{k,i}})\)"
+    "formulation": "Maximize \\(Z = \\sum_{{k=1}}^{{K}} \\sum_{{i=1}}^{{I}} (profit_k \\cdot x_{{k,i}} - storeCost \\cdot s_{{k,i}})\\)"
 }}
 
 
@@ -135,8 +140,7 @@ When running the code, a runtime error happened. Please come up with the reason
 ```
 
 - There is probably no variable definition code need to be fixed, and in that case, output "definition" list could be empty.
-- When defining variables, use model.addVar instead of model.addVars if the variable is a scalar.
-- Variables should become before parameters when defining inequality constraints in gurobipy (because of the gurobi parsing order syntax)
+{solver_notes}
 
 Here is the initial part of the code (importing package and defining model):
 
@@ -177,14 +181,312 @@ and here is the error message:
 Take a deep breath and solve the problem step by step.
 """
 
+batched_debugging_template = """
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to debug the code for the problem.
+
+When running the code, runtime errors happened in several parts of it. Please come up with the reason of the runtime errors according to the feedback or messages of the errors, and then fix the code and generate the new code with the following format:
+
+```json
+{{
+    "reason": "A explanation for the occurrence of the runtime errors based on the system traceback information",
+    "definition": [
+        {{
+            "symbol": "The symbol of a problematic variable (definition code should be revised)",
+            "code": "A string representing the fixed code for the variable definition"
+        }},
+        ...
+    ],
+    "fixes": {{
+        "The key of a failed part": "A string representing the fixed code to be replaced with the code of that part",
+        ...
+    }}
+}}
+```
+
+- There is probably no variable definition code need to be fixed, and in that case, output "definition" list could be empty.
+- Generate a fix for every failed part, keyed by its given key.
+{solver_notes}
+
+Here is the initial part of the code (importing package and defining model):
+
+-----
+{prep_code}
+-----
+
+Here are the descriptions and dimension information of parameters and variables:
+
+-----
+{definition_info}
+-----
+
+Here is the definition of paramters and variables:
+
+-----
+{definition_code}
+-----
+
+Here are the failed parts of the code keyed by their names, each with the context information of what it attempts to model, its code and the error message:
+
+-----
+{failures}
+-----
+
+Take a deep breath and solve the problem step by step.
+"""
+
+
+batched_prompt_templates = [
+"""
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to write Python code for defining constraints and objective of the problem.
+""", """
+- Assume the parameters and variables are defined, and gurobipy is imported as gp. Generate a code for each of the given items.
+- If a constraint requires changing a variable's integralilty, generate the code for changing the variable's integrality rather than defining the variable again.
+- Variables should become before parameters when defining inequality constraints in gurobipy (because of the gurobi parsing order syntax).
+- If there is no code needed for an item, just generate the comment line (using # ) explaining why.
+
+Here's an example:
+
+**input**:
+
+{{
+    "constraints_0": {{
+        "description": "in month m, it is possible to store up to storageSize_{{m}} tons of each raw oil for use later.",
+        "formulation": "\\(storage_{{i,m}} \\leq storageSize, \\quad \\forall i, m\\)"
+    }},
+    "objective_1": {{
+        "description": "Maximize the total profit from selling goods",
+        "formulation": "Maximize \\(Z = \\sum_{{k=1}}^{{K}} \\sum_{{i=1}}^{{I}} (profit_k \\cdot x_{{k,i}} - storeCost \\cdot s_{{k,i}})\\)"
+    }}
+}}
+
+***output***:
+
+```json
+{{
+    "constraints_0": "# Add storage capacity constraints\\nfor i in range(I):\\n    for m in range(M):\\n        model.addConstr(storage[i, m] <= storageSize[m], name=\\"storage_capacity\\")",
+    "objective_1": "# Set objective\\nmodel.setObjective(gp.quicksum(profit[k] * x[k, i] - storeCost * s[k, i] for k in range(K) for i in range(I)), gp.GRB.MAXIMIZE)"
+}}
+```
+
+Previously you have generated code for defining relevant parameters and variables in the optimization problem. Please refer to the following code when generating the code for this part to make the overall code snippets consistent:
+
+{definition_code}
+
+Here are the constraints and objective we need you to write the code for, keyed by their names:
+
+-----
+{context}
+-----
+
+Take a deep breath and generate a JSON object that maps every given key to its code.
+"""]
+
+
+pulp_variable_definition_prompt_templates = [
+"""
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to write Python code for defining variables of the problem.
+""", """
+Assume the parameters are defined, PuLP is imported as pulp and the problem is stored in model. Generate a code accordingly. Only generate the code, and don't generate any other text. Here's an example:
+
+**input**:
+
+{{
+    "symbol": "buy",
+    "description": "Quantity of oil i bought in month m",
+    "dim": ["I","M"]
+}}
+
+***output***:
+
+```
+buy = pulp.LpVariable.dicts("buy", [(i, m) for i in range(I) for m in range(M)], lowBound=0, cat="Continuous")
+```
+
+- Use pulp.LpVariable instead of pulp.LpVariable.dicts if the variable is a scalar.
+- Index tensors with tuples (e.g., buy[i, m]) and give variables a lower bound of 0 unless they can be negative.
+
+Here's a variable that you are expected to write the code:
+
+-----
+{variable}
+-----
+
+Take a deep breath and generate the code accordingly.
+""",
+]
+
+pulp_main_prompt_templates = {
+    "constraints": [
+"""
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to write Python code for defining constraints of the problem.
+""", """
+- Assume the parameters and variables are defined, PuLP is imported as pulp and the problem is stored in model. Generate a code accordingly, and don't generate any other text.
+- If the constraint requires changing a variable's integralilty, generate the code for changing the variable's category (e.g., var.cat = "Integer") rather than defining the variable again.
+- Add constraints with model += ..., and do not give them names (constraint names must be unique in PuLP).
+- If there is no code needed, just generate the comment line (using # ) explaining why.
+
+Here's an example:
+
+
+**input**:
+
+
+{{
+    "description": "in month m, it is possible to store up to storageSize_{{m}} tons of each raw oil for use later.",
+    "formulation": "\\(storage_{{i,m}} \\leq storageSize, \\quad \\forall i, m\\)"
+}}
+
+***output***:
+
+```
+# Add storage capacity constraints
+for i in range(I):
+    for m in range(M):
+        model += storage[i, m] <= storageSize[m]
+```
+
+Previously you have generated code for defining relevant parameters and variables in the optimization problem. Please refer to the following code when generating the code for this part to make the overall code snippets consistent:
+
+{definition_code}
+
+Here's a constraint we need you to write the code for:
+
+-----
+{context}
+-----
+
+Take a deep breath and generate the code accordingly.
+"""],
+    "objective": [
+"""
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to write Python code for defining objective of the problem.
+""", """
+- Assume the parameters and variables are defined, PuLP is imported as pulp and the problem is stored in model. Generate a code accordingly, and don't generate any other text.
+- Set the optimization direction with model.sense (pulp.LpMaximize or pulp.LpMinimize) and the objective with model.setObjective.
+
+Here's an example:
+
+**input**:
+
+{{
+    "description": "Maximize the total profit from selling goods",
+    "formulation": "Maximize \\(Z = \\sum_{{k=1}}^{{K}} \\sum_{{i=1}}^{{I}} (profit_k \\cdot x_{{k,i}} - storeCost \\cdot s_{{k,i}})\\)"
+}}
+
+
+***output***:
+
+```
+# Set objective
+model.sense = pulp.LpMaximize
+model.setObjective(pulp.lpSum(profit[k] * x[k, i] - storeCost * s[k, i] for k in range(K) for i in range(I)))
+```
+
+Previously you have generated code for defining relevant parameters and variables in the optimization problem. Please refer to the following code when generating the code for this part to make the overall code snippets consistent:
+
+{definition_code}
+
+Here's the objective function that you are supposed to write the code for:
+
+-----
+{context}
+-----
+
+Take a deep breath and generate the code accordingly.
+""",
+    ],
+}
+
+pulp_batched_prompt_templates = [
+"""
+You're an expert programmer who are familiar with optimization problem modeling. Your responsibility is to write Python code for defining constraints and objective of the problem.
+""", """
+- Assume the parameters and variables are defined, PuLP is imported as pulp and the problem is stored in model. Generate a code for each of the given items.
+- If a constraint requires changing a variable's integralilty, generate the code for changing the variable's category (e.g., var.cat = "Integer") rather than defining the variable again.
+- Add constraints with model += ..., and do not give them names (constraint names must be unique in PuLP).
+- Set the optimization direction with model.sense (pulp.LpMaximize or pulp.LpMinimize) and the objective with model.setObjective.
+- If there is no code needed for an item, just generate the comment line (using # ) explaining why.
+
+Here's an example:
+
+**input**:
+
+{{
+    "constraints_0": {{
+        "description": "in month m, it is possible to store up to storageSize_{{m}} tons of each raw oil for use later.",
+        "formulation": "\\(storage_{{i,m}} \\leq storageSize, \\quad \\forall i, m\\)"
+    }},
+    "objective_1": {{
+        "description": "Maximize the total profit from selling goods",
+        "formulation": "Maximize \\(Z = \\sum_{{k=1}}^{{K}} \\sum_{{i=1}}^{{I}} (profit_k \\cdot x_{{k,i}} - storeCost \\cdot s_{{k,i}})\\)"
+    }}
+}}
+
+***output***:
+
+```json
+{{
+    "constraints_0": "# Add storage capacity constraints\\nfor i in range(I):\\n    for m in range(M):\\n        model += storage[i, m] <= storageSize[m]",
+    "objective_1": "# Set objective\\nmodel.sense = pulp.LpMaximize\\nmodel.setObjective(pulp.lpSum(profit[k] * x[k, i] - storeCost * s[k, i] for k in range(K) for i in range(I)))"
+}}
+```
+
+Previously you have generated code for defining relevant parameters and variables in the optimization problem. Please refer to the following code when generating the code for this part to make the overall code snippets consistent:
+
+{definition_code}
+
+Here are the constraints and objective we need you to write the code for, keyed by their names:
+
+-----
+{context}
+-----
+
+Take a deep breath and generate a JSON object that maps every given key to its code.
+"""]
+
+# prompts per modeling API of the solver backend
+prompt_templates = {
+    "gurobipy": dict(
+        variable=variable_definition_prompt_templates,
+        main=main_prompt_templates,
+        batched=batched_prompt_templates,
+        debugging_notes="""- When defining variables, use model.addVar instead of model.addVars if the variable is a scalar.
+- Variables should become before parameters when defining inequality constraints in gurobipy (because of the gurobi parsing order syntax)"""
+    ),
+    "pulp": dict(
+        variable=pulp_variable_definition_prompt_templates,
+        main=pulp_main_prompt_templates,
+        batched=pulp_batched_prompt_templates,
+        debugging_notes="""- When defining variables, use pulp.LpVariable instead of pulp.LpVariable.dicts if the variable is a scalar.
+- Add constraints with model += ..., and do not give them names (constraint names must be unique in PuLP)."""
+    ),
+}
+
 
 class Programmer:
     def __init__(
-        self, client, solver="gurobipy", model: Optional[str] = "gpt-3.5-turbo"
+        self,
+        client,
+        solver="gurobipy",
+        model: Optional[str] = "gpt-3.5-turbo",
+        coding_mode: Optional[str] = "sequential",
+        max_concurrency: Optional[int] = 4,
+        translate_latex: Optional[bool] = True
     ):
         self.client=client
         self.solver = solver
+        self.backend = get_backend(solver)
+        self.templates = prompt_templates[self.backend.prompts]
         self.model = model
+        # "sequential", "parallel" (concurrent per-item calls) or "batched"
+        # (one call for all constraints/objective, per-item fallback)
+        if coding_mode not in ["sequential", "parallel", "batched"]:
+            raise Exception(f"Coding mode {coding_mode} is not supported!")
+        self.coding_mode = coding_mode
+        self.max_concurrency = max_concurrency
+        # code standard formulations locally and only send the rest to the
+        # model; the translator writes gurobipy code
+        self.translate_latex = translate_latex and self.backend.prompts == "gurobipy"
 
     def program(self, state: Dict) -> (str, Dict):
         print("Programmer agent is called")
@@ -192,21 +494,21 @@ class Programmer:
 
         if state["sol_status"] == "runtime_error":
             # debugging
-            bogus_item = None
-            for target in ["constraints", "objective", "variables"]:
-                for item in state[target]:
-                    if item["status"] == "runtime_error":
-                        bogus_item = item
-                        break
-                if bogus_item is not None:
-                    break
-
-            if not bogus_item:
+            bogus_items = [
+                (target, item)
+                for target in ["constraints", "objective", "variables"]
+                for item in state[target] if item["status"] == "runtime_error"
+            ]
+
+            if not bogus_items:
                 raise Exception(
                     "No runtime error in state!"
                 )
 
-            return self._debugging(state=state, target=target, bogus_item=bogus_item)
+            if len(bogus_items) == 1:
+                target, bogus_item = bogus_items[0]
+                return self._debugging(state=state, target=target, bogus_item=bogus_item)
+            return self._debugging_all(state=state, bogus_items=bogus_items)
 
         elif state["sol_status"] is None:
             # coding
@@ -217,62 +519,164 @@ class Programmer:
                 f"Invalid solver_output_status {state['solver_output_status']}!"
             )
 
+    @Trace.traced("Programmer.debugging")
     def _debugging(self, state: Dict, target:str, bogus_item: Dict) -> (str, Dict):
+        try:
+            fix = self.__debug(state, target, bogus_item)
+
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Debugging failed.") from e
+
+        self.__apply_fix(state, bogus_item, fix)
+        return "The code is fixed! Try evaluating it again.", state
+
+    @Trace.traced("Programmer.debugging")
+    def _debugging_all(self, state: Dict, bogus_items: List) -> (str, Dict):
+        # every item that failed in the last evaluation is repaired in this
+        # round, with one call for all of them ("batched") or one call per
+        # item made concurrently; items whose repair fails stay broken
+        print(f"Debugging {len(bogus_items)} items")
+        if self.coding_mode == "batched":
+            try:
+                fixes = self.__debug_batch(state, bogus_items)
+
+            except BudgetExceeded:
+                raise
+
+            except Exception as e:
+                raise RuntimeError("Debugging failed.") from e
+
+        else:
+            def __try_debug(pair) -> Optional[Dict]:
+                try:
+                    return self.__debug(state, *pair)
+                except BudgetExceeded:
+                    raise
+                except Exception as e:
+                    print(e)
+                    return None
+
+            limit = 1 if self.coding_mode == "sequential" else self.max_concurrency
+            fixes = parallel_map(__try_debug, bogus_items, limit=limit)
+
+        fixed = 0
+        for (target, item), fix in zip(bogus_items, fixes):
+            if fix is not None:
+                self.__apply_fix(state, item, fix)
+                fixed += 1
+        if not fixed:
+            raise RuntimeError("Debugging failed.")
+        return f"{fixed}/{len(bogus_items)} items of the code are fixed! Try evaluating it again.", state
+
+    def __debug(self, state: Dict, target: str, bogus_item: Dict) -> Dict:
         error_line = None
         prep_code = state["prep_code"]
 
         error_line = bogus_item["code"]
-        error_message = state["error_message"]
+        # failed items carry their own error when several failed at once
+        error_message = bogus_item.get("error_message") or state["error_message"]
 
         prompt = debugging_template.format(
             target=target,
+            solver_notes=self.templates["debugging_notes"],
             prep_code=prep_code,
             definition_info=json.dumps(self.__get_param_var_def_info(state=state), indent=4),
             definition_code=self.__get_param_var_def_code(state=state),
             error_line=error_line,
             error_message=error_message,
-            target_context=json.dumps(
-                {
-                    "symbol": bogus_item["symbol"],
-                    "description": bogus_item["description"],
-                    "dim": bogus_item["dim"]
-                } if target == "variables" else
+            target_context=json.dumps(self.__context(target, bogus_item), indent=4)
+        )
+        def __fix(response: Dict) -> Dict:
+            # a fix missing any of the fields applied below is re-prompted
+            return dict(
+                definition={item["symbol"]: item["code"] for item in response["definition"]},
+                code=response[target]
+            )
+
+        return model_call(
+            client=self.client,
+            prompt=prompt,
+            model=self.model,
+            seed=3,
+            parse=json_parser(expect=dict, validate=__fix),
+            json_mode=True
+        )
+
+    def __debug_batch(self, state: Dict, bogus_items: List) -> List[Optional[Dict]]:
+        # one call for all failed items; items missing from the returned fixes
+        # stay None
+        keys = [f"{target}_{i}" for i, (target, item) in enumerate(bogus_items)]
+        prompt = batched_debugging_template.format(
+            solver_notes=self.templates["debugging_notes"],
+            prep_code=state["prep_code"],
+            definition_info=json.dumps(self.__get_param_var_def_info(state=state), indent=4),
+            definition_code=self.__get_param_var_def_code(state=state),
+            failures=json.dumps(
                 {
-                    "description": bogus_item["description"],
-                    "formulation": bogus_item["formulation"]
+                    key: {
+                        "context": self.__context(target, item),
+                        "code": item["code"],
+                        "error_message": item.get("error_message") or state["error_message"]
+                    }
+                    for key, (target, item) in zip(keys, bogus_items)
                 },
                 indent=4
             )
         )
-        cnt = 3
-        while cnt > 0:
-            try:
-                response = model_call(
-                    client=self.client,
-                    prompt=prompt,
-                    model=self.model
-                )
+        def __fixes(response: Dict) -> Dict:
+            # a response without the fields applied below is re-prompted
+            fixes = response["fixes"]
+            assert isinstance(fixes, dict)
+            return dict(
+                definition={item["symbol"]: item["code"] for item in response["definition"]},
+                codes={key: code for key, code in fixes.items() if isinstance(code, str) and code.strip()}
+            )
 
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = json.loads(response.replace("```", ""))
-                
-                for item in response["definition"]:
-                    for var in state["variables"]:
-                        if var["symbol"] == item["symbol"]:
-                            var["code"] = item["code"]
-                
-                bogus_item["status"] = "coded"
-                bogus_item["code"] = response[target]
-                return "The code is fixed! Try evaluating it again.", state
-            
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Debugging failed.")
+        response = model_call(
+            client=self.client,
+            prompt=prompt,
+            model=self.model,
+            seed=3,
+            parse=json_parser(expect=dict, validate=__fixes),
+            json_mode=True
+        )
+        print(f"Batch fixed {sum(key in response['codes'] for key in keys)}/{len(keys)} items")
+        # the definition fixes are applied once, with the first item fixed
+        fixes = []
+        definition = response["definition"]
+        for key in keys:
+            if key not in response["codes"]:
+                fixes.append(None)
+                continue
+            fixes.append(dict(definition=definition, code=response["codes"][key]))
+            definition = {}
+        return fixes
+
+    def __apply_fix(self, state: Dict, bogus_item: Dict, fix: Dict):
+        for var in state["variables"]:
+            if var["symbol"] in fix["definition"]:
+                var["code"] = fix["definition"][var["symbol"]]
+
+        bogus_item["status"] = "coded"
+        bogus_item.pop("error_message", None)
+        bogus_item["code"] = fix["code"]
+
+    def __context(self, target: str, item: Dict) -> Dict:
+        if target == "variables":
+            return {
+                "symbol": item["symbol"],
+                "description": item["description"],
+                "dim": item["dim"]
+            }
+        return {
+            "description": item["description"],
+            "formulation": item["formulation"]
+        }
             
+    @Trace.traced("Programmer.coding")
     def _coding(self, state: Dict) -> (str, Dict):
         for parameter in state["parameters"]:
             name = parameter["symbol"]
@@ -284,66 +688,160 @@ class Programmer:
                 parameter["code"] = f"{name} = np.array(data[\"{parameter['symbol']}\"])"
             parameter["status"] = "coded"
         
-        for variable in state["variables"]:
-            print(f"Programming variable {variable['symbol']}")
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": variable_definition_prompt_templates[0]
-                },
-                {
-                    "role": "user",
-                    "content": variable_definition_prompt_templates[1].format(
-                        variable=json.dumps(variable, indent=4),
-                    ),
-                },
-            ]
-            response = model_call(
-                client=self.client,
-                prompt=messages,
-                model=self.model
-            )
-
-            code = response.replace("```python", "").replace("```", "").strip()
-            print(code)
+        # every variable and every constraint/objective item only depends on
+        # the shared definition code, so the calls can run concurrently
+        limit = 1 if self.coding_mode == "sequential" else self.max_concurrency
 
+        codes = parallel_map(self.__code_variable, state["variables"], limit=limit)
+        for variable, code in zip(state["variables"], codes):
             variable["code"] = code
             variable["status"] = "coded"
             
         param_var_def_code = self.__get_param_var_def_code(state=state)
 
-        for target in ["constraints", "objective"]:
-            for item in state[target]:
-                print(f"Programming {target}")
-
-                messages = [
-                    {
-                        "role": "system",
-                        "content": main_prompt_templates[target][0]
-                    },
-                    {
-                        "role": "user",
-                        "content": main_prompt_templates[target][1].format(
-                            context=json.dumps(item, indent=4),
-                            definition_code=param_var_def_code
-                        ),
-                    },
-                ]
-                response = model_call(
-                    client=self.client,
-                    prompt=messages,
-                    model=self.model
-                )
+        items = [(target, item) for target in ["constraints", "objective"] for item in state[target]]
+        codes = [None] * len(items)
+        if self.translate_latex:
+            codes = self.__translate(state, items)
 
-                code = response.replace("```python", "").replace("```", "").strip()
-                print(code)
+        if self.coding_mode == "batched":
+            todo = [i for i, code in enumerate(codes) if code is None]
+            for i, code in zip(todo, self.__code_batch([items[i] for i in todo], param_var_def_code)):
+                codes[i] = code
+
+        fallback = [i for i, code in enumerate(codes) if code is None]
+        for i, code in zip(fallback, parallel_map(
+            lambda i: self.__code_item(*items[i], param_var_def_code),
+            fallback,
+            limit=limit
+        )):
+            codes[i] = code
 
-                item["code"] = code
-                item["status"] = "coded"
+        for (target, item), code in zip(items, codes):
+            item["code"] = code
+            item["status"] = "coded"
 
         return "Coding Done! Now we can evaluate the code!", state
 
+    def __translate(self, state: Dict, items: List) -> List[Optional[str]]:
+        # items outside of the supported LaTeX subset stay None
+        with Trace.span("Programmer.translate", items=len(items)) as span:
+            translator = LatexTranslator(state["parameters"], state["variables"])
+            codes = [translator.translate(target, item) for target, item in items]
+            span.attrs["translated"] = sum(code is not None for code in codes)
+        for code in codes:
+            if code is not None:
+                print(code)
+        print(f"Translated {span.attrs['translated']}/{len(items)} constraints and objective locally")
+        return codes
+
+    def __code_variable(self, variable: Dict) -> str:
+        print(f"Programming variable {variable['symbol']}")
+
+        messages = [
+            {
+                "role": "system",
+                "content": self.templates["variable"][0]
+            },
+            {
+                "role": "user",
+                "content": self.templates["variable"][1].format(
+                    variable=json.dumps(variable, indent=4),
+                ),
+            },
+        ]
+        response = model_call(
+            client=self.client,
+            prompt=messages,
+            model=self.model,
+            seed=3
+        )
+
+        code = response.replace("```python", "").replace("```", "").strip()
+        print(code)
+        return code
+
+    def __code_item(self, target: str, item: Dict, param_var_def_code: str) -> str:
+        print(f"Programming {target}")
+
+        messages = [
+            {
+                "role": "system",
+                "content": self.templates["main"][target][0]
+            },
+            {
+                "role": "user",
+                "content": self.templates["main"][target][1].format(
+                    context=json.dumps(item, indent=4),
+                    definition_code=param_var_def_code
+                ),
+            },
+        ]
+        response = model_call(
+            client=self.client,
+            prompt=messages,
+            model=self.model,
+            seed=3
+        )
+
+        code = response.replace("```python", "").replace("```", "").strip()
+        print(code)
+        return code
+
+    def __code_batch(self, items: List, param_var_def_code: str) -> List[Optional[str]]:
+        # one call for all constraints/objective; items missing from the
+        # returned map (or all of them, if it does not parse) stay None and
+        # are coded one by one afterwards
+        print(f"Programming {len(items)} constraints and objective in one batch")
+        keys = [f"{target}_{i}" for i, (target, item) in enumerate(items)]
+        codes = [None] * len(items)
+        if not items:
+            return codes
+
+        messages = [
+            {
+                "role": "system",
+                "content": self.templates["batched"][0]
+            },
+            {
+                "role": "user",
+                "content": self.templates["batched"][1].format(
+                    context=json.dumps(
+                        {
+                            key: {
+                                "description": item["description"],
+                                "formulation": item["formulation"]
+                            }
+                            for key, (target, item) in zip(keys, items)
+                        },
+                        indent=4
+                    ),
+                    definition_code=param_var_def_code
+                ),
+            },
+        ]
+        try:
+            response = model_call(
+                client=self.client,
+                prompt=messages,
+                model=self.model,
+                seed=3,
+                parse=json_parser(expect=dict),
+                json_mode=True
+            )
+
+            for i, key in enumerate(keys):
+                code = response.get(key)
+                if isinstance(code, str) and code.strip():
+                    codes[i] = code.replace("```python", "").replace("```", "").strip()
+                    print(codes[i])
+
+        except Exception as e:
+            print(e)
+
+        print(f"Batch coded {sum(code is not None for code in codes)}/{len(items)} items")
+        return codes
+
     def __get_param_var_def_code(self, state: Dict) -> str:
         param_var_def_code = ""
         for parameter in state["parameters"]:
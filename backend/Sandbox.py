@@ -0,0 +1,214 @@
+import io
+import os
+import sys
+import time
+import queue
+import pickle
+import resource
+import tempfile
+import importlib
+import traceback
+import multiprocessing
+
+from contextlib import contextmanager, redirect_stdout
+from typing import Dict, Optional, List
+
+
+@contextmanager
+def capture_output():
+    # Solver logs are written by native code straight to file descriptor 1,
+    # so the descriptor itself is redirected in addition to sys.stdout.
+    buffer = io.StringIO()
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with tempfile.TemporaryFile(mode="w+b") as f:
+        os.dup2(f.fileno(), 1)
+        try:
+            with redirect_stdout(buffer):
+                yield buffer
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+            f.seek(0)
+            buffer.write(f.read().decode("utf-8", errors="replace"))
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def _worker(conn, memory_limit: Optional[int], preload: List[str]):
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    if "gurobipy" in sys.modules:
+        # starting the default Gurobi environment (license check) up front
+        with capture_output():
+            sys.modules["gurobipy"].Model("warmup").dispose()
+    conn.send(dict(type="ready"))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        local_env = dict(job["env"])
+        tolerant = set(job["tolerant"])
+        result = dict(type="result", success=True, failed_step=None, error_message=None, step_times=[], errors=[])
+        with capture_output() as output:
+            for i, code in enumerate(job["steps"]):
+                if result["errors"] and i not in tolerant:
+                    # the failures of the tolerant steps end the run here
+                    break
+                conn.send(dict(type="step", index=i))
+                start = time.time()
+                try:
+                    exec(code, local_env, local_env)
+                except Exception:
+                    if i not in tolerant:
+                        result["success"] = False
+                        result["failed_step"] = i
+                        result["error_message"] = traceback.format_exc()
+                        break
+                    result["errors"].append(dict(step=i, error_message=traceback.format_exc()))
+                except BaseException:
+                    result["success"] = False
+                    result["failed_step"] = i
+                    result["error_message"] = traceback.format_exc()
+                    break
+                finally:
+                    result["step_times"].append(time.time() - start)
+            if result["errors"] and result["success"]:
+                result["success"] = False
+                result["failed_step"] = result["errors"][0]["step"]
+                result["error_message"] = result["errors"][0]["error_message"]
+        result["stdout"] = output.getvalue()
+        result["outputs"] = {name: _picklable(local_env.get(name)) for name in job["outputs"]}
+        conn.send(result)
+
+        for value in local_env.values():
+            if hasattr(value, "dispose"):
+                try:
+                    value.dispose()
+                except Exception:
+                    pass
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        size: Optional[int] = 2,
+        timeout: Optional[float] = 300,
+        memory_limit: Optional[int] = 8 * 1024 ** 3,
+        preload: Optional[List[str]] = ("numpy", "gurobipy")
+    ):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.preload = list(preload)
+        # spawned rather than forked, so workers never inherit threads or
+        # solver environments of the parent process
+        self.ctx = multiprocessing.get_context("spawn")
+        self.idle = queue.Queue()
+        workers = [self.__spawn() for _ in range(size)]
+        for worker in workers:
+            worker[1].recv()
+            self.idle.put(worker)
+
+    def __spawn(self):
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(
+            target=_worker,
+            args=(child_conn, self.memory_limit, self.preload),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def run(
+        self,
+        steps: List[str],
+        outputs: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+        env: Optional[Dict] = None,
+        tolerant: Optional[List[int]] = None
+    ) -> Dict:
+        # Executes the code steps in order in a fresh namespace (seeded with
+        # env) of a warm worker and returns the requested names, the captured
+        # output and, on failure, the failing step with its traceback.
+        # Exceptions in the tolerant steps are collected in errors and the run
+        # goes on up to the next step that is not tolerant.
+        timeout = self.timeout if timeout is None else timeout
+        process, conn = self.idle.get()
+        start = time.time()
+        current = None
+        result = None
+        try:
+            conn.send(dict(steps=steps, outputs=outputs or [], env=env or {}, tolerant=tolerant or []))
+            while result is None:
+                remaining = None if timeout is None else start + timeout - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                if not conn.poll(remaining):
+                    break
+                message = conn.recv()
+                if message["type"] == "step":
+                    current = message["index"]
+                else:
+                    result = message
+        except (EOFError, OSError):
+            pass
+
+        if result is None:
+            if process.is_alive():
+                error_message = f"TimeoutError: execution exceeded {timeout} seconds"
+            else:
+                error_message = f"RuntimeError: worker exited with code {process.exitcode} (out of memory?)"
+            result = dict(
+                success=False,
+                failed_step=current,
+                error_message=error_message,
+                stdout="",
+                outputs={},
+                step_times=[],
+                errors=[]
+            )
+            process.kill()
+            process.join()
+            conn.close()
+            process, conn = self.__spawn()
+            conn.recv()
+
+        self.idle.put((process, conn))
+        result.pop("type", None)
+        result["wall_time"] = time.time() - start
+        return result
+
+    def close(self):
+        while not self.idle.empty():
+            process, conn = self.idle.get()
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -2,6 +2,9 @@ import json
 
 from typing import Dict, Optional, Union, List, Tuple
 from backend import Programmer, Evaluator
+from backend.Sandbox import SandboxPool
+from utils import Trace
+from utils.Budget import Budget, BudgetExceeded, use_budget
 
 class Solver:
     def __init__(
@@ -9,28 +12,73 @@ class Solver:
         client, 
         data_json_path: str, 
         model: Optional[str] = "gpt-3.5-turbo",
-        maximum_retries: Optional[int] = 3
+        maximum_retries: Optional[int] = 3,
+        coding_mode: Optional[str] = "sequential",
+        max_concurrency: Optional[int] = 4,
+        incremental: Optional[bool] = False,
+        pool: Optional[SandboxPool] = None,
+        solver: Optional[str] = "gurobipy",
+        portfolio: Optional[List[Dict]] = None,
+        budget: Optional[Budget] = None,
+        translate_latex: Optional[bool] = True,
+        preflight: Optional[bool] = True,
+        collect_errors: Optional[bool] = True
     ):
         self.client = client
         self.data_json_path = data_json_path
         self.model = model
         self.maximum_retries = maximum_retries
+        self.coding_mode = coding_mode
+        self.max_concurrency = max_concurrency
+        self.incremental = incremental
+        self.pool = pool
+        self.solver = solver
+        self.portfolio = portfolio
+        # shared with the Formulator of the problem to cap its overall cost
+        self.budget = budget
+        self.translate_latex = translate_latex
+        self.preflight = preflight
+        self.collect_errors = collect_errors
         
+    @Trace.traced("Solver.solve")
     def solve(self, state: Dict) -> (str, Dict):
         state["data_json_path"] = self.data_json_path
         state["sol_status"] = None
-        programmer = Programmer(client=self.client, model=self.model)
-        evaluator = Evaluator(client=self.client, model=self.model)
+        programmer = Programmer(
+            client=self.client,
+            solver=self.solver,
+            model=self.model,
+            coding_mode=self.coding_mode,
+            max_concurrency=self.max_concurrency,
+            translate_latex=self.translate_latex
+        )
+        evaluator = Evaluator(
+            client=self.client,
+            solver=self.solver,
+            model=self.model,
+            incremental=self.incremental,
+            pool=self.pool,
+            portfolio=self.portfolio,
+            preflight=self.preflight,
+            collect_errors=self.collect_errors
+        )
         
-        for _ in range(self.maximum_retries):
-            res, state = programmer.program(state)
-            print(res)
-            
-            res, state = evaluator.eval(state)
-            print(res)
-            
-            if state["sol_status"] == "solved":
-                break
+        with use_budget(self.budget):
+            for _ in range(self.maximum_retries):
+                try:
+                    res, state = programmer.program(state)
+                except BudgetExceeded as e:
+                    # the state of the last evaluation is kept
+                    print(e)
+                    state["budget_exhausted"] = str(e)
+                    break
+                print(res)
+                
+                res, state = evaluator.eval(state)
+                print(res)
+                
+                if state["sol_status"] == "solved":
+                    break
         
         if state["sol_status"] == "solved":
             return "success", state
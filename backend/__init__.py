@@ -1,3 +1,4 @@
 from .Programmer import Programmer
 from .Evaluator import Evaluator
-from .Solver import Solver
\ No newline at end of file
+from .Solver import Solver
+from .Sandbox import SandboxPool
@@ -0,0 +1,61 @@
+import json
+import time
+import argparse
+import importlib
+
+from utils.ReplayClient import ReplayClient
+from utils.Datasets import datasets, get_dataset
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("transcripts", nargs="+")
+    parser.add_argument("--dataset", choices=list(datasets.keys()), default="lpwp")
+    parser.add_argument("--root", default=None, help="dataset directory or zip archive")
+    parser.add_argument("--results", default=None, help="output location, defaults to results/bench_replay/<dataset>")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--latency", default=None, help="none, recorded, seconds or low,high")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_replay.json")
+    args = parser.parse_args()
+
+    latency = args.latency
+    if latency is not None and latency not in ["none", "recorded"]:
+        latency = tuple(float(t) for t in latency.split(",")) if "," in latency else float(latency)
+    elif latency == "none":
+        latency = None
+
+    client = ReplayClient(
+        args.transcripts,
+        latency=latency,
+        latency_scale=args.latency_scale,
+        error_rate=args.error_rate,
+        strict=False,
+        seed=args.seed
+    )
+    # inputs come from the extracted dataset or its archive, and the outputs
+    # of the runs stay out of the dataset
+    dataset = get_dataset(args.dataset, root=args.root, results=args.results or f"results/bench_replay/{args.dataset}")
+    run = importlib.import_module(dataset.runners["pipeline"]).run
+    probs = dataset.problems()
+    if args.limit is not None:
+        probs = probs[:args.limit]
+    if not probs:
+        raise Exception(f"No problems found in dataset {args.dataset}!")
+
+    records = []
+    for prob in probs:
+        print(f"Benchmarking {prob}")
+        data_path = dataset.materialize(prob)
+        start = time.time()
+        res = run(client, data_path)
+        succ = res[0] if isinstance(res, tuple) else res
+        records.append(dict(problem=prob, success=succ, wall_time=time.time() - start))
+
+    total = sum(r["wall_time"] for r in records)
+    with open(args.output, "w") as f:
+        json.dump(dict(records=records, total_wall_time=total, replay=client.stats), f, indent=4)
+    print("Total samples:", len(records))
+    print("Total wall time:", total)
+    print("Replay stats:", client.stats)
@@ -0,0 +1,169 @@
+import uuid
+import openai
+import argparse
+import importlib
+import functools
+import google.generativeai as genai
+
+from utils.ModelCall import set_cache, set_recorder
+from utils.ResponseCache import ResponseCache
+from utils.ReplayClient import ReplayClient, TranscriptRecorder
+from utils.Datasets import datasets, get_dataset
+from utils.Journal import config_hash
+from utils.ResultStore import ResultStore
+from utils.Runner import add_runner_arguments, get_budget_limits, make_runner
+from utils import Trace
+from utils.Budget import Budget, use_budget
+from backend.Fingerprint import SolveCache, set_solve_cache
+
+modes = ["pipeline", "standard"]
+
+
+def make_client(provider="google", replay=None, record=None, cache="cache/responses.sqlite",
+                solves="cache/solves.sqlite"):
+    # called in every problem process of the runner
+    if replay:
+        return ReplayClient(replay, strict=False)
+    if cache:
+        set_cache(ResponseCache(cache))
+    if solves:
+        set_solve_cache(SolveCache(solves))
+    if record:
+        set_recorder(TranscriptRecorder(record))
+    with open(f"{provider}.key") as f:
+        key = f.read().strip()
+    if provider == "openai":
+        return openai.Client(api_key=key)
+    genai.configure(api_key=key, transport='rest')
+    return genai.GenerativeModel('gemini-pro')
+
+
+def run_problem(client, prob, dataset, mode, root=None, results=None, solver="gurobipy", budget_limits=None,
+                resume=False, pool=None):
+    # the run functions read their inputs from and write their outputs to
+    # the problem's results directory
+    dataset = get_dataset(dataset, root=root, results=results)
+    data_path = dataset.materialize(prob)
+    run = importlib.import_module(dataset.runners[mode]).run
+    if mode == "pipeline":
+        return run(client, data_path, pool=pool, resume=resume, solver=solver, budget_limits=budget_limits)
+    with use_budget(Budget(**budget_limits) if budget_limits else None):
+        return run(client, data_path, pool=pool)
+
+
+def run_benchmark(args):
+    dataset = get_dataset(args.dataset, root=args.root, results=args.results)
+    probs = dataset.problems()
+    if args.limit is not None:
+        probs = probs[:args.limit]
+
+    budget_limits = get_budget_limits(args)
+    config = dict(dataset=args.dataset, mode=args.mode, solver=args.solver, provider=args.provider,
+                  replay=args.replay, **budget_limits)
+    # the config hash of the journal of the runner
+    config_id = config_hash(config)
+    store = ResultStore(args.store)
+    # spans of this invocation, as the trace file keeps earlier runs too
+    session = uuid.uuid4().hex[:12]
+
+    def save(record):
+        gt = None
+        try:
+            gt = dataset.ground_truth(record["problem"])
+        except Exception:
+            pass
+        store.add(dict(
+            record,
+            run=args.run_name,
+            config=config_id,
+            dataset=args.dataset,
+            branch=dataset.branch(record["problem"]),
+            mode=args.mode,
+            solver=args.solver,
+            gt=gt
+        ))
+
+    runner = make_runner(
+        args,
+        functools.partial(run_problem, dataset=args.dataset, mode=args.mode, root=args.root,
+                          results=args.results, solver=args.solver, budget_limits=budget_limits),
+        functools.partial(make_client, provider=args.provider, replay=args.replay, record=args.record,
+                          cache=None if args.no_cache else args.cache,
+                          solves=None if args.no_cache else args.solves),
+        config,
+        stage_files=dataset.stage_files.get(args.mode),
+        output_dir=dataset.output_dir,
+        trace_path=args.trace or None,
+        trace_attrs=dict(run=args.run_name, config=config_id, dataset=args.dataset,
+                         mode=args.mode, session=session)
+    )
+    runner.run(probs, callback=save)
+    print_summary(store.summary(dataset=args.dataset, mode=args.mode, config=config_id,
+                                tolerance=args.tolerance))
+    if args.trace:
+        Trace.print_report(Trace.aggregate(Trace.load(args.trace, session=session)))
+
+
+def print_summary(rows):
+    for row in rows:
+        print(f"{row['dataset']} / {row['mode']} / {row['solver']} (config {row['config']})")
+        print("Total samples:", row["total"])
+        print("Runtime error samples:", row["errors"])
+        print("Failed samples:", row["failures"])
+        print("Accepted samples:", row["accepted"])
+        print(f"Wall time: {row['wall_time'] or 0:.1f}s, model calls: {row['calls']} ({row['cached_calls']} cached)")
+
+
+def report(args):
+    store = ResultStore(args.store)
+    print_summary(store.summary(dataset=args.dataset, mode=args.mode, config=args.config,
+                                tolerance=args.tolerance))
+    if args.wrong:
+        for row in store.wrong_answers(dataset=args.dataset, mode=args.mode, config=args.config,
+                                       tolerance=args.tolerance):
+            print(row["problem"], row["gt"], row["obj_val"] if row["obj_val"] is not None else row["obj_text"])
+    if args.stages:
+        Trace.print_report(Trace.aggregate(Trace.load(
+            args.trace, dataset=args.dataset, mode=args.mode, config=args.config, run=args.run_name
+        )))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--dataset", choices=list(datasets.keys()), default="lpwp")
+    run_parser.add_argument("--root", default=None, help="dataset directory or zip archive")
+    run_parser.add_argument("--results", default=None, help="output location, defaults to results/<dataset>")
+    run_parser.add_argument("--mode", choices=modes, default="pipeline")
+    run_parser.add_argument("--solver", default="gurobipy")
+    run_parser.add_argument("--provider", choices=["google", "openai"], default="google")
+    run_parser.add_argument("--replay", nargs="+", default=None, help="replay recorded transcripts")
+    run_parser.add_argument("--record", default=None, help="record transcripts to this file")
+    run_parser.add_argument("--cache", default="cache/responses.sqlite")
+    run_parser.add_argument("--solves", default="cache/solves.sqlite", help="results of solved models")
+    run_parser.add_argument("--no-cache", action="store_true")
+    add_runner_arguments(run_parser)
+    run_parser.add_argument("--limit", type=int, default=None)
+    run_parser.add_argument("--run-name", default=None)
+    run_parser.add_argument("--trace", default="runs/trace.jsonl", help="stage spans, empty to disable")
+
+    report_parser = subparsers.add_parser("report")
+    report_parser.add_argument("--dataset", choices=list(datasets.keys()), default=None)
+    report_parser.add_argument("--mode", choices=modes, default=None)
+    report_parser.add_argument("--config", default=None)
+    report_parser.add_argument("--wrong", action="store_true", help="list wrong answers")
+    report_parser.add_argument("--stages", action="store_true", help="per-stage time and token report")
+    report_parser.add_argument("--trace", default="runs/trace.jsonl")
+    report_parser.add_argument("--run-name", default=None)
+
+    for p in [run_parser, report_parser]:
+        p.add_argument("--store", default="runs/results.sqlite")
+        p.add_argument("--tolerance", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_benchmark(args)
+    else:
+        report(args)
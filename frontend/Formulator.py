@@ -1,8 +1,13 @@
+import re
 import json
+import hashlib
 import nltk
 
 from typing import Dict, Optional, Union, List, Tuple
-from utils.ModelCall import model_call
+from utils.ModelCall import model_call, parallel_map
+from utils.JsonOutput import json_parser
+from utils import Trace
+from utils.Budget import Budget, BudgetExceeded, use_budget, budget_low
 from frontend import InfoExt, ParamExt, VarExt
 
 formulate_template = ["""
@@ -208,30 +213,113 @@ After review, here is the comments and instructions for improvement:
 Now, take a deep breath and generate the JSON file in the required format.
 """]
 
+def referenced_symbols(text: str) -> set:
+    # identifiers in a LaTeX formulation or description; underscore-joined
+    # tokens also yield their prefixes, since x_i may mean x indexed by i
+    symbols = set()
+    for token in re.findall(r"[A-Za-z][A-Za-z0-9_]*", text):
+        parts = token.split("_")
+        for k in range(1, len(parts) + 1):
+            symbols.add("_".join(parts[:k]).rstrip("_"))
+    return symbols
+
+def changed_symbols(prv: List, cur: List) -> set:
+    prv_dims = {var["symbol"]: var.get("dim") for var in prv}
+    cur_dims = {var["symbol"]: var.get("dim") for var in cur}
+    return {
+        symbol for symbol in set(prv_dims) | set(cur_dims)
+        if prv_dims.get(symbol, None) != cur_dims.get(symbol, None)
+    }
+
+def reextract_all(prv: List, cur: List) -> bool:
+    # a new variable may be meant by any fragment, and a new description
+    # changes what a variable means in all of them, so neither can be traced
+    # to the fragments that already reference the symbol
+    prv_descs = {var["symbol"]: " ".join(str(var.get("description") or "").split()) for var in prv}
+    return any(
+        var["symbol"] not in prv_descs
+        or prv_descs[var["symbol"]] != " ".join(str(var.get("description") or "").split())
+        for var in cur
+    )
+
+def canonical(obj):
+    if isinstance(obj, dict):
+        return {k: canonical(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        # item order carries no meaning in prob_def sections
+        return sorted((canonical(v) for v in obj), key=lambda v: json.dumps(v, sort_keys=True))
+    if isinstance(obj, str):
+        return re.sub(r"\s+", "", obj.replace("\\", "").replace("$", ""))
+    return obj
+
+def fingerprint(prob_def: Dict, sections: List[str]) -> str:
+    content = json.dumps(
+        {section: canonical(prob_def[section]) for section in sections},
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
 class Formulator:
     def __init__(
         self, 
         client,
         param_symbols: Optional[List] = None,
         model: Optional[str] = "gpt-3.5-turbo",
-        maximum_retries: Optional[int] = 3
+        maximum_retries: Optional[int] = 3,
+        max_concurrency: Optional[int] = 4,
+        incremental: Optional[bool] = False,
+        budget: Optional[Budget] = None
     ):
         self.client = client
         self.param_symbols = param_symbols
         self.model = model
         self.maximum_retries = maximum_retries
+        self.max_concurrency = max_concurrency
+        self.incremental = incremental
+        # shared with the Solver of the problem to cap its overall cost
+        self.budget = budget
         
         self.infoExt = InfoExt(client, model)
-        self.paramExt = ParamExt(client, model)
+        self.paramExt = ParamExt(client, model, max_concurrency=max_concurrency)
         self.varExt = VarExt(client, model)
 
         self.prob_def = None
+        # per-fragment extraction results and the variables they were
+        # extracted against, reused by incremental re-extraction
+        self.fragments = None
+        self.extracted_variables = None
+        # reflection rounds skipped because a revision made no progress
+        self.rounds_saved = dict(var=0, all=0)
+        # last complete definition, returned when the budget runs out
+        # during reflection
+        self.last_complete = None
+        self.budget_exhausted = None
         
+    @Trace.traced("Formulator.formulate")
     def formulate(self, desc: str) -> Dict:
+        self.last_complete = None
+        self.budget_exhausted = None
+        with use_budget(self.budget):
+            try:
+                return self.__formulate(desc)
+            except BudgetExceeded as e:
+                if self.last_complete is None:
+                    raise
+                print(f"{e}, returning the last complete problem definition")
+                self.budget_exhausted = str(e)
+                self.prob_def = self.last_complete
+                return self.prob_def
+
+    def __formulate(self, desc: str) -> Dict:
+        # background and parameters only depend on the description
+        background, parameters = parallel_map(lambda fn: fn(), [
+            lambda: self.infoExt.extract(desc),
+            lambda: self.paramExt.extract(desc, symbols=self.param_symbols)
+        ])
         self.prob_def = dict(
             description=desc,
-            background=self.infoExt.extract(desc),
-            parameters=self.paramExt.extract(desc, symbols=self.param_symbols),
+            background=background,
+            parameters=parameters,
             variables=[],
             constraints=[],
             objective=[]
@@ -242,99 +330,158 @@ class Formulator:
         )
         print(json.dumps(self.prob_def, indent=4))
         
+        self.rounds_saved = dict(var=0, all=0)
+        history = [fingerprint(self.prob_def, ["variables"])]
         for _ in range(self.maximum_retries):
-            print(f"Reflect round {_} for var")
+            with Trace.span("Formulator.round", loop="var", round=_):
+                if budget_low():
+                    print("Budget running low, skipping further reflection")
+                    break
+                print(f"Reflect round {_} for var")
             
-            decision = self.__reflect("var")
-            print("Reflect Results (var)")
-            print(json.dumps(decision, indent=4))
+                decision = self.__reflect("var")
+                print("Reflect Results (var)")
+                print(json.dumps(decision, indent=4))
             
-            if decision["variables"][0] != "Consistent":
-                self.prob_def["variables"] = self.varExt.revise(
-                    bg=self.prob_def["background"],
-                    params=self.prob_def["parameters"],
-                    prv=self.prob_def["variables"],
-                    msg=decision["variables"][1]
-                )
-            else:
-                break
+                if decision["variables"][0] != "Consistent":
+                    self.prob_def["variables"] = self.varExt.revise(
+                        bg=self.prob_def["background"],
+                        params=self.prob_def["parameters"],
+                        prv=self.prob_def["variables"],
+                        msg=decision["variables"][1]
+                    )
+                    if self.__converged(history, fingerprint(self.prob_def, ["variables"]), "var", _):
+                        break
+                else:
+                    break
         
         self.__extract()
         print("Problem Definition")
         print(json.dumps(self.prob_def, indent=4))
         
+        sections = ["variables", "constraints", "objective"]
+        history = [fingerprint(self.prob_def, sections)]
         for _ in range(self.maximum_retries):
-            print(f"Reflect round {_}")
+            with Trace.span("Formulator.round", loop="all", round=_):
+                if budget_low():
+                    print("Budget running low, skipping further reflection")
+                    break
+                self.last_complete = json.loads(json.dumps(self.prob_def))
+                print(f"Reflect round {_}")
                 
-            decision = self.__reflect("all")
-            print("Reflect Results (all)")
-            print(json.dumps(decision, indent=4))
+                decision = self.__reflect("all")
+                print("Reflect Results (all)")
+                print(json.dumps(decision, indent=4))
             
-            if decision["variables"][0] != "Consistent":
-                self.prob_def["variables"] = self.varExt.revise(
-                    bg=self.prob_def["background"],
-                    params=self.prob_def["parameters"],
-                    prv=self.prob_def["variables"],
-                    msg=decision["variables"][1]
-                )
-                self.__extract()
-            elif decision["constraints"][0] != "Consistent" or decision["objective"][0] != "Consistent":
-                for target in ["constraints", "objective"]:
-                    if decision[target][0] != "Consistent":
-                        self.prob_def[target] = self.revise(
-                            target=target,
-                            msg=decision[target][1]
-                        )
-            else:
-                break
+                if decision["variables"][0] != "Consistent":
+                    prv = fingerprint(self.prob_def, ["variables"])
+                    self.prob_def["variables"] = self.varExt.revise(
+                        bg=self.prob_def["background"],
+                        params=self.prob_def["parameters"],
+                        prv=self.prob_def["variables"],
+                        msg=decision["variables"][1]
+                    )
+                    if fingerprint(self.prob_def, ["variables"]) == prv:
+                        # unchanged variables would re-extract the same fragments
+                        self.__converged(history, history[-1], "all", _)
+                        break
+                    self.__extract(incremental=self.incremental)
+                elif decision["constraints"][0] != "Consistent" or decision["objective"][0] != "Consistent":
+                    for target in ["constraints", "objective"]:
+                        if decision[target][0] != "Consistent":
+                            self.prob_def[target] = self.revise(
+                                target=target,
+                                msg=decision[target][1]
+                            )
+                else:
+                    break
+
+                if self.__converged(history, fingerprint(self.prob_def, sections), "all", _):
+                    break
             
         return self.prob_def
+
+    def __converged(self, history: List[str], fp: str, loop: str, round: int) -> bool:
+        # a revision that reproduces the current (no progress) or an earlier
+        # state (oscillation, A -> B -> A) will not settle the reflection
+        if fp in history:
+            kind = "no progress" if fp == history[-1] else "oscillation"
+            self.rounds_saved[loop] = self.maximum_retries - round - 1
+            print(f"Reflection ({loop}) stopped at round {round} ({kind}), {self.rounds_saved[loop]} rounds saved")
+            return True
+        history.append(fp)
+        return False
     
-    def __extract(self):
-        self.prob_def["constraints"] = []
-        self.prob_def["objective"] = []
-        
-        def __call(prompt_template: str, fragment: Optional[str] = None):
+    @Trace.traced("Formulator.extract")
+    def __extract(self, incremental: Optional[bool] = False):
+        def __call(prompt_template: str, fragment: Optional[str] = None) -> Dict:
             prompt = prompt_template.format(
                 background=self.prob_def["background"],
                 parameters=json.dumps(self.prob_def["parameters"], indent=4),
                 variables=json.dumps(self.prob_def["variables"], indent=4),
                 desc_frag=fragment
             )
-            cnt = 3
-            while cnt > 0:
-                try:
-                    response = model_call(
-                        client=self.client,
-                        prompt=[
-                            {"role": "system", "content": formulate_template[0]},
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
-                    if "```json" in response:
-                        response = response[response.find("```json") + 7 :]
-                        response = response[: response.rfind("```")]
-                    response = response.replace("```", "").replace("\\", "")
-                    response = json.loads(response)
-                    break
-                
-                except Exception as e:
-                    print(e)
-                    cnt -= 1
-                    if cnt == 0:
-                        raise RuntimeError("Constriants or objective extraction failed.")
+            try:
+                return model_call(
+                    client=self.client,
+                    prompt=[
+                        {"role": "system", "content": formulate_template[0]},
+                        {"role": "user", "content": prompt}
+                    ],
+                    seed=3,
+                    parse=json_parser(expect=dict),
+                    json_mode=True
+                )
+
+            except BudgetExceeded:
+                raise
+
+            except Exception as e:
+                raise RuntimeError("Constriants or objective extraction failed.") from e
             
+        # fragments are independent given background, parameters and
+        # variables, so they are requested concurrently and merged in order
+        jobs = [(formulate_template[1], None)]
+        # jobs.append((formulate_template[2], self.prob_def["description"]))
+        for sent in nltk.sent_tokenize(self.prob_def["description"]):
+            jobs.append((formulate_template[2], sent))
+
+        todo = list(range(len(jobs)))
+        if incremental and self.fragments is not None and len(self.fragments) == len(jobs) \
+                and not reextract_all(self.extracted_variables, self.prob_def["variables"]):
+            changed = changed_symbols(self.extracted_variables, self.prob_def["variables"])
+            # the implicit constraints depend on the whole variable list
+            todo = [0] + [
+                i for i in range(1, len(jobs))
+                if self.fragments[i]["symbols"] & changed
+            ]
+            print(f"Variables changed: {sorted(changed)}, re-extracting {len(todo)}/{len(jobs)} fragments")
+        else:
+            self.fragments = [None] * len(jobs)
+
+        def __fragment(i: int) -> Dict:
+            with Trace.span("Formulator.fragment", index=i):
+                return __call(*jobs[i])
+
+        responses = parallel_map(__fragment, todo, limit=self.max_concurrency)
+        for i, response in zip(todo, responses):
+            self.fragments[i] = dict(
+                fragment=jobs[i][1],
+                response=response,
+                symbols=referenced_symbols(json.dumps(response)) | referenced_symbols(jobs[i][1] or "")
+            )
+        self.extracted_variables = json.loads(json.dumps(self.prob_def["variables"]))
+
+        self.prob_def["constraints"] = []
+        self.prob_def["objective"] = []
+        for response in [fragment["response"] for fragment in self.fragments]:
             if "constraints" in response:
                 self.prob_def["constraints"] += response["constraints"]
             if "objective" in response:
                 self.prob_def["objective"] += response["objective"]
-            
-        __call(formulate_template[1])
-        # __call(formulate_template[2], self.prob_def["description"])
-        for sent in nltk.sent_tokenize(self.prob_def["description"]):
-            __call(formulate_template[2], sent)
         print(json.dumps(self.prob_def, indent=4))
             
+    @Trace.traced("Formulator.reflect")
     def __reflect(self, target: str) -> List[Tuple]:
         if target == "var":
             prompt = reflect_template[1].format(
@@ -350,60 +497,54 @@ class Formulator:
                 constraints=json.dumps(self.prob_def["constraints"], indent=4),
                 objective=json.dumps(self.prob_def["objective"], indent=4)
             )
-        cnt = 3
-        while cnt > 0:
-            try:
-                response = model_call(
-                    client=self.client,
-                    prompt=[
-                        {"role": "system", "content": reflect_template[0]},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = json.loads(response.replace("```", "").replace("\\", ""))
-                return {
-                    k: (v["status"], v["message"])
-                    for k, v in response.items()
-                }
-                
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Reflection failed.")
+        def __decisions(response: Dict) -> Dict:
+            return {
+                k: (v["status"], v["message"])
+                for k, v in response.items()
+            }
+
+        try:
+            return model_call(
+                client=self.client,
+                prompt=[
+                    {"role": "system", "content": reflect_template[0]},
+                    {"role": "user", "content": prompt}
+                ],
+                seed=3,
+                parse=json_parser(expect=dict, validate=__decisions),
+                json_mode=True
+            )
+
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Reflection failed.") from e
         
+    @Trace.traced("Formulator.revise")
     def revise(self, target: str, msg: str) -> List:
-        cnt = 3
-        while cnt > 0:
-            try:
-                response = model_call(
-                    client=self.client,
-                    prompt=[
-                        {"role": "system", "content": revise_template[0]},
-                        {
-                            "role": "user", 
-                            "content": revise_template[1].format(
-                                background=self.prob_def["background"],
-                                target=target,
-                                previous=json.dumps(self.prob_def[target], indent=4),
-                                message=msg
-                            )
-                        }
-                    ],
-                    model=self.model
-                )
-                
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = response.replace("```", "").replace("\\", "")
-                return json.loads(response)
+        try:
+            return model_call(
+                client=self.client,
+                prompt=[
+                    {"role": "system", "content": revise_template[0]},
+                    {
+                        "role": "user", 
+                        "content": revise_template[1].format(
+                            background=self.prob_def["background"],
+                            target=target,
+                            previous=json.dumps(self.prob_def[target], indent=4),
+                            message=msg
+                        )
+                    }
+                ],
+                model=self.model,
+                seed=3,
+                parse=json_parser(expect=list)
+            )
 
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Formulator revise failed.")
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Formulator revise failed.") from e
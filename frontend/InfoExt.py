@@ -1,5 +1,6 @@
 from typing import Dict, Optional, Union, List
 from utils.ModelCall import model_call
+from utils import Trace
 
 prompt_template = ["""
 You are an optimization experts who are familiar with optimization problem analyzing and modeling.
@@ -25,6 +26,7 @@ class InfoExt:
         self.client = client
         self.model = model
         
+    @Trace.traced("InfoExt.extract")
     def extract(self, desc: str) -> str:
         response = model_call(
             client=self.client,
@@ -1,7 +1,10 @@
 import json
 
 from typing import Dict, Optional, Union, List
-from utils.ModelCall import model_call
+from utils.ModelCall import model_call, parallel_map
+from utils.JsonOutput import json_parser
+from utils import Trace
+from utils.Budget import BudgetExceeded
 
 prompt_template = ["""
 You are an optimization experts who are familiar with optimization problem analyzing and modeling.
@@ -38,47 +41,89 @@ Now, take a deep breath and generate the JSON file in the required format.
 """]
 
 class ParamExt:
-    def __init__(self, client, model: Optional[str] = "gpt-3.5-turbo"):
+    def __init__(
+        self,
+        client,
+        model: Optional[str] = "gpt-3.5-turbo",
+        chunk_size: Optional[int] = 20,
+        max_concurrency: Optional[int] = 4,
+        maximum_retries: Optional[int] = 3
+    ):
         self.client=client
         self.model=model
-        
+        # symbols are requested in chunks of at most chunk_size, concurrently
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        # re-prompts for the symbols a response left out or got wrong
+        self.maximum_retries = maximum_retries
+
+    def __prompt(self, desc: str, symbols: List) -> List:
+        return [
+            {"role": "system", "content": prompt_template[0]},
+            {
+                "role": "user", 
+                "content": prompt_template[1].format(description=desc, symbols=symbols)
+            }
+        ]
+
+    def __extract_chunk(self, desc: str, symbols: List) -> List:
+        dims = {ctx[0]: ctx[1] for ctx in symbols}
+        accepted = {}
+        todo = list(symbols)
+        for attempt in range(self.maximum_retries + 1):
+            # the rounds are the retries: each one resends a rejected response
+            # once, with seeds apart from those of the other rounds
+            response = model_call(
+                client=self.client,
+                prompt=self.__prompt(desc, todo),
+                model=self.model,
+                seed=5 - 2 * attempt,
+                parse=json_parser(expect=list),
+                max_attempts=2
+            )
+            for param in response:
+                if not isinstance(param, dict) or not isinstance(param.get("description"), str):
+                    continue
+                symbol = str(param.get("symbol", "")).strip()
+                if symbol in dims and symbol not in accepted:
+                    # the dimension is known already, a wrong one is corrected
+                    # instead of re-requested
+                    accepted[symbol] = dict(param, symbol=symbol, dim=dims[symbol])
+            todo = [ctx for ctx in symbols if ctx[0] not in accepted]
+            if not todo:
+                return [accepted[ctx[0]] for ctx in symbols]
+            print(f"Missing {len(todo)} of {len(symbols)} parameters, re-requesting them")
+        raise RuntimeError(f"Parameters {[ctx[0] for ctx in todo]} are missing.")
+
+    @Trace.traced("ParamExt.extract")
     def extract(self, desc: str, symbols: Optional[List] = None) -> List:
-        if symbols is None:
-            prompt = [
-                {"role": "system", "content": prompt_template[0]},
-                {"role": "user", "content": prompt_template[1].format(description=desc)}
-            ]
-        else:
-            prompt = [
-                {"role": "system", "content": prompt_template[0]},
-                {
-                    "role": "user", 
-                    "content": prompt_template[1].format(description=desc, symbols=symbols)
-                }
-            ]
-        
-        cnt = 5
-        while cnt > 0:
-            try:
-                response = model_call(
+        try:
+            if symbols is None:
+                prompt = [
+                    {"role": "system", "content": prompt_template[0]},
+                    {"role": "user", "content": prompt_template[1].format(description=desc)}
+                ]
+                return model_call(
                     client=self.client,
                     prompt=prompt,
-                    model=self.model
+                    model=self.model,
+                    seed=5,
+                    parse=json_parser(expect=list),
+                    max_attempts=5
                 )
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = response.replace("```", "").replace("\\", "")
-                response = json.loads(response)
-                
-                for (param, ctx) in zip(response, symbols):
-                    assert param['symbol'] == ctx[0]
-                    assert param['dim'] == ctx[1]
-                return response
-                
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Parameter extraction failed.")
-        
\ No newline at end of file
+
+            chunks = [symbols[i:i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)]
+
+            def __chunk(item) -> List:
+                i, chunk = item
+                with Trace.span("ParamExt.chunk", index=i, symbols=len(chunk)):
+                    return self.__extract_chunk(desc, chunk)
+
+            responses = parallel_map(__chunk, list(enumerate(chunks)), limit=self.max_concurrency)
+            return [param for response in responses for param in response]
+        
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Parameter extraction failed.") from e
@@ -2,6 +2,9 @@ import json
 
 from typing import Dict, Optional, Union, List
 from utils.ModelCall import model_call
+from utils.JsonOutput import json_parser
+from utils import Trace
+from utils.Budget import BudgetExceeded
 
 prompt_template = ["""
 You are an optimization experts who are familiar with optimization problem analyzing and modeling.
@@ -83,65 +86,55 @@ class VarExt:
         self.client=client
         self.model=model
         
+    @Trace.traced("VarExt.extract")
     def extract(self, desc: str, params: List) -> List:
-        cnt = 3
-        while cnt > 0:
-            try:
-                response = model_call(
-                    client=self.client,
-                    prompt=[
-                        {"role": "system", "content": prompt_template[0]},
-                        {
-                            "role": "user", 
-                            "content": prompt_template[1].format(
-                                description=desc,
-                                parameters=json.dumps(params, indent=4)
-                            )
-                        }
-                    ],
-                    model=self.model
-                )
-                
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = response.replace("```", "").replace("\\", "")
-                return json.loads(response)
-                
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Variable extraction failed.")
+        try:
+            return model_call(
+                client=self.client,
+                prompt=[
+                    {"role": "system", "content": prompt_template[0]},
+                    {
+                        "role": "user", 
+                        "content": prompt_template[1].format(
+                            description=desc,
+                            parameters=json.dumps(params, indent=4)
+                        )
+                    }
+                ],
+                model=self.model,
+                seed=3,
+                parse=json_parser(expect=list)
+            )
+
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Variable extraction failed.") from e
     
+    @Trace.traced("VarExt.revise")
     def revise(self, bg: str, params: List, prv: List, msg: str) -> List:
-        cnt = 3
-        while cnt > 0:
-            try:
-                response = model_call(
-                    client=self.client,
-                    prompt=[
-                        {"role": "system", "content": revise_template[0]},
-                        {
-                            "role": "user", 
-                            "content": revise_template[1].format(
-                                background=bg,
-                                parameters=json.dumps(params, indent=4),
-                                previous=json.dumps(prv, indent=4),
-                                message=msg)
-                        }
-                    ],
-                    model=self.model
-                )
-                
-                if "```json" in response:
-                    response = response[response.find("```json") + 7 :]
-                    response = response[: response.rfind("```")]
-                response = response.replace("```", "").replace("\\", "")
-                return json.loads(response)
-            
-            except Exception as e:
-                print(e)
-                cnt -= 1
-                if cnt == 0:
-                    raise RuntimeError("Variable revise failed.")
\ No newline at end of file
+        try:
+            return model_call(
+                client=self.client,
+                prompt=[
+                    {"role": "system", "content": revise_template[0]},
+                    {
+                        "role": "user", 
+                        "content": revise_template[1].format(
+                            background=bg,
+                            parameters=json.dumps(params, indent=4),
+                            previous=json.dumps(prv, indent=4),
+                            message=msg)
+                    }
+                ],
+                model=self.model,
+                seed=3,
+                parse=json_parser(expect=list)
+            )
+
+        except BudgetExceeded:
+            raise
+
+        except Exception as e:
+            raise RuntimeError("Variable revise failed.") from e
\ No newline at end of file
@@ -7,12 +7,18 @@ import numpy as np
 
 from frontend import Formulator
 from backend import Solver
+from utils.ModelCall import set_cache, set_recorder, is_transient
+from utils.ResponseCache import ResponseCache
+from backend.Fingerprint import SolveCache, set_solve_cache
+from utils.ReplayClient import TranscriptRecorder
+from utils.Runner import run_main, write_atomic, dump_json_atomic
+from utils.Budget import Budget
 
 dataset_path = "dataset/LPWP"
 desc_path = "description.txt"
 input_json_path = "input.json"
 
-def run(client, data_path):
+def run(client, data_path, pool=None, resume=False, solver="gurobipy", budget_limits=None):
     with open(f"{data_path}/{desc_path}", "r") as f:
         desc = f.read().strip()
         
@@ -22,73 +28,99 @@ def run(client, data_path):
     param_symbols = [(key, "[]") for key in data.keys()]
     print(param_symbols)
     
+    # one budget for the formulation and the solving of the problem
+    budget = Budget(**budget_limits) if budget_limits else None
     frontend = Formulator(
         client=client,
         param_symbols=param_symbols,
-        maximum_retries=10
+        maximum_retries=10,
+        budget=budget
     )
     backend = Solver(
         client=client,
         data_json_path=f"{data_path}/{input_json_path}",
-        maximum_retries=10
+        maximum_retries=10,
+        solver=solver,
+        pool=pool,
+        budget=budget
     )
     
     try:
-        state = frontend.formulate(desc)
-        with open(f"{data_path}/pred_state_10.json", "w") as f:
-            json.dump(state, f, indent=4)
+        if resume and os.path.exists(f"{data_path}/pred_state_10.json"):
+            # formulation saved by an interrupted attempt
+            print("Resuming from the saved formulation")
+            with open(f"{data_path}/pred_state_10.json", "r") as f:
+                state = json.load(f)
+        else:
+            state = frontend.formulate(desc)
+            print("Reflection rounds saved:", frontend.rounds_saved)
+            dump_json_atomic(state, f"{data_path}/pred_state_10.json")
         
         res, state = backend.solve(state)
     
     except Exception as e:
         print(e)
+        if is_transient(e):
+            # quota or connection problems: let the runner retry the problem
+            raise
         res = "fail"
         
     if res == "success":
-        with open(f"{data_path}/pred_sol_10.json", "w") as f:
-            json.dump(
-                {
-                    "obj_val": state["obj_val"],
-                    "code": state["code"]
-                },
-                f, indent=4
-            )
-        with open("sample.py", "w") as f:
-            f.write(state["code"])
+        dump_json_atomic(
+            {
+                "obj_val": state["obj_val"],
+                "code": state["code"]
+            },
+            f"{data_path}/pred_sol_10.json"
+        )
+        write_atomic(f"{data_path}/sample.py", state["code"])
         return True, state["obj_val"]
     else:
         print("Failed")
         return False, None
 
-if __name__ == "__main__":
+def make_client():
+    # called in every problem process of the runner
     with open("google.key") as f:
         key = f.read().strip()
     # client = openai.Client(api_key=key)
     genai.configure(api_key=key, transport='rest')
-    client = genai.GenerativeModel('gemini-pro')
-    
-    probs = os.listdir(dataset_path)
-    cnt, re, corr = 0, 0, 0
+    set_cache(ResponseCache("cache/responses.sqlite"))
+    set_solve_cache(SolveCache("cache/solves.sqlite"))
+    if os.environ.get("NLOPT_RECORD"):
+        set_recorder(TranscriptRecorder(os.environ["NLOPT_RECORD"]))
+    return genai.GenerativeModel('gemini-pro')
 
-    count = []
-    for prob in probs:
+def list_problems():
+    probs = []
+    for prob in os.listdir(dataset_path):
         prob_path = f"{dataset_path}/{prob}"
         if os.path.isdir(prob_path) and \
                 desc_path in os.listdir(prob_path) and \
                 input_json_path in os.listdir(prob_path) and \
                 "output.json" in os.listdir(prob_path):
-                    
-            print(f"Testing {prob}")
-            with open(f"{prob_path}/output.json", "r") as f:
-                gt = json.load(f)[0]
-            succ, obj_val = run(client, prob_path)
-            
-            cnt += 1
-            if not succ:
-                re += 1
-            elif not isinstance(obj_val, str) and abs(gt - obj_val) < 1:
-                corr += 1
-            
+            probs.append(prob_path)
+    return probs
+
+if __name__ == "__main__":
+    records = run_main(
+        run,
+        make_client,
+        list_problems,
+        config=dict(runner="run_lpwp", model="gemini-pro", maximum_retries=10, solver="gurobipy"),
+        stage_files=["pred_state_10.json"]
+    )
+    
+    cnt, re, corr = 0, 0, 0
+    for record in records:
+        with open(f"{record['problem']}/output.json", "r") as f:
+            gt = json.load(f)[0]
+        obj_val = record["obj_val"]
+        cnt += 1
+        if not record["success"]:
+            re += 1
+        elif not isinstance(obj_val, str) and abs(gt - obj_val) < 1:
+            corr += 1
                 
     print("Total samples:", cnt)
     print("Runtime error samples:", re)
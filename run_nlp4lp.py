@@ -7,12 +7,18 @@ import numpy as np
 
 from frontend import Formulator
 from backend import Solver
+from utils.ModelCall import set_cache, set_recorder, is_transient
+from utils.ResponseCache import ResponseCache
+from backend.Fingerprint import SolveCache, set_solve_cache
+from utils.ReplayClient import TranscriptRecorder
+from utils.Runner import run_main, write_atomic, dump_json_atomic
+from utils.Budget import Budget
 
 dataset_path = "dataset/nlp4lp_oct_23_2023"
 desc_path = "description.txt"
 input_json_path = "data.json"
 
-def run(client, data_path):
+def run(client, data_path, pool=None, resume=False, solver="gurobipy", budget_limits=None):
     with open(f"{data_path}/{desc_path}", "r") as f:
         raw = f.read().strip()
         obj = raw.split("OBJECTIVE: ")[-1].split("OUTPUT INFO:")[0].strip()
@@ -42,63 +48,80 @@ def run(client, data_path):
                     break
                 t = t[0]
         
-    with open(f"{data_path}/input.json", "w") as f:
-        json.dump(data, f, indent=4)
+    dump_json_atomic(data, f"{data_path}/input.json")
     
     param_symbols = [(key, dim_dict[key]) for key in data.keys()]
     print(param_symbols)
     
+    # one budget for the formulation and the solving of the problem
+    budget = Budget(**budget_limits) if budget_limits else None
     frontend = Formulator(
         client=client,
         param_symbols=param_symbols,
-        maximum_retries=40
+        maximum_retries=40,
+        incremental=True,
+        budget=budget
     )
     backend = Solver(
         client=client,
         data_json_path=f"{data_path}/input.json",
-        maximum_retries=40
+        maximum_retries=40,
+        solver=solver,
+        pool=pool,
+        budget=budget
     )
     
     try:
-        state = frontend.formulate(desc)
-        with open(f"{data_path}/pred_state_40.json", "w") as f:
-            json.dump(state, f, indent=4)
+        if resume and os.path.exists(f"{data_path}/pred_state_40.json"):
+            # formulation saved by an interrupted attempt
+            print("Resuming from the saved formulation")
+            with open(f"{data_path}/pred_state_40.json", "r") as f:
+                state = json.load(f)
+        else:
+            state = frontend.formulate(desc)
+            print("Reflection rounds saved:", frontend.rounds_saved)
+            dump_json_atomic(state, f"{data_path}/pred_state_40.json")
         
         res, state = backend.solve(state)
     
     except Exception as e:
         print(e)
+        if is_transient(e):
+            # quota or connection problems: let the runner retry the problem
+            raise
         res = "fail"
         
     if res == "success":
-        with open(f"{data_path}/pred_sol_40.json", "w") as f:
-            json.dump(
-                {
-                    "obj_val": state["obj_val"],
-                    "code": state["code"]
-                },
-                f, indent=4
-            )
-        with open("sample.py", "w") as f:
-            f.write(state["code"])
-        return True
+        dump_json_atomic(
+            {
+                "obj_val": state["obj_val"],
+                "code": state["code"]
+            },
+            f"{data_path}/pred_sol_40.json"
+        )
+        write_atomic(f"{data_path}/sample.py", state["code"])
+        return True, state["obj_val"]
     else:
         print("Failed")
-        return False
+        return False, None
 
-if __name__ == "__main__":
+def make_client():
+    # called in every problem process of the runner
     with open("google.key") as f:
         key = f.read().strip()
     # client = openai.Client(api_key=key)
     genai.configure(api_key=key, transport='rest')
-    client = genai.GenerativeModel('gemini-pro')
-    
+    set_cache(ResponseCache("cache/responses.sqlite"))
+    set_solve_cache(SolveCache("cache/solves.sqlite"))
+    if os.environ.get("NLOPT_RECORD"):
+        set_recorder(TranscriptRecorder(os.environ["NLOPT_RECORD"]))
+    return genai.GenerativeModel('gemini-pro')
+
+def list_problems():
     brenchs = os.listdir(dataset_path)
-    cnt, re = 0, 0
+    probs = []
     for brench in brenchs:
-        probs = os.listdir(os.path.join(dataset_path, brench))
-        count = []
-        for prob in probs:
+        for prob in os.listdir(os.path.join(dataset_path, brench)):
             # if brench != "introduction_to_linear_optimization" or prob != "problem_1":
             #     continue
             prob_path = f"{dataset_path}/{brench}/{prob}"
@@ -106,14 +129,17 @@ if __name__ == "__main__":
                     desc_path in os.listdir(prob_path) and \
                     input_json_path in os.listdir(prob_path) and \
                     "obj.txt" in os.listdir(prob_path):
-                
-                print(f"Testing {brench}/{prob}")
-                with open(f"{prob_path}/obj.txt", "r") as f:
-                    gt = float(f.read().strip()[5:])
-                succ = run(client, prob_path)
-                
-                cnt += 1
-                if not succ:
-                    re += 1
-                
+                probs.append(prob_path)
+    return probs
+
+if __name__ == "__main__":
+    records = run_main(
+        run,
+        make_client,
+        list_problems,
+        config=dict(runner="run_nlp4lp", model="gemini-pro", maximum_retries=40, solver="gurobipy"),
+        stage_files=["pred_state_40.json"]
+    )
+    
+    cnt, re = len(records), sum(not record["success"] for record in records)
     print(cnt, re)
@@ -4,7 +4,8 @@ import json
 import google.generativeai as genai
 from copy import deepcopy
 
-from utils.ModelCall import model_call
+from utils.ModelCall import model_call, is_transient
+from utils.Runner import run_main, dump_json_atomic
 
 dataset_path = "dataset/nlp4lp_oct_23_2023"
 desc_path = "description.txt"
@@ -27,7 +28,7 @@ Now the origin problem is as follow:
 Give your Python code directly.
 """
 
-def run(client, data_path):
+def run(client, data_path, pool=None):
     with open(f"{data_path}/{desc_path}", "r") as f:
         desc = f.read().strip()
         
@@ -42,62 +43,66 @@ def run(client, data_path):
         code = response.replace("```python", "").replace("```", "").strip()
         print(code)
         
-        local_env = {}
-        exec(
-                code,
-                local_env,
-                local_env,
-            )
-        obj_val = local_env["obj_val"]
+        if pool is not None:
+            res = pool.run([code], outputs=["obj_val"])
+            print(res["stdout"])
+            if not res["success"]:
+                raise RuntimeError(res["error_message"])
+            obj_val = res["outputs"]["obj_val"]
+        else:
+            local_env = {}
+            exec(
+                    code,
+                    local_env,
+                    local_env,
+                )
+            obj_val = local_env["obj_val"]
         res = "success"
     
     except Exception as e:
         print(e)
+        if is_transient(e):
+            # quota or connection problems: let the runner retry the problem
+            raise
         res = "fail"
         
     if res == "success":
-        with open(f"{data_path}/standard.json", "w") as f:
-            json.dump(
-                obj_val,
-                f, indent=4
-            )
-        return True
+        dump_json_atomic(obj_val, f"{data_path}/standard.json")
+        return True, obj_val
     else:
         print("Failed")
-        return False
+        return False, None
 
-if __name__ == "__main__":
+def make_client():
+    # called in every problem process of the runner
     with open("google.key") as f:
         key = f.read().strip()
     # client = openai.Client(api_key=key)
     genai.configure(api_key=key, transport='rest')
-    client = genai.GenerativeModel('gemini-pro')
-    
-    probs = os.listdir(dataset_path)
-    cnt, re, corr = 0, 0, 0
+    return genai.GenerativeModel('gemini-pro')
 
+def list_problems():
     brenchs = os.listdir(dataset_path)
-    cnt, re = 0, 0
+    probs = []
     for brench in brenchs:
-        probs = os.listdir(os.path.join(dataset_path, brench))
-        for prob in probs:
-            if brench == "introduction_to_linear_optimization" and prob == "problem_16":
-                flag = True
-            if not flag:
-                continue
+        for prob in os.listdir(os.path.join(dataset_path, brench)):
             prob_path = f"{dataset_path}/{brench}/{prob}"
             if os.path.isdir(prob_path) and \
                     desc_path in os.listdir(prob_path) and \
                     input_json_path in os.listdir(prob_path) and \
                     "obj.txt" in os.listdir(prob_path):
-                print(f"Testing {brench}/{prob}")
-                with open(f"{prob_path}/obj.txt", "r") as f:
-                    gt = float(f.read().strip()[5:])
-                succ = run(client, prob_path)
-                
-                cnt += 1
-                if not succ:
-                    re += 1
-                
+                probs.append(prob_path)
+    return probs
+
+if __name__ == "__main__":
+    records = run_main(
+        run,
+        make_client,
+        list_problems,
+        config=dict(runner="run_nlp4lp_standard", model="gemini-pro"),
+        budget=False
+    )
+    
+    cnt, re = len(records), sum(not record["success"] for record in records)
     print("Total samples:", cnt)
     print("Runtime error samples:", re)
@@ -0,0 +1,12 @@
+import pytest
+
+from utils.ModelCall import set_cache
+from utils.ResponseCache import ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    set_cache(cache)
+    yield cache
+    set_cache(None)
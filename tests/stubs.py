@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+import openai
+
+
+class StubCompletions:
+    # returns the responses in order, one per request, and keeps the seeds
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.seeds = []
+
+    def create(self, model, messages, seed=None, **kwargs):
+        self.seeds.append(seed)
+        content = self.responses.pop(0)
+        return SimpleNamespace(
+            usage=None,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+        )
+
+
+def make_client(responses):
+    client = openai.Client(api_key="test")
+    completions = StubCompletions(responses)
+    client.chat = SimpleNamespace(completions=completions)
+    return client, completions
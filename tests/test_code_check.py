@@ -0,0 +1,65 @@
+import pytest
+
+from backend.Backends import get_backend
+from backend.CodeCheck import check_steps
+
+prefix = "import json\nimport numpy as np\nimport gurobipy as gp\nmodel = gp.Model('model')\n"
+parameters = [
+    dict(symbol="N", dim="[]", code="N = data['N']"),
+    dict(symbol="c", dim="[N]", code="c = np.array(data['c'])"),
+    dict(symbol="M", dim="[]", code="M = data['M']"),
+]
+variables = [
+    dict(symbol="x", dim="[N]", code="x = model.addVars(N, name='x')"),
+    dict(symbol="y", dim="[]", code="y = model.addVar(name='y')"),
+    dict(symbol="z", dim="[N, M]", code="z = model.addVars(N, M, name='z')"),
+]
+
+
+def check(*codes):
+    state = dict(parameters=parameters, variables=variables)
+    items = [dict(description=f"item {i}", code=code) for i, code in enumerate(codes)]
+    steps = [(None, prefix + "\n".join(p["code"] for p in parameters), "")]
+    steps += [(variable, variable["code"], "") for variable in variables]
+    steps += [(item, item["code"], "") for item in items]
+    flagged = check_steps(steps, state, get_backend("gurobipy"))
+    return {item["description"]: errors for item, errors in flagged}
+
+
+def test_valid_code_passes():
+    assert check(
+        "model.addConstr(gp.quicksum(c[i] * x[i] for i in range(N)) <= 10)",
+        "for i in range(N):\n    model.addConstr(x[i] <= y)",
+        "model.setObjective(y, gp.GRB.MAXIMIZE)",
+    ) == {}
+
+
+def test_tupledict_keys_pass():
+    # the keys of a tupledict of two indices are (i, j) tuples
+    assert check(
+        "model.addConstr(gp.quicksum(z[k] for k in z.keys()) <= y)",
+        "for i in range(N):\n    for j in range(M):\n        model.addConstr(z[i, j] <= y)",
+    ) == {}
+
+
+@pytest.mark.parametrize("code, error", [
+    ("model.addConstr(x[0] <= ", "SyntaxError"),
+    ("model.addConstr(w <= 1)", "NameError: name 'w' is not defined"),
+    ("model.addConstr(c[0, 1] <= y)", "IndexError: c has 1 dimension(s)"),
+    ("model.addConstr(x[0, 1] <= y)", "IndexError: x has 1 dimension(s)"),
+    ("model.addConstr(y[0] <= 1)", "IndexError: y has 0 dimension(s)"),
+    ("model.addConstr(z[0, 1, 2] <= y)", "IndexError: z has 2 dimension(s)"),
+    ("model.setObjective(y, gp.GRB.MAXIMISE)", "AttributeError: 'gurobipy.GRB' has no attribute 'MAXIMISE'"),
+    ("model.addConstraint(y <= 1)", "AttributeError: 'Model' object has no attribute 'addConstraint'"),
+    ("import os", "ImportError: module 'os' is not allowed"),
+    ("open('data.json')", "PermissionError: open() is not allowed"),
+])
+def test_problem_is_flagged(code, error):
+    errors = check(code)["item 0"]
+    assert any(e.startswith(error) for e in errors), errors
+
+
+def test_every_item_is_reported():
+    flagged = check("model.addConstr(w <= 1)", "model.addConstr(y <= 1)", "model.addConstr(x[0, 0] <= v)")
+    assert sorted(flagged) == ["item 0", "item 2"]
+    assert len(flagged["item 2"]) == 2
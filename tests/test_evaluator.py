@@ -0,0 +1,153 @@
+import json
+
+import pytest
+
+gp = pytest.importorskip("gurobipy")
+
+from backend import Evaluator
+from backend.Backends import get_backend
+
+
+def make_state(tmp_path):
+    data_json_path = tmp_path / "input.json"
+    data_json_path.write_text(json.dumps({"a": 2}))
+    return {
+        "data_json_path": str(data_json_path),
+        "parameters": [{"symbol": "a", "dim": "[]", "code": "a = data['a']"}],
+        "variables": [{"symbol": "x", "dim": "[]", "status": "coded", "code": "x = model.addVar(name='x')"}],
+        "constraints": [{"description": "x is at most a", "status": "coded", "code": "model.addConstr(x <= a)"}],
+        "objective": [{"description": "maximize x", "status": "coded",
+                       "code": "model.setObjective(x, gp.GRB.MAXIMIZE)"}],
+    }
+
+
+def test_race_without_winner_is_a_bad_model(tmp_path):
+    # the only configuration fails, so the race has no winner
+    evaluator = Evaluator(
+        client=None,
+        portfolio=[dict(name="broken", solver="gurobipy", params=dict(NoSuchParameter=1))],
+        reuse_solves=False
+    )
+    state = make_state(tmp_path)
+    res, state = evaluator.eval(state)
+
+    assert res.startswith("Bad model!")
+    assert "Solver portfolio failed." in state["error_message"]
+    assert state["sol_status"] == "runtime_error"
+    for target in ["variables", "constraints", "objective"]:
+        assert all(item["status"] == "coded" for item in state[target])
+
+
+def test_solved(tmp_path):
+    res, state = Evaluator(client=None, reuse_solves=False).eval(make_state(tmp_path))
+
+    assert state["sol_status"] == "solved"
+    assert state["obj_val"] == pytest.approx(2)
+
+
+def test_deadline_limits_the_solve(tmp_path):
+    from utils.Budget import Budget, use_budget
+
+    evaluator = Evaluator(client=None, reuse_solves=False)
+    state = make_state(tmp_path)
+    assert "TimeLimit" not in evaluator._steps(state)[-2][1]
+    with use_budget(Budget(deadline=60)):
+        solve_code = evaluator._steps(state)[-2][1]
+        res, state = evaluator.eval(state)
+
+    assert "model.setParam('TimeLimit'" in solve_code
+    assert state["sol_status"] == "solved"
+    assert "TimeLimit" not in state["code"]
+
+
+@pytest.mark.parametrize("solver", ["pulp_cbc", "highs"])
+def test_time_limit_of_pulp_backends(solver):
+    backend = get_backend(solver)
+    assert backend.limited_optimize_code(None) == backend.optimize_code
+    assert f"model.solve({backend.command}(msg=False, timeLimit=12.500))" in backend.limited_optimize_code(12.5)
+
+
+def test_failed_constraint_is_rolled_back(tmp_path, capsys):
+    evaluator = Evaluator(client=None, incremental=True, reuse_solves=False)
+    state = make_state(tmp_path)
+    # adds a constraint before failing, which the resumed run has to undo
+    state["constraints"].append(dict(
+        description="x is at most 1", status="coded",
+        code="model.addConstr(x <= 1)\nraise ValueError('broken constraint')"
+    ))
+    res, state = evaluator.eval(state)
+    assert state["sol_status"] == "runtime_error"
+    assert state["constraints"][1]["status"] == "runtime_error"
+    assert "broken constraint" in state["constraints"][1]["error_message"]
+
+    state["constraints"][1]["code"] = "model.addConstr(x >= 0)"
+    capsys.readouterr()
+    res, state = evaluator.eval(state)
+    assert "Resuming model building from step 3" in capsys.readouterr().out
+    assert state["sol_status"] == "solved"
+    assert state["obj_val"] == pytest.approx(2)
+    model = evaluator.checkpoint["env"]["model"]
+    assert model.NumConstrs == 2
+
+
+
+@pytest.fixture(scope="module")
+def pool():
+    from backend.Sandbox import SandboxPool
+
+    with SandboxPool(size=1, timeout=60) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("sandboxed", [False, True])
+def test_errors_of_several_items_are_collected(tmp_path, request, sandboxed):
+    pool = request.getfixturevalue("pool") if sandboxed else None
+    evaluator = Evaluator(client=None, pool=pool, reuse_solves=False)
+    state = make_state(tmp_path)
+    state["constraints"].append(dict(description="second", status="coded", code="model.addConstr(x <= a[0])"))
+    state["objective"][0]["code"] = "model.setObjective(x / 0, gp.GRB.MAXIMIZE)"
+    res, state = evaluator.eval(state)
+
+    assert res == "There were errors in running 2 items of the code!"
+    assert state["constraints"][0]["status"] == "coded"
+    assert "TypeError" in state["constraints"][1]["error_message"]
+    assert "ZeroDivisionError" in state["objective"][0]["error_message"]
+
+
+@pytest.fixture
+def solves(tmp_path):
+    from backend.Fingerprint import SolveCache, set_solve_cache
+
+    path = str(tmp_path / "solves.sqlite")
+    set_solve_cache(SolveCache(path))
+    yield path
+    set_solve_cache(None)
+
+
+def test_solve_is_reused_across_caches(tmp_path, request, solves, capsys):
+    from backend.Fingerprint import SolveCache, set_solve_cache
+
+    pool = request.getfixturevalue("pool")
+    res, state = Evaluator(client=None).eval(make_state(tmp_path))
+    assert state["sol_status"] == "solved"
+
+    # a new cache on the same file, as in another problem process
+    cache = SolveCache(solves)
+    set_solve_cache(cache)
+    capsys.readouterr()
+    for evaluator in [Evaluator(client=None), Evaluator(client=None, pool=pool)]:
+        res, state = evaluator.eval(make_state(tmp_path))
+        assert state["obj_val"] == pytest.approx(2)
+    assert capsys.readouterr().out.count("was solved before") == 2
+    assert cache.stats["hits"] == 2
+
+
+def test_solve_stopped_early_is_not_cached(tmp_path, solves):
+    from backend.Fingerprint import get_solve_cache
+
+    state = make_state(tmp_path)
+    state["objective"][0]["code"] += "\nmodel.setParam('TimeLimit', 0)"
+    res, state = Evaluator(client=None).eval(state)
+
+    assert state["solver_output_status"] == gp.GRB.TIME_LIMIT
+    assert get_solve_cache().stats["writes"] == 0
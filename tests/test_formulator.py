@@ -0,0 +1,61 @@
+import json
+import importlib
+
+import pytest
+
+from tests.stubs import make_client
+from frontend import Formulator
+
+description = "Each chair uses wood. Each table uses metal. Profit is maximized."
+variables = [
+    dict(symbol="chairs", dim="[]", description="number of chairs"),
+    dict(symbol="tables", dim="[]", description="number of tables"),
+]
+
+
+@pytest.fixture(autouse=True)
+def sentences(monkeypatch):
+    # the punkt data of nltk is not needed to split the test description
+    module = importlib.import_module("frontend.Formulator")
+    monkeypatch.setattr(module.nltk, "sent_tokenize", lambda text: [s.strip() + "." for s in text.split(".") if s.strip()])
+
+
+def fragment(symbol):
+    return json.dumps(dict(constraints=[dict(description=f"{symbol} limit", formulation=f"{symbol} \\leq 10")]))
+
+
+def extract(formulator, variables, incremental):
+    formulator.prob_def["variables"] = json.loads(json.dumps(variables))
+    formulator._Formulator__extract(incremental=incremental)
+
+
+def make_formulator(responses):
+    client, completions = make_client(responses)
+    formulator = Formulator(client, max_concurrency=1, incremental=True)
+    formulator.prob_def = dict(description=description, background="", parameters=[], variables=[],
+                               constraints=[], objective=[])
+    return formulator, completions
+
+
+def test_changed_dimension_reextracts_its_fragments():
+    formulator, completions = make_formulator(
+        ["{}", fragment("chairs"), fragment("tables"), "{}"] + ["{}", fragment("chairs")]
+    )
+    extract(formulator, variables, incremental=False)
+    extract(formulator, [dict(variables[0], dim="[N]"), variables[1]], incremental=True)
+
+    # the implicit constraints and the fragment using chairs
+    assert len(completions.seeds) == 6
+
+
+@pytest.mark.parametrize("revised", [
+    variables + [dict(symbol="desks", dim="[]", description="number of desks")],
+    [variables[0], dict(variables[1], description="number of tables sold")],
+])
+def test_added_or_redescribed_variable_reextracts_every_fragment(revised):
+    formulator, completions = make_formulator(["{}", fragment("chairs"), fragment("tables"), "{}"] * 2)
+    extract(formulator, variables, incremental=False)
+    extract(formulator, revised, incremental=True)
+
+    assert len(completions.seeds) == 8
+    assert len(formulator.prob_def["constraints"]) == 2
@@ -0,0 +1,36 @@
+import pytest
+
+from utils.JsonOutput import extract_json, json_parser
+
+
+@pytest.mark.parametrize("text, value", [
+    ('{"a": 1}', {"a": 1}),
+    # fenced blocks and surrounding prose
+    ('Here it is:\n```json\n[1, 2]\n```\nDone.', [1, 2]),
+    ('The answer is {"a": [1, {"b": 2}]} as requested.', {"a": [1, {"b": 2}]}),
+    # LaTeX backslashes are kept literally, including \times and \frac
+    (r'{"f": "\sum_i x_i \leq b"}', {"f": r"\sum_i x_i \leq b"}),
+    (r'{"f": "2 \times x + \frac{y}{2}"}', {"f": r"2 \times x + \frac{y}{2}"}),
+    (r'{"f": "a\nb"}', {"f": "a\nb"}),
+    # trailing commas and Python literals
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{"a": True, "b": None, "c": "True"}', {"a": True, "b": None, "c": "True"}),
+    # raw newlines in strings
+    ('{"code": "x = 1\ny = 2"}', {"code": "x = 1\ny = 2"}),
+    # single-quoted Python-style output
+    ("{'a': 'b'}", {"a": "b"}),
+])
+def test_extract_json(text, value):
+    assert extract_json(text) == value
+
+
+def test_no_json():
+    with pytest.raises(ValueError):
+        extract_json("no JSON here")
+
+
+def test_json_parser():
+    assert json_parser(expect=list)('{"parameters": [1]}') == [1]
+    with pytest.raises(ValueError):
+        json_parser(expect=list)('{"a": 1}')
+    assert json_parser(expect=dict, validate=lambda value: value["a"])('{"a": 1}') == 1
@@ -0,0 +1,115 @@
+import pytest
+
+from backend.LatexTranslator import LatexTranslator, parse_dims
+
+parameters = [
+    dict(symbol="N", dim="[]"),
+    dict(symbol="M", dim="[]"),
+    dict(symbol="B", dim="[]"),
+    dict(symbol="c", dim="[N]"),
+    dict(symbol="b", dim="[M]"),
+    dict(symbol="A", dim="[M, N]"),
+    dict(symbol="Q", dim="[N, N]"),
+]
+variables = [
+    dict(symbol="x", dim="[N]", code="x = model.addVars(N, name='x')"),
+    dict(symbol="y", dim="[]", code="y = model.addVar(name='y')"),
+    # not keyed by its dimension, so its indexing cannot be relied on
+    dict(symbol="z", dim="[N]", code="z = model.addVars(range(N), name='z')"),
+]
+
+
+@pytest.fixture
+def translator():
+    return LatexTranslator(parameters, variables)
+
+
+@pytest.mark.parametrize("formulation, code", [
+    # sums with explicit and inferred ranges
+    (r"\sum_{i=1}^{N} c_i x_i \leq B",
+     "model.addConstr(gp.quicksum(c[i] * x[i] for i in range(N)) <= B)"),
+    (r"\sum_{i=0}^{N-1} c_i x_i \leq B",
+     "model.addConstr(gp.quicksum(c[i] * x[i] for i in range(N)) <= B)"),
+    (r"\sum_i \sum_j Q_{i,j} x_i x_j \leq B",
+     "model.addConstr(gp.quicksum(gp.quicksum(Q[i, j] * x[i] * x[j] for j in range(N)) for i in range(N)) <= B)"),
+    # a quantifier, before or after the relation
+    (r"\sum_{j} A_{i,j} x_j \geq b_i \quad \forall i \in \{1,\dots,M\}",
+     "for i in range(M):\n    model.addConstr(gp.quicksum(A[i, j] * x[j] for j in range(N)) >= b[i])"),
+    (r"\forall i: \frac{x_i}{2} + y \le c_i",
+     "for i in range(N):\n    model.addConstr(x[i] / 2 + y <= c[i])"),
+    (r"x_i \cdot y \leq B \quad \text{for all } i",
+     "for i in range(N):\n    model.addConstr(x[i] * y <= B)"),
+    # chained bounds, with the variables kept on the left
+    (r"0 \leq y \leq B", "model.addConstr(y >= 0)\nmodel.addConstr(y <= B)"),
+    (r"y^2 \leq B", "model.addConstr(y ** 2 <= B)"),
+    # integrality and binary domains
+    (r"x_i \in \mathbb{Z}^+ \quad \forall i", "for i in range(N):\n    x[i].vtype = gp.GRB.INTEGER"),
+    (r"x \in \mathbb{Z}", "for v in x.values():\n    v.vtype = gp.GRB.INTEGER"),
+    (r"y \in \{0,1\}", "y.vtype = gp.GRB.BINARY"),
+    # commands that lost their backslash
+    (r"sum_{i=1}^{N} c_i x_i leq B",
+     "model.addConstr(gp.quicksum(c[i] * x[i] for i in range(N)) <= B)"),
+])
+def test_constraint(translator, formulation, code):
+    assert translator.translate("constraints", dict(formulation=formulation)) == code
+
+
+@pytest.mark.parametrize("formulation, description, code", [
+    (r"\max \sum_{i=1}^{N} c_i x_i", "",
+     "model.setObjective(gp.quicksum(c[i] * x[i] for i in range(N)), gp.GRB.MAXIMIZE)"),
+    (r"\text{Minimize } 3 y + B", "",
+     "model.setObjective(3 * y + B, gp.GRB.MINIMIZE)"),
+    (r"Z = 3 y + \sum_i c_i x_i", "maximize the profit",
+     "# maximize the profit\nmodel.setObjective(3 * y + gp.quicksum(c[i] * x[i] for i in range(N)), gp.GRB.MAXIMIZE)"),
+])
+def test_objective(translator, formulation, description, code):
+    assert translator.translate("objective", dict(formulation=formulation, description=description)) == code
+
+
+@pytest.mark.parametrize("target, formulation", [
+    # shifted indices
+    ("constraints", r"x_{i+1} \geq x_i \quad \forall i"),
+    # subsets of a range
+    ("constraints", r"x_i \leq 1 \quad \forall i \in S"),
+    ("constraints", r"x_i \leq 1 \quad \forall i \in \{2,\dots,N\}"),
+    ("constraints", r"\sum_{i=2}^{N} x_i \leq 1"),
+    # beyond quadratic
+    ("constraints", r"y^3 \leq B"),
+    ("constraints", r"x_i x_j y \leq B \quad \forall i"),
+    # symbols not matching their dimensions
+    ("constraints", r"x_i \leq B"),
+    ("constraints", r"x_{i,j} \leq B \quad \forall i"),
+    ("constraints", r"z_i \leq B \quad \forall i"),
+    # unknown symbols and commands
+    ("constraints", r"w \leq B"),
+    ("constraints", r"\log(y) \leq 1"),
+    # no variable, several quantifiers, no direction
+    ("constraints", r"c_i \leq B \quad \forall i"),
+    ("constraints", r"x_i \leq 1 \quad \forall i \quad \forall j"),
+    ("objective", r"\sum_i c_i x_i"),
+])
+def test_untranslatable(translator, target, formulation):
+    assert translator.translate(target, dict(formulation=formulation, description="")) is None
+
+
+def test_translation_runs():
+    gp = pytest.importorskip("gurobipy")
+    np = pytest.importorskip("numpy")
+    translator = LatexTranslator(parameters, variables)
+    env = dict(gp=gp, model=gp.Model("model"), N=2, M=1, B=4, c=np.array([1, 2]), b=np.array([1]),
+               A=np.array([[1, 1]]), Q=np.eye(2))
+    env["model"].Params.OutputFlag = 0
+    for variable in variables:
+        exec(variable["code"], env, env)
+    for formulation in [r"\sum_{j} A_{i,j} x_j \leq B \quad \forall i", r"x_i \in \mathbb{Z}^+ \quad \forall i"]:
+        exec(translator.translate("constraints", dict(formulation=formulation)), env, env)
+    exec(translator.translate("objective", dict(formulation=r"\max \sum_{i=1}^{N} c_i x_i")), env, env)
+    env["model"].optimize()
+    assert env["model"].objVal == pytest.approx(8)
+
+
+def test_parse_dims():
+    assert parse_dims("[M, N]") == ["M", "N"]
+    assert parse_dims("[]") == []
+    assert parse_dims(None) == []
+    assert parse_dims(["N"]) == ["N"]
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from tests.stubs import make_client
+from utils.ModelCall import model_call
+
+
+@pytest.mark.parametrize("seed", [None, 3])
+def test_rejected_response_is_reprompted(cache, seed):
+    client, completions = make_client(["not json", '{"a": 1}'])
+    res = model_call(client, "prompt", seed=seed, parse=json.loads)
+
+    assert res == {"a": 1}
+    assert len(completions.seeds) == 2
+    assert completions.seeds[0] != completions.seeds[1]
+
+
+def test_rejected_response_is_not_cached(cache):
+    client, completions = make_client(["not json", '{"a": 1}'])
+    model_call(client, "prompt", parse=json.loads)
+
+    # a new call with the same prompt is not served the rejected response
+    client, completions = make_client(['{"a": 2}'])
+    assert model_call(client, "prompt", parse=json.loads) == {"a": 2}
+    assert cache.stats["writes"] == 2
+
+
+def test_accepted_response_is_cached(cache):
+    client, completions = make_client(['{"a": 1}'])
+    assert model_call(client, "prompt", parse=json.loads) == {"a": 1}
+    assert model_call(client, "prompt", parse=json.loads) == {"a": 1}
+    assert len(completions.seeds) == 1
+
+
+def test_attempts_are_bounded(cache):
+    client, completions = make_client(["bad"] * 5)
+    with pytest.raises(RuntimeError, match="Model call failure"):
+        model_call(client, "prompt", parse=json.loads, max_attempts=2)
+    assert len(completions.seeds) == 2
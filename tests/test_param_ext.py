@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+from tests.stubs import make_client
+from frontend import ParamExt
+
+
+def response(*symbols):
+    return json.dumps([dict(symbol=symbol, dim="[]", description=f"the {symbol}") for symbol in symbols])
+
+
+def test_only_missing_parameters_are_rerequested(cache):
+    client, completions = make_client([response("a", "b"), "[]", response("c")])
+    params = ParamExt(client).extract("desc", [("a", "[]"), ("b", "[]"), ("c", "[N]")])
+
+    assert [param["symbol"] for param in params] == ["a", "b", "c"]
+    assert params[2]["dim"] == "[N]"
+    # a round accepting nothing is re-requested with a seed of its own
+    assert completions.seeds == [5, 3, 1]
+
+
+def test_rounds_do_not_multiply_attempts(cache):
+    # every round resends one rejected response, and "b" never comes back
+    client, completions = make_client(["bad", response("a")] + ["bad", "[]"] * 3)
+    with pytest.raises(RuntimeError):
+        ParamExt(client, maximum_retries=3).extract("desc", [("a", "[]"), ("b", "[]")])
+
+    assert completions.seeds == [5, 4, 3, 2, 1, 0, -1, -2]
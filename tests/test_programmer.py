@@ -0,0 +1,12 @@
+import warnings
+import importlib
+
+
+def test_templates_have_no_invalid_escapes():
+    path = importlib.import_module("backend.Programmer").__file__
+    with open(path) as f:
+        source = f.read()
+    with warnings.catch_warnings():
+        # invalid escapes warn when the module is compiled
+        warnings.simplefilter("error")
+        compile(source, path, "exec")
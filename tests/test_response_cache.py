@@ -0,0 +1,38 @@
+from utils.ResponseCache import ResponseCache
+
+
+def total(cache):
+    return cache.conn.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+
+def test_total_follows_writes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    cache.put("a", "x" * 10)
+    cache.put("b", "x" * 20)
+    cache.put("a", "x" * 5)
+    assert total(cache) == 25
+    assert cache.get("a") == "x" * 5
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=30)
+    for key in ["a", "b", "c"]:
+        cache.put(key, "x" * 10)
+    cache.get("a")
+    cache.put("d", "x" * 10)
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+    assert total(cache) == 30
+
+
+def test_total_of_an_existing_cache(tmp_path):
+    # a cache file written before the totals were kept
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path)
+    cache.put("a", "x" * 10)
+    cache.conn.execute("DROP TABLE totals")
+    cache.conn.commit()
+    cache.close()
+
+    assert total(ResponseCache(path)) == 10
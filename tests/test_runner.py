@@ -0,0 +1,38 @@
+import sys
+
+from utils import Runner
+from utils.Journal import config_hash
+
+
+def test_run_main_passes_the_options(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Runner.DatasetRunner, "run", lambda self, problems: calls.append((self, problems)) or [])
+    monkeypatch.setattr(sys, "argv", [
+        "run_lpwp.py", "--journal", str(tmp_path / "journal.jsonl"), "--deadline", "60",
+        "--exec-timeout", "5", "--processes", "2"
+    ])
+
+    def run(client, data_path, budget_limits=None):
+        pass
+
+    Runner.run_main(run, None, lambda: ["a", "b"], config=dict(runner="run_lpwp"), stage_files=["state.json"])
+
+    runner, problems = calls[0]
+    assert problems == ["a", "b"]
+    assert runner.processes == 2
+    assert runner.stage_files == ["state.json"]
+    assert runner.run_fn.keywords == dict(budget_limits=dict(deadline=60.0))
+    assert runner.journal.config_hash == config_hash(dict(runner="run_lpwp", deadline=60.0))
+    assert runner.pool_factory.keywords["timeout"] == 5
+
+
+def test_run_main_without_budget(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(Runner.DatasetRunner, "run", lambda self, problems: calls.append(self) or [])
+    monkeypatch.setattr(sys, "argv", ["run_lpwp_standard.py", "--journal", str(tmp_path / "journal.jsonl")])
+
+    def run(client, data_path, pool=None):
+        pass
+
+    Runner.run_main(run, None, list, config=dict(runner="run_lpwp_standard"), budget=False)
+    assert calls[0].run_fn is run
@@ -0,0 +1,49 @@
+import pytest
+
+from backend.Sandbox import SandboxPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with SandboxPool(size=1, timeout=3, memory_limit=2 * 1024 ** 3, preload=["numpy"]) as pool:
+        yield pool
+
+
+def test_outputs_and_stdout(pool):
+    res = pool.run(["x = 1", "print('hello')\ny = x + 1"], outputs=["y"], env=dict(z=3))
+
+    assert res["success"]
+    assert res["outputs"]["y"] == 2
+    assert "hello" in res["stdout"]
+    assert len(res["step_times"]) == 2
+
+
+def test_native_stdout_is_captured(pool):
+    res = pool.run(["import os\nos.write(1, b'native output\\n')"])
+    assert "native output" in res["stdout"]
+
+
+def test_failing_step(pool):
+    res = pool.run(["x = 1", "raise ValueError('broken')", "y = 2"], outputs=["y"])
+
+    assert not res["success"]
+    assert res["failed_step"] == 1
+    assert "ValueError: broken" in res["error_message"]
+
+
+def test_timeout_respawns_the_worker(pool):
+    res = pool.run(["x = 1", "while True:\n    pass"], timeout=1)
+
+    assert not res["success"]
+    assert res["failed_step"] == 1
+    assert res["error_message"].startswith("TimeoutError")
+    # the worker was replaced and runs the next job
+    assert pool.run(["x = 1"], outputs=["x"])["outputs"]["x"] == 1
+
+
+def test_memory_limit(pool):
+    res = pool.run(["x = bytearray(4 * 1024 ** 3)"])
+
+    assert not res["success"]
+    assert "MemoryError" in res["error_message"]
+    assert pool.run(["x = 1"], outputs=["x"])["success"]
@@ -0,0 +1,116 @@
+import time
+import threading
+import contextvars
+
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+__current = contextvars.ContextVar("budget", default=None)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Budget:
+    # Limits on the model calls of one problem: the number of (uncached)
+    # calls, the tokens they use and a wall-clock deadline in seconds from the
+    # creation of the budget. None means unlimited. Once less than `reserve`
+    # of any limit is left the budget is low, and optional work (reflection)
+    # is skipped to keep the rest for solving.
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_calls: Optional[int] = None,
+        deadline: Optional[float] = None,
+        reserve: Optional[float] = 0.2
+    ):
+        self.max_tokens = max_tokens
+        self.max_calls = max_calls
+        self.deadline = deadline
+        self.reserve = reserve
+        self.start = time.time()
+        self.tokens = 0
+        self.calls = 0
+        # charged from the worker threads of concurrent stages
+        self.lock = threading.Lock()
+
+    def charge(self, tokens: Optional[int] = 0, calls: Optional[int] = 0):
+        with self.lock:
+            self.tokens += tokens
+            self.calls += calls
+
+    def elapsed(self) -> float:
+        return time.time() - self.start
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - self.elapsed(), 0.0)
+
+    def __used(self) -> Dict[str, float]:
+        # fraction of every limit used so far
+        used = {}
+        if self.max_calls is not None:
+            used["calls"] = self.calls / max(self.max_calls, 1)
+        if self.max_tokens is not None:
+            used["tokens"] = self.tokens / max(self.max_tokens, 1)
+        if self.deadline is not None:
+            used["time"] = self.elapsed() / max(self.deadline, 1e-9)
+        return used
+
+    def exhausted(self) -> Optional[str]:
+        if self.max_calls is not None and self.calls >= self.max_calls:
+            return f"{self.calls}/{self.max_calls} model calls used"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return f"{self.tokens}/{self.max_tokens} tokens used"
+        if self.deadline is not None and self.elapsed() >= self.deadline:
+            return f"deadline of {self.deadline}s passed"
+        return None
+
+    def low(self) -> bool:
+        return any(used >= 1.0 - self.reserve for used in self.__used().values())
+
+    def check(self):
+        reason = self.exhausted()
+        if reason is not None:
+            raise BudgetExceeded(f"Budget exhausted: {reason}")
+
+    def usage(self) -> Dict:
+        return dict(calls=self.calls, tokens=self.tokens, wall_time=self.elapsed())
+
+
+@contextmanager
+def use_budget(budget: Optional[Budget]):
+    # Makes budget the one charged by every model call made inside the block,
+    # including the worker threads of parallel_map. Without a budget the
+    # enclosing one (if any) stays in effect.
+    if budget is None:
+        yield __current.get()
+        return
+    token = __current.set(budget)
+    try:
+        yield budget
+    finally:
+        __current.reset(token)
+
+def current_budget() -> Optional[Budget]:
+    return __current.get()
+
+def charge(tokens: Optional[int] = 0, calls: Optional[int] = 0):
+    budget = __current.get()
+    if budget is not None:
+        budget.charge(tokens=tokens, calls=calls)
+
+def check_budget():
+    budget = __current.get()
+    if budget is not None:
+        budget.check()
+
+def budget_low() -> bool:
+    budget = __current.get()
+    return budget is not None and budget.low()
+
+def remaining_time() -> Optional[float]:
+    budget = __current.get()
+    return None if budget is None else budget.remaining_time()
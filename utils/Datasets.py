@@ -0,0 +1,169 @@
+import os
+import json
+import zipfile
+
+from typing import Dict, Optional, List
+from utils.Runner import write_atomic
+
+
+class DirectorySource:
+    def __init__(self, root: str):
+        self.root = root
+
+    def names(self) -> List[str]:
+        names = []
+        for d, _, files in os.walk(self.root):
+            rel = os.path.relpath(d, self.root).replace(os.sep, "/")
+            names += [name if rel == "." else f"{rel}/{name}" for name in files]
+        return names
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.root, name), "rb") as f:
+            return f.read()
+
+
+class ZipSource:
+    # The archive is opened lazily and reopened in a forked/spawned process,
+    # since a ZipFile handle must not be shared between processes.
+    def __init__(self, path: str):
+        self.path = path
+        self.zf = None
+        self.pid = None
+        self.prefix = ""
+
+    def __zip(self) -> zipfile.ZipFile:
+        if self.zf is None or self.pid != os.getpid():
+            self.zf = zipfile.ZipFile(self.path)
+            self.pid = os.getpid()
+        return self.zf
+
+    def names(self) -> List[str]:
+        names = [name for name in self.__zip().namelist() if not name.endswith("/")]
+        # members are stored under the archive's top-level folder
+        tops = {name.split("/")[0] for name in names}
+        self.prefix = f"{tops.pop()}/" if len(tops) == 1 else ""
+        return [name[len(self.prefix):] for name in names]
+
+    def read(self, name: str) -> bytes:
+        return self.__zip().read(self.prefix + name)
+
+
+class Dataset:
+    name = None
+    # extracted directory, used when present, and the archive shipped instead
+    root = None
+    archive = None
+    # problems live in branch directories (root/branch/problem)
+    branched = False
+    desc_path = "description.txt"
+    input_json_path = None
+    gt_path = None
+    # modules with the run(client, data_path, ...) function of every mode
+    runners = {}
+    # outputs of the mode's stages an interrupted run can resume from
+    stage_files = {}
+
+    def __init__(self, root: Optional[str] = None, results: Optional[str] = None):
+        # Problems are keyed by their path inside the dataset (prob_0 or
+        # branch/problem_1); their inputs are read from the directory or the
+        # zip archive, and everything a run writes goes to results/<key>.
+        root = root or (self.root if os.path.isdir(self.root) else self.archive)
+        self.source = ZipSource(root) if root.endswith(".zip") else DirectorySource(root)
+        self.results = results or f"results/{self.name}"
+        self.index = None
+
+    def __build_index(self) -> Dict[str, Dict[str, str]]:
+        index = {}
+        for name in self.source.names():
+            parts = name.split("/")
+            if len(parts) != (3 if self.branched else 2):
+                continue
+            index.setdefault("/".join(parts[:-1]), {})[parts[-1]] = name
+        return {
+            prob: members for prob, members in sorted(index.items())
+            if self.desc_path in members and self.gt_path in members and self.has_input(members)
+        }
+
+    def has_input(self, members: Dict[str, str]) -> bool:
+        return self.input_json_path in members
+
+    def problems(self) -> List[str]:
+        if self.index is None:
+            self.index = self.__build_index()
+        return list(self.index.keys())
+
+    def members(self, prob: str) -> Dict[str, str]:
+        if self.index is None:
+            self.index = self.__build_index()
+        return self.index[prob]
+
+    def branch(self, prob: str) -> Optional[str]:
+        if not self.branched:
+            return None
+        return prob.split("/")[0]
+
+    def read(self, prob: str, name: str) -> str:
+        return self.source.read(self.members(prob)[name]).decode("utf-8")
+
+    def output_dir(self, prob: str) -> str:
+        return f"{self.results}/{prob}"
+
+    def materialize(self, prob: str) -> str:
+        # writes the inputs a run reads from disk (the generated code loads
+        # the data file by path) next to its outputs, once
+        out = self.output_dir(prob)
+        os.makedirs(out, exist_ok=True)
+        for name in [self.desc_path, self.input_json_path]:
+            if not os.path.exists(f"{out}/{name}"):
+                write_atomic(f"{out}/{name}", self.read(prob, name))
+        return out
+
+    def ground_truth(self, prob: str):
+        raise NotImplementedError
+
+
+class LPWPDataset(Dataset):
+    name = "lpwp"
+    root = "dataset/LPWP"
+    archive = "dataset/LPWP.zip"
+    input_json_path = "input.json"
+    gt_path = "output.json"
+    runners = dict(pipeline="run_lpwp", standard="run_lpwp_standard")
+    stage_files = dict(pipeline=["pred_state_10.json"])
+
+    def has_input(self, members: Dict[str, str]) -> bool:
+        return self.input_json_path in members or "sample.json" in members
+
+    def read(self, prob: str, name: str) -> str:
+        # the archive only has sample.json, which preprocess.py splits into
+        # input.json and output.json
+        if name == self.input_json_path and name not in self.members(prob):
+            return json.dumps(json.loads(super().read(prob, "sample.json"))[0]["input"], indent=4)
+        return super().read(prob, name)
+
+    def ground_truth(self, prob: str):
+        return json.loads(self.read(prob, self.gt_path))[0]
+
+
+class NLP4LPDataset(Dataset):
+    name = "nlp4lp"
+    root = "dataset/nlp4lp_oct_23_2023"
+    archive = "dataset/nlp4lp_oct_23_2023.zip"
+    branched = True
+    input_json_path = "data.json"
+    gt_path = "obj.txt"
+    runners = dict(pipeline="run_nlp4lp", standard="run_nlp4lp_standard")
+    stage_files = dict(pipeline=["pred_state_40.json"])
+
+    def ground_truth(self, prob: str):
+        return float(self.read(prob, self.gt_path).strip()[5:])
+
+
+datasets = {
+    dataset.name: dataset for dataset in [LPWPDataset, NLP4LPDataset]
+}
+
+def get_dataset(name: str, root: Optional[str] = None, results: Optional[str] = None) -> Dataset:
+    if name not in datasets:
+        raise Exception(f"Dataset {name} is not supported yet!")
+    return datasets[name](root=root, results=results)
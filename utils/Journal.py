@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+
+from typing import Dict, Optional, List
+
+
+def config_hash(config: Dict) -> str:
+    content = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class RetryPolicy:
+    # errors: the run raised, crashed, timed out or was interrupted (quota
+    # and connection problems end up here) and are retried by default.
+    # failures: the run finished without a solution, which a rerun with the
+    # same configuration rarely changes.
+    def __init__(
+        self,
+        max_attempts: Optional[int] = 3,
+        retry_errors: Optional[bool] = True,
+        retry_failures: Optional[bool] = False
+    ):
+        self.max_attempts = max_attempts
+        self.retry_errors = retry_errors
+        self.retry_failures = retry_failures
+
+
+class RunJournal:
+    # Append-only JSONL journal of benchmark runs. Every entry is keyed by the
+    # problem path (dataset/branch/problem) and the hash of the run config,
+    # so changing the config starts the problems over.
+    def __init__(self, path: str, config: Dict, policy: Optional[RetryPolicy] = None):
+        self.path = path
+        self.config = config
+        self.config_hash = config_hash(config)
+        self.policy = policy or RetryPolicy()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a line cut short by a crash
+                        continue
+                    self.__add(entry)
+
+    def __add(self, entry: Dict):
+        if entry.get("config") == self.config_hash:
+            self.entries.setdefault(entry["problem"], []).append(entry)
+
+    def append(self, problem: str, event: str, **fields):
+        entry = dict(ts=time.time(), config=self.config_hash, problem=problem, event=event, **fields)
+        line = json.dumps(entry, default=str) + "\n"
+        with open(self.path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.__add(entry)
+
+    def started(self, problem: str):
+        attempt = self.attempts(problem) + 1
+        self.append(problem, "started", attempt=attempt)
+
+    def finished(self, record: Dict):
+        self.append(
+            record["problem"],
+            "finished",
+            **{key: value for key, value in record.items() if key != "problem"}
+        )
+
+    def attempts(self, problem: str) -> int:
+        return sum(entry["event"] == "started" for entry in self.entries.get(problem, []))
+
+    def last_record(self, problem: str) -> Optional[Dict]:
+        for entry in reversed(self.entries.get(problem, [])):
+            if entry["event"] == "finished":
+                return entry
+        return None
+
+    def should_run(self, problem: str) -> bool:
+        entries = self.entries.get(problem, [])
+        if not entries:
+            return True
+        record = self.last_record(problem)
+        if record is not None and record["success"]:
+            return False
+        if self.attempts(problem) >= self.policy.max_attempts:
+            return False
+        if entries[-1]["event"] == "started" or record is None or record.get("error_message"):
+            # interrupted or raised
+            return self.policy.retry_errors
+        return self.policy.retry_failures
+
+    def resumable(self, problem: str, stage_paths: List[str]) -> bool:
+        # Saved stage outputs are reused when they were written by an earlier
+        # attempt under the same config.
+        entries = self.entries.get(problem, [])
+        if not entries:
+            return False
+        since = entries[0]["ts"]
+        return any(os.path.exists(path) and os.path.getmtime(path) >= since for path in stage_paths)
@@ -0,0 +1,160 @@
+import re
+import ast
+import json
+import threading
+
+from typing import Any, Callable, Dict, Optional, List
+from utils import Trace
+
+# LaTeX commands starting with a letter that also forms a valid JSON escape
+# (\b, \f, \n, \r, \t); "\times" in a formulation is meant literally, not as
+# a tab followed by "imes"
+latex_commands = re.compile(
+    r"(?:b(?:eta|ar|ig[lr]?|inom|oldsymbol|mod|f)|f(?:rac|orall)"
+    r"|n(?:u|eq?|abla|ot(?:in)?|eg|mid|olimits)|r(?:ight|ho|angle|floor|ceil|m)"
+    r"|t(?:imes|ext(?:bf|rm|it)?|heta|au|op|frac|ilde|o|riangle))(?![A-Za-z])"
+)
+python_literals = {"True": "true", "False": "false", "None": "null"}
+
+# parsed: responses a JSON value was extracted from, repaired: of those, the
+# ones plain json.loads rejected (each a re-prompt avoided), failed: none found
+parse_stats = dict(parsed=0, repaired=0, failed=0)
+__stats_lock = threading.Lock()
+
+
+def __count(**counts):
+    with __stats_lock:
+        for name, value in counts.items():
+            parse_stats[name] += value
+    Trace.record(**{f"json_{name}": value for name, value in counts.items()})
+
+def get_parse_stats() -> Dict:
+    with __stats_lock:
+        return dict(parse_stats)
+
+def __balanced(text: str, start: int) -> str:
+    # the JSON value opened at text[start], up to its closing bracket (or the
+    # end of a truncated response)
+    depth = 0
+    in_string = False
+    i = start
+    while i < len(text):
+        c = text[i]
+        if in_string:
+            if c == "\\":
+                i += 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in "[{":
+            depth += 1
+        elif c in "]}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        i += 1
+    return text[start:]
+
+def __candidates(text: str) -> List[str]:
+    # fenced blocks first, then the first bracketed value of the response
+    candidates = [block.strip() for block in re.findall(r"```(?:json|JSON)?\s*\n?(.*?)```", text, re.S)]
+    if "```json" in text:
+        # an unterminated fence
+        candidates.append(text[text.find("```json") + 7:].replace("```", "").strip())
+    for source in candidates + [text]:
+        starts = [i for i in [source.find("{"), source.find("[")] if i >= 0]
+        if starts:
+            candidates.append(__balanced(source, min(starts)))
+    candidates.append(text.strip())
+    unique = []
+    for candidate in candidates:
+        if candidate and candidate not in unique:
+            unique.append(candidate)
+    return unique
+
+def repair(text: str) -> str:
+    # Single pass over the text fixing what models commonly get wrong:
+    # lone backslashes in strings (LaTeX), trailing commas and Python
+    # literals outside of strings.
+    out = []
+    in_string = False
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if in_string:
+            if c == "\\":
+                nxt = text[i + 1:i + 2]
+                if nxt in ['"', "\\", "/"] \
+                        or (nxt == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[i + 2:i + 6])) \
+                        or (nxt and nxt in "bfnrt" and not latex_commands.match(text, i + 1)):
+                    out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                out.append("\\\\")
+            else:
+                if c == '"':
+                    in_string = False
+                out.append(c)
+            i += 1
+            continue
+
+        if c == '"':
+            in_string = True
+        elif c == "," and re.match(r",\s*[}\]]", text[i:]):
+            i += 1
+            continue
+        else:
+            m = re.match(r"(True|False|None)(?![A-Za-z0-9_])", text[i:])
+            if m and not (out and re.match(r"[A-Za-z0-9_]", out[-1])):
+                out.append(python_literals[m.group(1)])
+                i += len(m.group(1))
+                continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+def extract_json(text: str) -> Any:
+    # The JSON value in a model response, repaired locally where possible
+    # instead of re-prompting; raises ValueError if there is none.
+    for candidate in __candidates(text):
+        repaired = repair(candidate)
+        try:
+            value = json.loads(repaired, strict=False)
+        except json.JSONDecodeError:
+            continue
+        try:
+            json.loads(candidate)
+        except json.JSONDecodeError:
+            # plain json.loads rejects it, which used to cost a re-prompt
+            __count(parsed=1, repaired=1)
+            return value
+        __count(parsed=1)
+        return value
+
+    for candidate in __candidates(text):
+        # single-quoted, Python-style output
+        try:
+            value = ast.literal_eval(candidate)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+        if isinstance(value, (dict, list)):
+            __count(parsed=1, repaired=1)
+            return value
+    __count(failed=1)
+    raise ValueError("No JSON value found in the response.")
+
+def json_parser(expect: Optional[type] = None, validate: Optional[Callable] = None) -> Callable:
+    # A parse callback for model_call: extracts the JSON value of the
+    # response, checks its type and passes it through validate (which may
+    # transform it). Anything raised makes model_call re-prompt.
+    def parse(response: str) -> Any:
+        value = extract_json(response)
+        if expect is list and isinstance(value, dict) and len(value) == 1 \
+                and isinstance(next(iter(value.values())), list):
+            # a list wrapped in an object, as JSON mode asks for
+            value = next(iter(value.values()))
+        if expect is not None and not isinstance(value, expect):
+            raise ValueError(f"Expected a JSON {expect.__name__}, got {type(value).__name__}.")
+        return value if validate is None else validate(value)
+    return parse
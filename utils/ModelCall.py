@@ -1,47 +1,166 @@
 import openai
 import google.generativeai as genai
 import time
+import asyncio
+import threading
+import contextvars
 
-from typing import Dict, Optional, Union, List
+from concurrent.futures import ThreadPoolExecutor
+from utils import RateLimit, Trace, Budget
+from utils.ResponseCache import ResponseCache
+from utils.ReplayClient import ReplayClient, ReplayMiss, TranscriptRecorder
+from typing import Callable, Dict, Optional, Union, List
 
-def __openai_call(
-    client, 
-    prompt: Union[str, List], 
-    model: Optional[str] = "gpt-3.5-turbo"
-) -> str:
+# Maximum number of in-flight requests per provider, shared by every stage
+# (sync or async) in the process.
+concurrency_limits = {
+    "openai": 8,
+    "google": 4,
+}
+__semaphores = {}
+__semaphores_lock = threading.Lock()
+__cache = None
+__recorder = None
+# Attempts of one logical call, shared by provider errors and rejected
+# responses, and the longest Retry-After a rate-limited call waits for.
+retry_policy = dict(
+    max_attempts={"openai": 3, "google": 5, "replay": 3},
+    max_retry_after=120.0
+)
+# seed the requests of unseeded calls are sent with
+default_seed = 3
+# Providers whose JSON mode model_call(json_mode=True) turns on; gemini-pro
+# does not accept response_mime_type (the 1.5 models do).
+json_modes = {
+    "openai": True,
+    "google": False,
+}
+# calls made by this process (cached ones are also counted as calls)
+call_stats = dict(calls=0, cached=0, latency=0.0)
+__stats_lock = threading.Lock()
+
+def set_concurrency(provider: str, limit: Optional[int] = None, semaphore=None):
+    # A shared semaphore (e.g. a multiprocessing one) may be injected to cap
+    # the provider across processes instead of per process.
+    with __semaphores_lock:
+        if semaphore is None:
+            concurrency_limits[provider] = limit
+            semaphore = threading.BoundedSemaphore(limit) if limit else None
+        __semaphores[provider] = semaphore
+
+def __get_semaphore(provider: str):
+    with __semaphores_lock:
+        if provider not in __semaphores:
+            limit = concurrency_limits.get(provider)
+            __semaphores[provider] = threading.BoundedSemaphore(limit) if limit else None
+        return __semaphores[provider]
+
+def __status_code(e: Exception) -> Optional[int]:
+    for code in [
+        getattr(e, "status_code", None),
+        getattr(e, "code", None),
+        getattr(getattr(e, "response", None), "status_code", None),
+    ]:
+        try:
+            return int(code)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, (TimeoutError, ConnectionError, openai.APIConnectionError)):
+        return True
+    code = __status_code(e)
+    return code is not None and (code in (408, 429) or code >= 500)
+
+def is_transient(e: BaseException) -> bool:
+    # whether a retryable provider error is behind e, following the chain of
+    # exceptions raised while handling it (e.g. "Model call failure.")
+    seen = set()
+    while e is not None and id(e) not in seen:
+        seen.add(id(e))
+        if isinstance(e, Exception) and is_retryable(e):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+def __retry_after(e: Exception) -> Optional[float]:
+    # seconds the provider asks to wait before the next request, if it says
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    for name, scale in [("retry-after-ms", 0.001), ("retry-after", 1.0)]:
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    delay = getattr(e, "retry_after", None)
+    return float(delay) if isinstance(delay, (int, float)) else None
+
+def classify(e: Exception) -> str:
+    # "rate_limit": wait for Retry-After (or back off) and resend
+    # "transient": server-side failure or timeout, back off and resend
+    # "fatal": the request itself is rejected (auth, bad request), fail fast
+    # "content": no usable response, re-prompt with another seed right away
+    code = __status_code(e)
+    if code == 429:
+        return "rate_limit"
+    if is_retryable(e):
+        return "transient"
+    if code is not None and 400 <= code < 500:
+        return "fatal"
+    return "content"
+
+def retry_delay(e: Exception, kind: str, attempt: int) -> float:
+    if kind == "rate_limit":
+        delay = __retry_after(e)
+        if delay is not None:
+            return min(delay, retry_policy["max_retry_after"])
+    if kind in ["rate_limit", "transient"]:
+        return RateLimit.backoff_delay(attempt)
+    return 0.0
+
+def to_messages(prompt: Union[str, List]) -> List:
     if isinstance(prompt, str):
-        prompt = [
+        return [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
-    else:
-        for p in prompt:
-            assert isinstance(p, dict)
-            assert "role" in p and "content" in p
-    
-    cnt = 3
-    while cnt > 0:
-        try:
-            time.sleep(5)
-            completion = client.chat.completions.create(
-                model=model,
-                messages=prompt,
-                seed=cnt,
-            )
-            content = completion.choices[0].message.content
-            return content
-
-        except Exception as e:
-            print(e)
-            cnt -= 1
-            if cnt == 0:
-                raise RuntimeError("Model call failure.")
+    for p in prompt:
+        assert isinstance(p, dict)
+        assert "role" in p and "content" in p
+    return prompt
 
-            print(f"Error, Try another {cnt} times.")
+def __openai_call(
+    client, 
+    prompt: Union[str, List], 
+    model: Optional[str] = "gpt-3.5-turbo",
+    seed: Optional[int] = None,
+    json_mode: Optional[bool] = False
+) -> str:
+    prompt = to_messages(prompt)
+    
+    limiter = RateLimit.get_limiter("openai")
+    estimate = RateLimit.estimate_tokens("".join(p["content"] for p in prompt))
+    limiter.acquire(estimate)
+    completion = client.chat.completions.create(
+        model=model,
+        messages=prompt,
+        # a fixed seed keeps unseeded calls reproducible
+        seed=default_seed if seed is None else seed,
+        **(dict(response_format={"type": "json_object"}) if json_mode else {})
+    )
+    if completion.usage is not None:
+        limiter.adjust(completion.usage.total_tokens - estimate)
+        Budget.charge(tokens=completion.usage.total_tokens)
+        Trace.record(
+            prompt_tokens=completion.usage.prompt_tokens,
+            completion_tokens=completion.usage.completion_tokens
+        )
+    return completion.choices[0].message.content
             
 def __google_call(
     client,
-    prompt: str
+    prompt: str,
+    json_mode: Optional[bool] = False
 ) -> str:
     if isinstance(prompt, list):
         content = {}
@@ -50,33 +169,252 @@ def __google_call(
         assert "system" in content and "user" in content
         prompt = content["system"] + content["user"]
         
-    cnt = 5
-    while cnt > 0:
-        try:
-            time.sleep(0.6 * (2 ** (3 - cnt)))
-            completion = client.generate_content(prompt)
-            content = completion.text
-            print("*" * 20)
-            print(prompt)
-            print(content)
-            print("*" * 20)
-            return content
+    limiter = RateLimit.get_limiter("google")
+    estimate = RateLimit.estimate_tokens(prompt)
+    limiter.acquire(estimate)
+    if json_mode:
+        completion = client.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"}
+        )
+    else:
+        completion = client.generate_content(prompt)
+    usage = getattr(completion, "usage_metadata", None)
+    if usage is not None:
+        limiter.adjust(usage.total_token_count - estimate)
+        Budget.charge(tokens=usage.total_token_count)
+        Trace.record(
+            prompt_tokens=usage.prompt_token_count,
+            completion_tokens=usage.candidates_token_count
+        )
+    content = completion.text
+    print("*" * 20)
+    print(prompt)
+    print(content)
+    print("*" * 20)
+    return content
 
-        except Exception as e:
-            print(e)
-            cnt -= 1
-            if cnt == 0:
-                raise RuntimeError("Model call failure.")
-            
-            print(f"Error, Try another {cnt} times.")
+def __replay_call(
+    client: ReplayClient,
+    prompt: Union[str, List],
+    seed: Optional[int] = None
+) -> str:
+    return client.complete(to_messages(prompt), seed=seed)
 
-def model_call(client, prompt: Union[str, List], model: Optional[str] = None):
+def get_provider(client) -> str:
     if isinstance(client, openai.Client):
-        if model:
-            return __openai_call(client, prompt, model)
-        else:
-            return __openai_call(client, prompt)
+        return "openai"
     elif isinstance(client, genai.GenerativeModel):
-        return __google_call(client, prompt)
+        return "google"
+    elif isinstance(client, ReplayClient):
+        return "replay"
     else:
-        raise NotImplementedError("Unknown client")
\ No newline at end of file
+        raise NotImplementedError("Unknown client")
+
+def set_cache(cache: Optional[ResponseCache]):
+    global __cache
+    __cache = cache
+
+def get_cache() -> Optional[ResponseCache]:
+    return __cache
+
+def set_recorder(recorder: Optional[TranscriptRecorder]):
+    global __recorder
+    __recorder = recorder
+
+def __record(client, provider: str, model: Optional[str], prompt, seed: Optional[int], response: str, latency: float):
+    recorder = __recorder
+    if recorder is not None and provider != "replay":
+        recorder.record(
+            provider=provider,
+            model=__model_name(client, provider, model),
+            messages=to_messages(prompt),
+            seed=seed,
+            response=response,
+            latency=latency
+        )
+
+def __count(latency: float, cached: bool = False):
+    with __stats_lock:
+        call_stats["calls"] += 1
+        call_stats["cached"] += int(cached)
+        call_stats["latency"] += latency
+
+def __trace(prompt, response: str, latency: float, cached: bool = False):
+    Trace.record(
+        calls=1,
+        cached_calls=int(cached),
+        prompt_chars=sum(len(p["content"]) for p in to_messages(prompt)),
+        response_chars=len(response),
+        model_time=latency
+    )
+
+def get_call_stats() -> Dict:
+    with __stats_lock:
+        return dict(call_stats)
+
+def __model_name(client, provider: str, model: Optional[str]) -> str:
+    if provider in ["google", "replay"]:
+        return client.model_name
+    return model if model else "gpt-3.5-turbo"
+
+def __attempt(
+    client,
+    provider: str,
+    prompt: Union[str, List],
+    model: Optional[str],
+    seed: Optional[int],
+    json_mode: bool,
+    parse: Optional[Callable]
+):
+    # Returns parse(response), or the response itself without parse. Only
+    # responses parse accepts are cached.
+    cache, key = __cache, None
+    if cache is not None:
+        # responses in JSON mode are cached apart from free-form ones
+        model_name = __model_name(client, provider, model) + ("+json" if json_mode else "")
+        key = cache.key(provider, model_name, to_messages(prompt), seed)
+        response = cache.get(key)
+        if response is not None:
+            __count(0.0, cached=True)
+            __trace(prompt, response, 0.0, cached=True)
+            __record(client, provider, model, prompt, seed, response, 0.0)
+            return response if parse is None else parse(response)
+
+    # cached responses are free, only calls reaching the provider are budgeted
+    Budget.check_budget()
+    semaphore = __get_semaphore(provider)
+    if semaphore is not None:
+        semaphore.acquire()
+    start = time.time()
+    try:
+        Budget.charge(calls=1)
+        if provider == "openai":
+            if model:
+                response = __openai_call(client, prompt, model, seed=seed, json_mode=json_mode)
+            else:
+                response = __openai_call(client, prompt, seed=seed, json_mode=json_mode)
+        elif provider == "google":
+            response = __google_call(client, prompt, json_mode=json_mode)
+        else:
+            response = __replay_call(client, prompt, seed=seed)
+    finally:
+        if semaphore is not None:
+            semaphore.release()
+    latency = time.time() - start
+    __count(latency)
+    __trace(prompt, response, latency)
+    if provider == "replay":
+        # transcripts carry no token usage
+        Budget.charge(tokens=RateLimit.estimate_tokens(
+            "".join(p["content"] for p in to_messages(prompt)) + response
+        ))
+
+    __record(client, provider, model, prompt, seed, response, latency)
+    result = response if parse is None else parse(response)
+    if key is not None:
+        cache.put(key, response, provider=provider, model=__model_name(client, provider, model))
+    return result
+
+def model_call(
+    client,
+    prompt: Union[str, List],
+    model: Optional[str] = None,
+    seed: Optional[int] = None,
+    parse: Optional[Callable] = None,
+    max_attempts: Optional[int] = None,
+    json_mode: Optional[bool] = False
+):
+    # One retry budget per logical call: failed requests and responses that
+    # `parse` rejects (by raising) use up the same max_attempts. A rejected
+    # response is re-prompted with the next lower seed, while a resent
+    # request keeps its seed (and cache key); an unseeded call counts down
+    # from default_seed. Returns parse(response), or the response itself
+    # without parse. json_mode asks providers that support it (json_modes)
+    # for a JSON object.
+    provider = get_provider(client)
+    max_attempts = max_attempts or retry_policy["max_attempts"][provider]
+    json_mode = bool(json_mode and json_modes.get(provider))
+    attempt_seed = seed
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return __attempt(client, provider, prompt, model, attempt_seed, json_mode, parse)
+
+        except (Budget.BudgetExceeded, ReplayMiss):
+            raise
+
+        except Exception as e:
+            print(e)
+            kind = classify(e)
+            if kind == "fatal" or attempt == max_attempts:
+                raise RuntimeError("Model call failure.") from e
+
+            print(f"Error ({kind}), Try another {max_attempts - attempt} times.")
+            Trace.record(retries=1)
+            if kind == "content":
+                attempt_seed = (default_seed if attempt_seed is None else attempt_seed) - 1
+            delay = retry_delay(e, kind, attempt)
+            if delay > 0:
+                time.sleep(delay)
+
+async def amodel_call(
+    client,
+    prompt: Union[str, List],
+    model: Optional[str] = None,
+    seed: Optional[int] = None,
+    parse: Optional[Callable] = None,
+    max_attempts: Optional[int] = None,
+    json_mode: Optional[bool] = False
+) -> str:
+    # Not async-native: model_call runs on a worker thread, so every call in
+    # flight holds a thread (and its provider slot) until it returns. The
+    # cache, rate limiter, budget and the provider slots shared across
+    # processes are all blocking, and the provider clients of the runners
+    # are the sync ones, so an async path would have to duplicate them. The
+    # provider semaphore taken inside model_call bounds how many are in
+    # flight, which keeps the thread count at the provider limits.
+    return await asyncio.to_thread(model_call, client, prompt, model, seed, parse, max_attempts, json_mode)
+
+async def agather(fn: Callable, items: List, limit: Optional[int] = None) -> List:
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def __run(item):
+        if semaphore is None:
+            return await asyncio.to_thread(fn, item)
+        async with semaphore:
+            return await asyncio.to_thread(fn, item)
+
+    return list(await asyncio.gather(*[__run(item) for item in items]))
+
+def run_sync(coro):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Called from inside a running event loop: drive the coroutine on a
+    # separate thread with its own loop instead of nesting loops.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # the copied context keeps the trace span of the caller
+        return executor.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+def parallel_map(fn: Callable, items: List, limit: Optional[int] = None) -> List:
+    # Results are returned in the order of items.
+    if limit == 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    return run_sync(agather(fn, items, limit))
+
+async def amodel_calls(
+    client,
+    prompts: List,
+    model: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[str]:
+    return await agather(lambda prompt: model_call(client, prompt, model), prompts, limit)
+
+def model_calls(
+    client,
+    prompts: List,
+    model: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[str]:
+    return parallel_map(lambda prompt: model_call(client, prompt, model), prompts, limit)
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import random
+import fcntl
+import threading
+
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Quotas in requests/min and tokens/min per provider (None means unlimited).
+rate_limits = {
+    "openai": dict(rpm=500, tpm=None),
+    "google": dict(rpm=60, tpm=None),
+}
+__limiters = {}
+__limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+
+    def refill(self, state: Dict, now: float) -> Dict:
+        if state is None:
+            return dict(level=self.capacity, ts=now)
+        level = min(self.capacity, state["level"] + (now - state["ts"]) * self.rate)
+        return dict(level=level, ts=now)
+
+    def reserve(self, state: Dict, amount: float, now: float) -> (Dict, float):
+        # The level may go negative: the caller then owns a reservation and
+        # has to wait until the bucket has refilled up to zero again.
+        state = self.refill(state, now)
+        state["level"] -= amount
+        wait = 0.0 if state["level"] >= 0 else -state["level"] / self.rate
+        return state, wait
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        lock_path: Optional[str] = None
+    ):
+        self.buckets = {}
+        if rpm:
+            self.buckets["requests"] = TokenBucket(rpm)
+        if tpm:
+            self.buckets["tokens"] = TokenBucket(tpm)
+        self.lock_path = lock_path
+        self.lock = threading.Lock()
+        self.state = {}
+
+    @contextmanager
+    def __shared_state(self):
+        # With a lock path the bucket levels live in a file guarded by flock,
+        # so every process pointing at the same path shares one quota.
+        with self.lock:
+            if self.lock_path is None:
+                yield self.state
+                return
+            with open(self.lock_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    content = f.read()
+                    state = json.loads(content) if content else {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    json.dump(state, f)
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, tokens: int = 0) -> float:
+        amounts = dict(requests=1, tokens=tokens)
+        wait = 0.0
+        with self.__shared_state() as state:
+            now = time.time()
+            for name, bucket in self.buckets.items():
+                state[name], bucket_wait = bucket.reserve(state.get(name), amounts[name], now)
+                wait = max(wait, bucket_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def adjust(self, tokens: int):
+        # Correct a token reservation once the provider reports real usage.
+        if "tokens" not in self.buckets or tokens == 0:
+            return
+        with self.__shared_state() as state:
+            state["tokens"], _ = self.buckets["tokens"].reserve(state.get("tokens"), tokens, time.time())
+
+
+def configure(
+    provider: str,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    lock_path: Optional[str] = None
+):
+    rate_limits[provider] = dict(rpm=rpm, tpm=tpm)
+    with __limiters_lock:
+        __limiters[provider] = RateLimiter(rpm=rpm, tpm=tpm, lock_path=lock_path)
+
+def get_limiter(provider: str) -> RateLimiter:
+    with __limiters_lock:
+        if provider not in __limiters:
+            lock_path = os.environ.get(f"NLOPT_{provider.upper()}_RATE_LOCK")
+            __limiters[provider] = RateLimiter(**rate_limits.get(provider, {}), lock_path=lock_path)
+        return __limiters[provider]
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    # exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,131 @@
+import json
+import time
+import random
+import hashlib
+import threading
+
+from typing import Dict, Optional, Union, List, Tuple
+
+
+class ReplayError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+def transcript_key(messages: List, seed: Optional[int] = None) -> str:
+    content = json.dumps([messages, seed], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class TranscriptRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        provider: str,
+        model: Optional[str],
+        messages: List,
+        seed: Optional[int],
+        response: str,
+        latency: float
+    ):
+        line = json.dumps(dict(
+            provider=provider,
+            model=model,
+            messages=messages,
+            seed=seed,
+            response=response,
+            latency=latency
+        ), ensure_ascii=False)
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+
+class ReplayClient:
+    # latency: None (no delay), "recorded" (recorded latency * latency_scale),
+    # a number of seconds, or a (low, high) range sampled uniformly.
+    # error_rate: probability that a call fails with one of error_codes.
+    def __init__(
+        self,
+        path: Union[str, List[str]],
+        latency: Optional[Union[str, float, Tuple[float, float]]] = None,
+        latency_scale: Optional[float] = 1.0,
+        error_rate: Optional[float] = 0.0,
+        error_codes: Optional[List[int]] = (429, 500, 503),
+        strict: Optional[bool] = True,
+        seed: Optional[int] = 0
+    ):
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.strict = strict
+        self.model_name = "replay"
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = dict(calls=0, misses=0, errors=0)
+
+        self.records = {}
+        self.cursors = {}
+        for p in [path] if isinstance(path, str) else path:
+            with open(p, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    for key in {
+                        transcript_key(record["messages"], record.get("seed")),
+                        transcript_key(record["messages"])
+                    }:
+                        self.records.setdefault(key, []).append(record)
+
+    def __lookup(self, messages: List, seed: Optional[int]) -> Optional[Dict]:
+        for key in [transcript_key(messages, seed), transcript_key(messages)]:
+            if key in self.records:
+                # repeated prompts replay their recorded responses in order,
+                # sticking to the last one once exhausted
+                records = self.records[key]
+                cursor = self.cursors.get(key, 0)
+                self.cursors[key] = cursor + 1
+                return records[min(cursor, len(records) - 1)]
+        return None
+
+    def __delay(self, record: Optional[Dict]) -> float:
+        if self.latency is None:
+            return 0.0
+        if self.latency == "recorded":
+            return (record or {}).get("latency", 0.0) * self.latency_scale
+        if isinstance(self.latency, (tuple, list)):
+            return self.rng.uniform(*self.latency)
+        return float(self.latency)
+
+    def complete(self, messages: List, seed: Optional[int] = None) -> str:
+        with self.lock:
+            self.stats["calls"] += 1
+            failed = self.rng.random() < self.error_rate
+            # a failed attempt does not consume a recorded response
+            record = None if failed else self.__lookup(messages, seed)
+            code = self.rng.choice(self.error_codes) if failed else None
+            delay = self.__delay(record)
+            if failed:
+                self.stats["errors"] += 1
+            elif record is None:
+                self.stats["misses"] += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise ReplayError(code, f"Injected replay error {code}")
+        if record is None:
+            if self.strict:
+                raise ReplayMiss("No recorded response for prompt.")
+            return ""
+        return record["response"]
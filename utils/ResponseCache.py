@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+from typing import Dict, Optional, List
+
+MODES = ["write_through", "read_only", "bypass"]
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str,
+        mode: Optional[str] = "write_through",
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        ttl: Optional[float] = None
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode {mode}, expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = dict(hits=0, misses=0, writes=0, evictions=0)
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, provider TEXT, model TEXT, response TEXT, "
+                "size INTEGER, created REAL, accessed REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.conn.commit()
+            # the total size of the responses, kept up to date by triggers so
+            # that every process writing to the cache sees the same total
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, size INTEGER)")
+            self.conn.execute(
+                "INSERT OR IGNORE INTO totals VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM responses))"
+            )
+            for name, event, change in [
+                ("insert", "INSERT", "NEW.size"),
+                ("delete", "DELETE", "-OLD.size"),
+                ("update", "UPDATE OF size", "NEW.size - OLD.size"),
+            ]:
+                self.conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS responses_{name} AFTER {event} ON responses "
+                    f"BEGIN UPDATE totals SET size = size + {change} WHERE id = 0; END"
+                )
+            self.conn.commit()
+
+    @staticmethod
+    def key(provider: str, model: Optional[str], messages: List, seed: Optional[int] = None) -> str:
+        content = json.dumps([provider, model, messages, seed], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.mode == "bypass":
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                if self.mode != "read_only":
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.conn.commit()
+                    self.stats["evictions"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if self.mode != "read_only":
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+            self.stats["hits"] += 1
+            return row[0]
+
+    def put(self, key: str, response: str, provider: Optional[str] = None, model: Optional[str] = None):
+        if self.mode != "write_through":
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            # an upsert rather than INSERT OR REPLACE, whose implicit delete
+            # would not fire the size trigger
+            self.conn.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                "provider = excluded.provider, model = excluded.model, response = excluded.response, "
+                "size = excluded.size, created = excluded.created, accessed = excluded.accessed",
+                (key, provider, model, response, size, now, now)
+            )
+            self.stats["writes"] += 1
+            self.__evict(now)
+            self.conn.commit()
+
+    def __evict(self, now: float):
+        if self.ttl is not None:
+            cur = self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self.stats["evictions"] += cur.rowcount
+        if self.max_bytes is None:
+            return
+        total = self.conn.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+        while total > self.max_bytes:
+            # least recently used entries go first
+            rows = self.conn.execute(
+                "SELECT key, size FROM responses ORDER BY accessed ASC LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats["evictions"] += 1
+                total -= size
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,139 @@
+import os
+import time
+import sqlite3
+import threading
+
+from typing import Dict, Optional, List
+
+columns = [
+    ("run", "TEXT"),
+    ("config", "TEXT"),
+    ("dataset", "TEXT"),
+    ("branch", "TEXT"),
+    ("problem", "TEXT"),
+    ("mode", "TEXT"),
+    ("solver", "TEXT"),
+    ("status", "TEXT"),
+    ("obj_val", "REAL"),
+    ("obj_text", "TEXT"),
+    ("gt", "REAL"),
+    ("wall_time", "REAL"),
+    ("calls", "INTEGER"),
+    ("cached_calls", "INTEGER"),
+    ("error_message", "TEXT"),
+    ("created", "REAL"),
+]
+
+
+class ResultStore:
+    # One row per finished problem attempt. status is "success", "fail"
+    # (finished without a solution) or "error" (raised, crashed or timed
+    # out); non-numeric objective values ("infeasible", ...) go to obj_text.
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                + ", ".join(f"{name} {kind}" for name, kind in columns)
+                + ")"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_run ON results (dataset, mode, config)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS results_problem ON results (problem, created)")
+            self.conn.commit()
+
+    def add(self, record: Dict):
+        obj_val = record.get("obj_val")
+        numeric = isinstance(obj_val, (int, float)) and not isinstance(obj_val, bool)
+        calls = record.get("calls") or {}
+        row = dict(
+            run=record.get("run"),
+            config=record.get("config"),
+            dataset=record.get("dataset"),
+            branch=record.get("branch"),
+            problem=record["problem"],
+            mode=record.get("mode"),
+            solver=record.get("solver"),
+            status=record.get("status") or (
+                "success" if record.get("success") else "error" if record.get("error_message") else "fail"
+            ),
+            obj_val=obj_val if numeric else None,
+            obj_text=None if numeric or obj_val is None else str(obj_val),
+            gt=record.get("gt"),
+            wall_time=record.get("wall_time"),
+            calls=calls.get("calls"),
+            cached_calls=calls.get("cached"),
+            error_message=record.get("error_message"),
+            created=time.time()
+        )
+        with self.lock:
+            self.conn.execute(
+                f"INSERT INTO results VALUES ({', '.join('?' for _ in columns)})",
+                [row[name] for name, _ in columns]
+            )
+            self.conn.commit()
+
+    def __latest(self, dataset: Optional[str], mode: Optional[str], config: Optional[str]) -> (str, List):
+        # the latest result of every problem per mode and config
+        filters = ["rowid IN (SELECT MAX(rowid) FROM results GROUP BY problem, mode, config)"]
+        params = []
+        for name, value in [("dataset", dataset), ("mode", mode), ("config", config)]:
+            if value is not None:
+                filters.append(f"{name} = ?")
+                params.append(value)
+        return " AND ".join(filters), params
+
+    def summary(
+        self,
+        dataset: Optional[str] = None,
+        mode: Optional[str] = None,
+        config: Optional[str] = None,
+        tolerance: Optional[float] = 1.0
+    ) -> List[Dict]:
+        # a solution is accepted within `tolerance` of the ground truth
+        where, params = self.__latest(dataset, mode, config)
+        query = f"""
+            SELECT
+                dataset, mode, config, solver,
+                COUNT(*) AS total,
+                SUM(status = 'error') AS errors,
+                SUM(status = 'fail') AS failures,
+                SUM(status = 'success' AND ABS(obj_val - gt) < ?) AS accepted,
+                SUM(wall_time) AS wall_time,
+                SUM(calls) AS calls,
+                SUM(cached_calls) AS cached_calls
+            FROM results WHERE {where}
+            GROUP BY dataset, mode, config, solver
+            ORDER BY dataset, mode, config
+        """
+        with self.lock:
+            cursor = self.conn.execute(query, [tolerance] + params)
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def wrong_answers(
+        self,
+        dataset: Optional[str] = None,
+        mode: Optional[str] = None,
+        config: Optional[str] = None,
+        tolerance: Optional[float] = 1.0
+    ) -> List[Dict]:
+        where, params = self.__latest(dataset, mode, config)
+        query = f"""
+            SELECT problem, mode, config, obj_val, obj_text, gt FROM results
+            WHERE {where} AND status = 'success'
+            AND (obj_val IS NULL OR gt IS NULL OR ABS(obj_val - gt) >= ?)
+            ORDER BY problem
+        """
+        with self.lock:
+            cursor = self.conn.execute(query, params + [tolerance])
+            names = [d[0] for d in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
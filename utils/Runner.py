@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import resource
+import tempfile
+import traceback
+import shutil
+import argparse
+import functools
+import multiprocessing
+
+from typing import Dict, Optional, List, Callable
+from utils.ModelCall import set_concurrency, concurrency_limits, get_call_stats
+from utils.JsonOutput import get_parse_stats
+from utils.RateLimit import rate_limits
+from utils.Journal import RunJournal, RetryPolicy
+from utils import Trace
+
+
+def write_atomic(path: str, content: str):
+    # written to a temporary file next to the target and renamed over it, so
+    # readers never see a partially written file
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def dump_json_atomic(obj, path: str, indent: Optional[int] = 4):
+    write_atomic(path, json.dumps(obj, indent=indent))
+
+
+def rate_lock_var(provider: str) -> str:
+    # see RateLimit.get_limiter
+    return f"NLOPT_{provider.upper()}_RATE_LOCK"
+
+
+def _run_problem(
+    run_fn: Callable,
+    client_factory: Callable,
+    pool_factory: Optional[Callable],
+    prob_path: str,
+    semaphores: Dict,
+    rate_locks: Dict,
+    memory_limit: Optional[int],
+    log_path: Optional[str],
+    trace: Optional[Dict],
+    kwargs: Dict,
+    results
+):
+    if log_path is not None:
+        # keep the output of concurrent problems apart
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        log = open(log_path, "w")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    # exit through SystemExit on terminate, so held provider slots are released
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(1))
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    for provider, semaphore in semaphores.items():
+        set_concurrency(provider, semaphore=semaphore)
+    # set before the first model call creates the rate limiters
+    for provider, lock_path in rate_locks.items():
+        os.environ[rate_lock_var(provider)] = lock_path
+    if trace is not None:
+        Trace.set_tracer(Trace.Tracer(trace["path"], problem=prob_path, **trace["attrs"]))
+
+    start = time.time()
+    pool = None
+    try:
+        if pool_factory is not None:
+            # started after the memory limit is set, which the workers inherit
+            pool = pool_factory()
+            kwargs = dict(kwargs, pool=pool)
+        with Trace.span("problem"):
+            res = run_fn(client_factory(), prob_path, **kwargs)
+        succ, obj_val = res if isinstance(res, tuple) else (res, None)
+        error_message = None
+    except BaseException:
+        succ, obj_val = False, None
+        error_message = traceback.format_exc()
+        print(error_message)
+    finally:
+        if pool is not None:
+            pool.close()
+    sys.stdout.flush()
+    results.put(dict(
+        problem=prob_path,
+        success=bool(succ),
+        obj_val=obj_val if isinstance(obj_val, (int, float, str, type(None))) else repr(obj_val),
+        error_message=error_message,
+        wall_time=time.time() - start,
+        calls=get_call_stats(),
+        parse=get_parse_stats()
+    ))
+
+
+class DatasetRunner:
+    # Runs run_fn(client, prob_path) for every problem, each in its own
+    # process with at most `processes` running at once. Model calls of all
+    # processes share one concurrency cap and one rate limit per provider,
+    # and a problem that raises, crashes or times out only fails that
+    # problem. The rate limits live in a file of the run, unless
+    # NLOPT_<PROVIDER>_RATE_LOCK already points several runs at one file.
+    # run_fn and client_factory are pickled by reference, so they have to be
+    # module-level functions; client_factory is called once per problem.
+    # With pool_factory, the generated code of a problem runs in the sandbox
+    # pool it returns, started in the problem process and passed as pool=.
+    # With a journal, problems it marks as done are skipped, and run_fn is
+    # called with resume=True when one of stage_files was saved by an
+    # earlier attempt. Logs and stage files live in output_dir(prob_path),
+    # which defaults to the problem path itself.
+    # With trace_path, the stage spans of every problem are appended to that
+    # JSONL file, tagged with the problem and trace_attrs.
+    def __init__(
+        self,
+        run_fn: Callable,
+        client_factory: Callable,
+        processes: Optional[int] = 4,
+        provider_limits: Optional[Dict[str, int]] = None,
+        timeout: Optional[float] = None,
+        memory_limit: Optional[int] = None,
+        log_name: Optional[str] = "run.log",
+        journal: Optional[RunJournal] = None,
+        stage_files: Optional[List[str]] = None,
+        output_dir: Optional[Callable] = None,
+        trace_path: Optional[str] = None,
+        trace_attrs: Optional[Dict] = None,
+        pool_factory: Optional[Callable] = None
+    ):
+        self.run_fn = run_fn
+        self.client_factory = client_factory
+        self.processes = processes
+        self.provider_limits = dict(concurrency_limits, **(provider_limits or {}))
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.log_name = log_name
+        self.journal = journal
+        self.stage_files = stage_files or []
+        self.output_dir = output_dir or (lambda prob_path: prob_path)
+        self.trace = None if trace_path is None else dict(path=trace_path, attrs=trace_attrs or {})
+        self.pool_factory = pool_factory
+        self.ctx = multiprocessing.get_context("spawn")
+
+    def run(self, problems: List[str], callback: Optional[Callable] = None) -> List[Dict]:
+        semaphores = {
+            provider: self.ctx.BoundedSemaphore(limit)
+            for provider, limit in self.provider_limits.items() if limit
+        }
+        lock_dir = tempfile.mkdtemp(prefix="nlopt_rate_")
+        rate_locks = {
+            provider: os.environ.get(rate_lock_var(provider)) or os.path.join(lock_dir, f"{provider}.json")
+            for provider in rate_limits
+        }
+        try:
+            return self.__run(problems, callback, semaphores, rate_locks)
+        finally:
+            shutil.rmtree(lock_dir, ignore_errors=True)
+
+    def __run(self, problems: List[str], callback: Optional[Callable], semaphores: Dict, rate_locks: Dict) -> List[Dict]:
+        results = self.ctx.Queue()
+        pending = list(reversed(problems))
+        running = {}
+        records = {}
+
+        if self.journal is not None:
+            skipped = [prob_path for prob_path in problems if not self.journal.should_run(prob_path)]
+            for prob_path in skipped:
+                record = self.journal.last_record(prob_path) or dict(
+                    error_message="RuntimeError: attempts exhausted", wall_time=0.0
+                )
+                records[prob_path] = dict(
+                    problem=prob_path,
+                    success=record.get("success", False),
+                    obj_val=record.get("obj_val"),
+                    error_message=record.get("error_message"),
+                    wall_time=record.get("wall_time", 0.0)
+                )
+            pending = [prob_path for prob_path in pending if prob_path not in records]
+            print(f"Skipping {len(skipped)} problems finished according to the journal")
+
+        def finish(record: Dict):
+            if record["problem"] in records:
+                # the late result of a problem that already timed out
+                return
+            if record["problem"] in running:
+                running.pop(record["problem"])[0].join()
+            records[record["problem"]] = record
+            if self.journal is not None:
+                self.journal.finished(record)
+            print(f"[{len(records)}/{len(problems)}] {record['problem']}: "
+                  f"{'success' if record['success'] else 'fail'} ({record['wall_time']:.1f}s)")
+            if callback is not None:
+                callback(record)
+
+        while pending or running:
+            while pending and len(running) < self.processes:
+                prob_path = pending.pop()
+                out = self.output_dir(prob_path)
+                kwargs = {}
+                if self.journal is not None:
+                    stage_paths = [os.path.join(out, name) for name in self.stage_files]
+                    if stage_paths and self.journal.resumable(prob_path, stage_paths):
+                        kwargs["resume"] = True
+                    self.journal.started(prob_path)
+                log_path = None if self.log_name is None else os.path.join(out, self.log_name)
+                process = self.ctx.Process(
+                    target=_run_problem,
+                    args=(self.run_fn, self.client_factory, self.pool_factory, prob_path, semaphores,
+                          rate_locks, self.memory_limit, log_path, self.trace, kwargs, results),
+                    daemon=False
+                )
+                process.start()
+                running[prob_path] = (process, time.time())
+
+            try:
+                finish(results.get(timeout=0.5))
+            except queue.Empty:
+                pass
+
+            for prob_path, (process, start) in list(running.items()):
+                if prob_path not in running:
+                    continue
+                timed_out = self.timeout is not None and time.time() - start > self.timeout
+                if process.is_alive() and not timed_out:
+                    continue
+                if not timed_out:
+                    # drain a result sent right before the process exited
+                    try:
+                        while True:
+                            finish(results.get(timeout=0.1))
+                    except queue.Empty:
+                        pass
+                    if prob_path not in running:
+                        continue
+                else:
+                    process.terminate()
+                    process.join(timeout=10)
+                    if process.is_alive():
+                        process.kill()
+                process.join()
+                running.pop(prob_path)
+                finish(dict(
+                    problem=prob_path,
+                    success=False,
+                    obj_val=None,
+                    error_message=f"TimeoutError: problem exceeded {self.timeout} seconds" if timed_out
+                    else f"RuntimeError: problem process exited with code {process.exitcode}",
+                    wall_time=time.time() - start
+                ))
+
+        return [records[prob_path] for prob_path in problems]
+
+
+def add_runner_arguments(parser, budget: Optional[bool] = True):
+    # command line options shared by the dataset runners and benchmark.py
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=None)
+    parser.add_argument("--exec-timeout", type=float, default=300, help="seconds per run of the generated code")
+    parser.add_argument("--exec-memory", type=float, default=8, help="GB per run of the generated code")
+    parser.add_argument("--journal", default="runs/journal.jsonl")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--retry-failures", action="store_true")
+    if budget:
+        parser.add_argument("--max-calls", type=int, default=None, help="model calls per problem")
+        parser.add_argument("--max-tokens", type=int, default=None, help="tokens per problem")
+        parser.add_argument("--deadline", type=float, default=None, help="seconds per problem")
+
+
+def get_budget_limits(args) -> Dict:
+    return {
+        name: getattr(args, name) for name in ["max_calls", "max_tokens", "deadline"]
+        if getattr(args, name, None) is not None
+    }
+
+
+def make_runner(args, run_fn: Callable, client_factory: Callable, config: Dict, **kwargs) -> DatasetRunner:
+    # DatasetRunner with the journal and sandbox pool of the parsed options
+    # of add_runner_arguments; kwargs go to DatasetRunner
+    from backend.Sandbox import SandboxPool
+
+    journal = RunJournal(
+        args.journal,
+        config=config,
+        policy=RetryPolicy(max_attempts=args.max_attempts, retry_failures=args.retry_failures)
+    )
+    return DatasetRunner(
+        run_fn,
+        client_factory,
+        processes=args.processes,
+        timeout=args.timeout,
+        journal=journal,
+        pool_factory=functools.partial(
+            SandboxPool, size=1, timeout=args.exec_timeout, memory_limit=int(args.exec_memory * 1024 ** 3)
+        ),
+        **kwargs
+    )
+
+
+def run_main(
+    run_fn: Callable,
+    client_factory: Callable,
+    list_problems: Callable,
+    config: Dict,
+    budget: Optional[bool] = True,
+    **kwargs
+) -> List[Dict]:
+    # __main__ of a dataset runner: runs run_fn on the problems of
+    # list_problems() with the command line options of add_runner_arguments,
+    # passing the budget limits to run_fn when budget is set
+    parser = argparse.ArgumentParser()
+    add_runner_arguments(parser, budget=budget)
+    args = parser.parse_args()
+    if budget:
+        budget_limits = get_budget_limits(args)
+        run_fn = functools.partial(run_fn, budget_limits=budget_limits)
+        config = dict(config, **budget_limits)
+    runner = make_runner(args, run_fn, client_factory, config, **kwargs)
+    return runner.run(list_problems())
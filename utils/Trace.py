@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import threading
+import functools
+import contextvars
+
+from contextlib import contextmanager
+from typing import Dict, Optional, List, Callable
+
+# counters every span keeps; model_call adds the size, token usage and
+# retries of the calls made inside the span, and JsonOutput how their
+# responses parsed
+counters = [
+    "calls", "cached_calls", "retries", "prompt_chars", "response_chars",
+    "prompt_tokens", "completion_tokens", "model_time", "json_parsed", "json_repaired", "json_failed"
+]
+
+__tracer = None
+__current = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.start = time.time()
+        self.wall_time = None
+        self.error = None
+        self.counts = {name: 0 for name in counters}
+        # model calls of a stage may run on several threads
+        self.lock = threading.Lock()
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self) -> Dict:
+        return dict(
+            id=self.id,
+            parent=self.parent.id if self.parent is not None else None,
+            name=self.name,
+            start=self.start,
+            wall_time=self.wall_time,
+            error=self.error,
+            attrs=self.attrs,
+            **self.counts
+        )
+
+
+class Tracer:
+    # Writes every finished span as a line of a JSONL file, which the problem
+    # processes of a dataset run share; `attrs` (e.g. run and problem) are
+    # added to every line so one file can hold many runs.
+    def __init__(self, path: Optional[str] = None, **attrs):
+        self.path = path
+        self.attrs = attrs
+        self.spans = []
+        self.lock = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, span: Span):
+        record = dict(span.to_dict(), **self.attrs)
+        with self.lock:
+            self.spans.append(record)
+            if self.path is None:
+                return
+            line = json.dumps(record, default=str) + "\n"
+            with open(self.path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(line)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global __tracer
+    __tracer = tracer
+
+def get_tracer() -> Optional[Tracer]:
+    return __tracer
+
+def current_span() -> Optional[Span]:
+    return __current.get()
+
+@contextmanager
+def span(name: str, **attrs):
+    # Spans nest through a context variable, which asyncio.to_thread copies
+    # into the worker threads of parallel_map, so concurrent stages end up
+    # under the span they were started from.
+    s = Span(name, parent=__current.get(), **attrs)
+    token = __current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        __current.reset(token)
+        s.wall_time = time.time() - s.start
+        tracer = __tracer
+        if tracer is not None:
+            tracer.export(s)
+
+def traced(name: str) -> Callable:
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record(**counts):
+    # adds to the counters of the innermost span, if any
+    s = __current.get()
+    if s is not None:
+        s.add(**counts)
+
+def add_span(name: str, wall_time: float, **attrs):
+    # a finished child of the current span timed elsewhere (e.g. in a
+    # sandbox worker)
+    s = Span(name, parent=__current.get(), **attrs)
+    s.start = time.time() - wall_time
+    s.wall_time = wall_time
+    tracer = __tracer
+    if tracer is not None:
+        tracer.export(s)
+    return s
+
+
+def load(path: str, **filters) -> List[Dict]:
+    spans = []
+    if not os.path.exists(path):
+        return spans
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by a killed process
+                continue
+            if all(record.get(key) == value for key, value in filters.items() if value is not None):
+                spans.append(record)
+    return spans
+
+def aggregate(spans: List[Dict]) -> List[Dict]:
+    # Per-stage totals; wall times include the nested stages, while the
+    # counters only cover the calls made directly in the stage.
+    rows = {}
+    for record in spans:
+        row = rows.setdefault(record["name"], dict(
+            name=record["name"], count=0, errors=0, wall_time=0.0, max_wall_time=0.0,
+            **{name: 0 for name in counters}
+        ))
+        row["count"] += 1
+        row["errors"] += record.get("error") is not None
+        row["wall_time"] += record["wall_time"] or 0.0
+        row["max_wall_time"] = max(row["max_wall_time"], record["wall_time"] or 0.0)
+        for name in counters:
+            row[name] += record.get(name) or 0
+    for row in rows.values():
+        row["mean_wall_time"] = row["wall_time"] / row["count"]
+    return sorted(rows.values(), key=lambda row: -row["wall_time"])
+
+def print_report(rows: List[Dict]):
+    print(f"{'stage':<28}{'count':>7}{'errors':>7}{'wall(s)':>10}{'mean(s)':>9}{'max(s)':>9}"
+          f"{'model(s)':>10}{'calls':>7}{'cached':>7}{'retries':>8}{'prompt':>10}{'response':>10}"
+          f"{'in_tok':>9}{'out_tok':>9}{'repaired':>10}{'bad_json':>10}")
+    for row in rows:
+        print(f"{row['name']:<28}{row['count']:>7}{row['errors']:>7}{row['wall_time']:>10.1f}"
+              f"{row['mean_wall_time']:>9.2f}{row['max_wall_time']:>9.2f}{row['model_time']:>10.1f}"
+              f"{row['calls']:>7}{row['cached_calls']:>7}{row['retries']:>8}{row['prompt_chars']:>10}"
+              f"{row['response_chars']:>10}{row['prompt_tokens']:>9}{row['completion_tokens']:>9}"
+              f"{row['json_repaired']:>10}{row['json_failed']:>10}")